@@ -0,0 +1,31 @@
+"""Hatch build hook: compile the YAML data files into `kalamine/data/data.pickle`,
+and the JSON corpora into binary `kalamine/www/corpus/*.kcorpus` files."""
+
+import importlib.util
+from pathlib import Path
+from typing import Any, Dict
+
+from hatchling.builders.hooks.plugin.interface import BuildHookInterface
+
+
+class DataCacheHook(BuildHookInterface):
+    PLUGIN_NAME = "custom"
+
+    def initialize(self, version: str, build_data: Dict[str, Any]) -> None:
+        package = Path(self.root) / "kalamine"
+        data_cache = load_module(package / "data_cache.py")
+        corpus_builder = load_module(package / "corpus_builder.py")
+
+        paths = [data_cache.write_cache(package / "data")]
+        paths += corpus_builder.write_binary_corpora(package / "www" / "corpus")
+        for path in paths:
+            build_data["artifacts"].append(path.relative_to(self.root).as_posix())
+
+
+def load_module(path: Path) -> Any:
+    """Load a kalamine module directly: the package dependencies may be missing."""
+    spec = importlib.util.spec_from_file_location(f"kalamine_{path.stem}", path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
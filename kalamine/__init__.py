@@ -1,6 +1,20 @@
 #!/usr/bin/env python3
+from typing import TYPE_CHECKING, Any
+
 from .layout import KeyboardLayout
-from .xkb_manager import XKBManager
+
+if TYPE_CHECKING:
+    from .xkb_manager import XKBManager
+
+    XKBManager
 
 KeyboardLayout
-XKBManager
+
+
+def __getattr__(name: str) -> Any:
+    # the XKB manager is only needed by `xkalamine`: import it on demand
+    if name == "XKBManager":
+        from .xkb_manager import XKBManager
+
+        return XKBManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
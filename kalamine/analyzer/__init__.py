@@ -0,0 +1,25 @@
+"""
+Layout analyzer: finger load, same-finger bigrams, rolls, redirects...
+for a keyboard layout and a text corpus, as in the web analyzer.
+
+Requires NumPy (`pip install kalamine[analyzer]`).
+"""
+
+from .corpus import Corpus, corpus_names, load_corpus
+from .engine import Analysis, analyze, analyze_all, supported_chars
+from .keyboard import NGRAM_CATEGORIES, KeyboardModel, keyboard_model
+from .optimizer import Optimizer
+
+__all__ = [
+    "NGRAM_CATEGORIES",
+    "Analysis",
+    "Corpus",
+    "KeyboardModel",
+    "Optimizer",
+    "analyze",
+    "analyze_all",
+    "corpus_names",
+    "keyboard_model",
+    "load_corpus",
+    "supported_chars",
+]
@@ -0,0 +1,158 @@
+"""
+Corpora: symbol, bigram and trigram frequencies (in %) of a reference text,
+in the `www/corpus/*.json` format or in the binary `*.kcorpus` format.
+
+N-grams are stored as arrays of indices in an alphabet of interned symbols;
+binary corpora are memory-mapped, and their arrays are used without copy.
+"""
+
+import json
+import mmap
+import pkgutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Union
+
+import numpy as np
+
+from ..corpus_builder import (
+    BINARY_FORMAT,
+    BINARY_HEADER,
+    BINARY_MAGIC,
+    BINARY_SUFFIX,
+    TABLES,
+    is_up_to_date,
+)
+
+CORPUS_DIR = Path(__file__).parent.parent / "www" / "corpus"
+
+
+class Ngrams(NamedTuple):
+    indices: np.ndarray  # (count, n) indices in the corpus alphabet
+    frequencies: np.ndarray  # (count,) frequencies, in %
+
+
+@dataclass
+class Corpus:
+    name: str
+    alphabet: List[str]
+    symbols: Ngrams
+    bigrams: Ngrams
+    trigrams: Ngrams
+    source: str = ""  # the text this corpus comes from
+
+    @classmethod
+    def from_dict(cls, name: str, src: Dict) -> "Corpus":
+        alphabet: Dict[str, int] = {}
+        tables = []
+        for n, table_name in enumerate(TABLES, 1):
+            table = src[table_name]
+            indices = [alphabet.setdefault(c, len(alphabet)) for c in "".join(table)]
+            if len(indices) != n * len(table):
+                raise ValueError(f"invalid {table_name} in corpus `{name}`")
+            tables.append(
+                Ngrams(
+                    np.array(indices, dtype=np.uint32).reshape(len(table), n),
+                    np.array(list(table.values()), dtype=float),
+                )
+            )
+        symbols, bigrams, trigrams = tables
+        source = src.get("corpus", "")
+        return cls(name, list(alphabet), symbols, bigrams, trigrams, source)
+
+    @classmethod
+    def from_buffer(cls, name: str, buffer: Union[bytes, mmap.mmap]) -> "Corpus":
+        """Read a binary corpus (see `corpus_builder.write_binary_corpus`)."""
+
+        header = BINARY_HEADER.unpack_from(buffer)
+        magic, version, source_size, alphabet_size, *counts, _ = header
+        if magic != BINARY_MAGIC or version != BINARY_FORMAT:
+            raise ValueError(f"unsupported format for corpus `{name}`")
+
+        offset = BINARY_HEADER.size
+        source = bytes(buffer[offset : offset + source_size]).rstrip(b"\0")
+        offset += source_size
+
+        def section(dtype: str, count: int) -> np.ndarray:
+            nonlocal offset
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        code_points = section("<u4", alphabet_size)
+        indices = [
+            section("<u4", count * n).reshape(count, n)
+            for n, count in enumerate(counts, 1)
+        ]
+        frequencies = [section("<f4", count) for count in counts]
+        symbols, bigrams, trigrams = map(Ngrams, indices, frequencies)
+        return cls(
+            name,
+            [chr(code_point) for code_point in code_points.tolist()],
+            symbols,
+            bigrams,
+            trigrams,
+            source.decode("utf-8"),
+        )
+
+    def table(self, ngrams: Ngrams) -> Dict[str, float]:
+        """Dict view of a table of n-grams: {n-gram: frequency}."""
+        alphabet = self.alphabet
+        return {
+            "".join(alphabet[i] for i in ngram): frequency
+            for ngram, frequency in zip(
+                ngrams.indices.tolist(), ngrams.frequencies.tolist()
+            )
+        }
+
+    def to_dict(self) -> Dict:
+        """Corpus data, in the `www/corpus/*.json` format."""
+        return {
+            "corpus": self.source,
+            "symbols": self.table(self.symbols),
+            "bigrams": self.table(self.bigrams),
+            "trigrams": self.table(self.trigrams),
+        }
+
+
+def corpus_names() -> List[str]:
+    """Names of the corpora shipped with kalamine."""
+    return sorted(path.stem for path in CORPUS_DIR.glob("*.json"))
+
+
+def map_file(path: Path) -> mmap.mmap:
+    with path.open("rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def map_corpus(path: Path) -> Corpus:
+    """Memory-map a binary corpus file."""
+    return Corpus.from_buffer(path.stem, map_file(path))
+
+
+def load_corpus(corpus: Union[str, Path]) -> Corpus:
+    """Load a corpus file, or a corpus shipped with kalamine by its name.
+    Shipped corpora are read from their binary version, if it exists and has
+    been converted from the current JSON file."""
+
+    path = Path(corpus)
+    if path.suffix == BINARY_SUFFIX and path.exists():
+        return map_corpus(path)
+    if path.suffix == ".json" and path.exists():
+        content = path.read_text(encoding="utf-8")
+        return Corpus.from_dict(path.stem, json.loads(content))
+
+    data = None
+    if str(corpus) in corpus_names():
+        data = pkgutil.get_data("kalamine", f"www/corpus/{corpus}.json")
+        binary_path = CORPUS_DIR / f"{corpus}{BINARY_SUFFIX}"
+        if data is not None and binary_path.exists():
+            buffer = map_file(binary_path)
+            if is_up_to_date(buffer, data):
+                return Corpus.from_buffer(str(corpus), buffer)
+            buffer.close()  # outdated build artifact: use the JSON file
+    if data is None:
+        raise ValueError(
+            f"unknown corpus `{corpus}`; available corpora: {', '.join(corpus_names())}"
+        )
+    return Corpus.from_dict(str(corpus), json.loads(data))
@@ -0,0 +1,373 @@
+"""
+Layout analysis engine, mirroring `www/mjs/layout-analyzer.js`.
+
+The corpus n-grams are first converted into key sequences (key indices, see
+`keyboard.py`); they are then classified with the precomputed category
+tables and aggregated with NumPy, instead of one dictionary lookup per
+n-gram and per key.
+"""
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..key_sequences import KeySequence, KeyStroke, js_len, supported_chars
+from .corpus import Corpus, Ngrams
+from .keyboard import (
+    FINGERS,
+    KEY_INDEX,
+    NGRAM_CATEGORIES,
+    NO_CATEGORY,
+    QUALITIES,
+    KeyboardModel,
+    keyboard_model,
+)
+
+if TYPE_CHECKING:
+    from ..layout import KeyboardLayout
+
+SUBSTITUTE_CHARS = {
+    "\u00a0": " ",  # no-break space
+    "\u202f": " ",  # narrow no-break space
+    "\u00ab": '"',  # («) left-pointing double angle quotation mark
+    "\u00bb": '"',  # (») right-pointing double angle quotation mark
+    "\u201c": '"',  # (“) left double quotation mark
+    "\u201d": '"',  # (”) right double quotation mark
+    "\u201e": '"',  # („) double low-9 quotation mark
+    "\u2018": "'",  # (‘) left single quotation mark
+    "\u2019": "'",  # (’) right single quotation mark
+    "\u2013": "-",  # (–) en dash
+    "\u2014": "-",  # (—) em dash
+    "\u2026": "...",  # (…) ellipsis
+}
+
+
+###
+# N-grams
+#
+
+
+@dataclass
+class NgramTable:
+    """Distinct n-grams typed on a layout: names, keys and frequencies (%)."""
+
+    names: List[str]
+    keys: np.ndarray  # key indices, shape (count, n)
+    frequencies: np.ndarray
+
+
+def symbol_keys(
+    alphabet: List[str], char_keys: Dict[str, KeySequence]
+) -> List[Optional[KeySequence]]:
+    """Key sequence of each symbol of a corpus alphabet, if it can be typed."""
+    return [
+        char_keys.get(char) or char_keys.get(SUBSTITUTE_CHARS.get(char, ""))
+        for char in alphabet
+    ]
+
+
+def ngram_table(
+    ngrams: Ngrams,
+    alphabet: List[str],
+    alphabet_keys: List[Optional[KeySequence]],
+    keymap: Dict[str, List[str]],
+    deadkeys: Dict[str, Dict[str, str]],
+) -> NgramTable:
+    """Split the corpus n-grams into windows of n keys.
+
+    Each window is named after the characters it produces; the frequencies of
+    identical names are merged, and their keys are those of the first window.
+
+    Most n-grams consist of symbols that are typed with a single key each:
+    these are processed as arrays. The others (dead keys, unsupported chars)
+    are split into windows one by one.
+    """
+
+    count, length = ngrams.indices.shape
+
+    # symbols typed with a single key: key index, and output char id
+    direct_keys = np.full(len(alphabet), -1, dtype=np.intp)
+    output_ids = np.full(len(alphabet), -1, dtype=np.intp)
+    outputs: Dict[str, int] = {}
+    for i, keys in enumerate(alphabet_keys):
+        if keys and len(keys) == 1:
+            key_code, level = keys[0]
+            output = keymap[key_code][level]
+            if js_len(output) == 1:
+                direct_keys[i] = KEY_INDEX[key_code]
+                output_ids[i] = outputs.setdefault(output, len(outputs))
+
+    # single-key symbols only: one window per n-gram
+    direct = (direct_keys[ngrams.indices] >= 0).all(axis=1)
+    indices = ngrams.indices[direct]
+    outputs_rows = output_ids[indices].reshape(-1, length)
+    powers = len(outputs) ** np.arange(length, dtype=np.int64)
+    _, first, inverse = np.unique(
+        outputs_rows @ powers, return_index=True, return_inverse=True
+    )
+    output_chars = list(outputs)
+    names = {
+        "".join(output_chars[i] for i in row): n
+        for n, row in enumerate(outputs_rows[first].tolist())
+    }
+    window_keys: List[Tuple[int, ...]] = list(
+        map(tuple, direct_keys[indices[first]].reshape(-1, length).tolist())
+    )
+    name_ids = [inverse.reshape(-1)]
+    window_frequencies = [ngrams.frequencies[direct].astype(float)]
+    total = float(window_frequencies[0].sum())
+
+    # other n-grams, as in the web analyzer
+    other_ids: List[int] = []
+    other_frequencies: List[float] = []
+    for row, frequency in zip(
+        ngrams.indices[~direct].tolist(), ngrams.frequencies[~direct].tolist()
+    ):
+        key_sequence: List[KeyStroke] = []
+        supported = True
+        for i in row:
+            keys = alphabet_keys[i]
+            if keys:
+                key_sequence.extend(keys)
+            else:  # unsupported chars still count as one key in the total
+                key_sequence.append(("", 0))
+                supported = False
+
+        window_count = len(key_sequence) - length + 1
+        if window_count <= 0:
+            continue
+        total += frequency * window_count
+        if not supported:
+            continue
+
+        next_pending: Optional[str] = None
+        for i in range(window_count):
+            window = key_sequence[i : i + length]
+
+            # characters produced by this window, resolving dead keys
+            pending = next_pending
+            name = ""
+            for key_code, level in window:
+                char: Optional[str] = keymap[key_code][level]
+                if pending and char is not None:
+                    char = deadkeys.get(pending, {}).get(char)
+                if char is not None and js_len(char) == 1:
+                    pending = None
+                    name += char
+                else:
+                    pending = char
+            if pending:
+                name += pending
+            name = name.replace("**", "★")  # pretty-print the 1dk
+
+            first_key_code, first_level = window[0]
+            first_char = keymap[first_key_code][first_level]
+            next_pending = None if js_len(first_char) == 1 else first_char
+
+            if name not in names:
+                names[name] = len(names)
+                window_keys.append(tuple(KEY_INDEX[k] for k, _ in window))
+            other_ids.append(names[name])
+            other_frequencies.append(frequency)
+
+    name_ids.append(np.array(other_ids, dtype=np.intp))
+    window_frequencies.append(np.array(other_frequencies, dtype=float))
+    frequencies: np.ndarray = np.bincount(
+        np.concatenate(name_ids),
+        weights=np.concatenate(window_frequencies),
+        minlength=len(names),
+    )
+    if total:
+        frequencies = frequencies * 100 / total
+    return NgramTable(
+        names=list(names),
+        keys=np.array(window_keys, dtype=np.intp).reshape(len(names), length),
+        frequencies=frequencies,
+    )
+
+
+###
+# Analysis
+#
+
+
+def empty_groups() -> List[List[Dict[str, float]]]:
+    return [[{quality: 0.0 for quality in QUALITIES} for _ in range(4)] for _ in "lr"]
+
+
+def finger_groups(values: np.ndarray) -> List[List[Dict[str, float]]]:
+    """(8 fingers × 3 qualities) array -> [hand][finger]{quality} values."""
+    groups = empty_groups()
+    for slot, finger_values in enumerate(values.reshape(len(FINGERS), -1)):
+        for quality, value in zip(QUALITIES, finger_values):
+            groups[slot // 4][slot % 4][quality] = float(value)
+    return groups
+
+
+@dataclass
+class Analysis:
+    """Ergonomics metrics of a layout for a given corpus; all values in %."""
+
+    # finger load, [hand][pinky..index or index..pinky]{good, meh, bad}
+    load_groups: List[List[Dict[str, float]]] = field(default_factory=empty_groups)
+    unsupported_chars: Dict[str, float] = field(default_factory=dict)
+    total_unsupported_chars: float = 0
+    imprecise_data: bool = False
+    # n-gram frequencies by category: sfb, skb, lsb, scissor...
+    ngrams: Dict[str, Dict[str, float]] = field(
+        default_factory=lambda: {category: {} for category in NGRAM_CATEGORIES}
+    )
+    # same finger (bad) and same key (meh) usage, by finger
+    total_sfu_sku_per_finger: List[List[Dict[str, float]]] = field(
+        default_factory=empty_groups
+    )
+
+    def totals(self) -> Dict[str, float]:
+        """Total frequency of each n-gram category."""
+        return {
+            category: sum(ngrams.values()) for category, ngrams in self.ngrams.items()
+        }
+
+
+def classify(analysis: Analysis, table: NgramTable, types: np.ndarray) -> np.ndarray:
+    """Sort the n-grams of a table into the analysis categories."""
+
+    categories = types[tuple(table.keys.T)] if len(table.names) else types[()][:0]
+    for name, category, frequency in zip(
+        table.names, categories.tolist(), table.frequencies.tolist()
+    ):
+        if category != NO_CATEGORY:
+            analysis.ngrams[NGRAM_CATEGORIES[category]][name] = frequency
+    return categories
+
+
+@dataclass
+class KeyUsage:
+    """A corpus typed on a layout: key load, and key windows of the n-grams."""
+
+    load: np.ndarray  # % of the keystrokes, by key index
+    unsupported_chars: Dict[str, float]
+    bigrams: NgramTable
+    trigrams: NgramTable
+
+
+def key_usage(
+    keymap: Dict[str, List[str]],
+    deadkeys: Dict[str, Dict[str, str]],
+    corpus: Corpus,
+    char_keys: Dict[str, KeySequence],
+) -> KeyUsage:
+    """Type a corpus on a web keymap (see `generators.web.raw_json`)."""
+
+    # heatmap: key usage and unsupported characters
+    alphabet = corpus.alphabet
+    alphabet_keys = symbol_keys(alphabet, char_keys)
+    unsupported_chars: Dict[str, float] = {}
+    key_indices: List[int] = []
+    key_frequencies: List[float] = []
+    extra_keys_frequency = 0.0
+    for (i,), frequency in zip(
+        corpus.symbols.indices.tolist(), corpus.symbols.frequencies.tolist()
+    ):
+        keys = alphabet_keys[i]
+        if not keys:
+            unsupported_chars[alphabet[i]] = frequency
+            continue
+        for key_code, _ in keys:
+            key_indices.append(KEY_INDEX[key_code])
+            key_frequencies.append(frequency)
+        extra_keys_frequency += frequency * (len(keys) - 1)
+
+    key_count = np.bincount(
+        np.array(key_indices, dtype=np.intp),
+        weights=np.array(key_frequencies, dtype=float),
+        minlength=len(KEY_INDEX),
+    )
+
+    # bigrams and trigrams
+    tables = [corpus.bigrams, corpus.trigrams]
+    bigrams, trigrams = [
+        ngram_table(ngrams, alphabet, alphabet_keys, keymap, deadkeys)
+        for ngrams in tables
+    ]
+    load = key_count * 100 / (100 + extra_keys_frequency)
+    return KeyUsage(load, unsupported_chars, bigrams, trigrams)
+
+
+def analyze_keymap(
+    keymap: Dict[str, List[str]],
+    deadkeys: Dict[str, Dict[str, str]],
+    corpus: Corpus,
+    model: KeyboardModel,
+    char_keys: Optional[Dict[str, KeySequence]] = None,
+) -> Analysis:
+    """Analyze a web keymap (see `generators.web.raw_json`)."""
+
+    if char_keys is None:
+        char_keys = supported_chars(keymap, deadkeys)
+    analysis = Analysis()
+    if not char_keys:
+        return analysis
+
+    usage = key_usage(keymap, deadkeys, corpus, char_keys)
+    analysis.unsupported_chars = usage.unsupported_chars
+    analysis.total_unsupported_chars = sum(usage.unsupported_chars.values())
+    analysis.imprecise_data = analysis.total_unsupported_chars >= 0.5
+
+    typed = model.slot >= 0
+    slots = model.slot[typed].astype(np.intp) * len(QUALITIES) + model.quality[typed]
+    analysis.load_groups = finger_groups(
+        np.bincount(slots, weights=usage.load[typed], minlength=len(FINGERS) * 3)
+    )
+
+    bigrams = usage.bigrams
+    bigram_types = classify(analysis, bigrams, model.bigram_types)
+    classify(analysis, usage.trigrams, model.trigram_types)
+
+    # same finger / same key usage, on the finger of the first key
+    sfu_sku = np.zeros((len(FINGERS), len(QUALITIES)))
+    for category, quality in [("sfb", "bad"), ("skb", "meh")]:
+        selected = bigram_types == NGRAM_CATEGORIES.index(category)
+        first_keys = bigrams.keys[selected, 0] if len(bigrams.names) else []
+        sfu_sku[:, QUALITIES.index(quality)] = np.bincount(
+            model.slot[first_keys].astype(np.intp),
+            weights=bigrams.frequencies[selected],
+            minlength=len(FINGERS),
+        )
+    analysis.total_sfu_sku_per_finger = finger_groups(sfu_sku)
+
+    return analysis
+
+
+def analyze(
+    layout: "KeyboardLayout", corpus: Corpus, iso: Optional[bool] = None
+) -> Analysis:
+    """Analyze a keyboard layout for a given corpus.
+
+    The digit row fingering depends on the keyboard shape: ISO keyboards have
+    their digit row shifted by one key. By default, the layout geometry is used.
+    """
+    from ..generators.web import raw_json
+
+    if iso is None:
+        iso = layout.geometry == "ISO"
+    data = raw_json(layout)
+    return analyze_keymap(data["keymap"], data["deadkeys"], corpus, keyboard_model(iso))
+
+
+def analyze_all(
+    layout: "KeyboardLayout", corpora: Iterable[Corpus], iso: Optional[bool] = None
+) -> List[Analysis]:
+    """Analyze a keyboard layout for several corpora."""
+    from ..generators.web import raw_json
+
+    if iso is None:
+        iso = layout.geometry == "ISO"
+    data = raw_json(layout)
+    keymap, deadkeys = data["keymap"], data["deadkeys"]
+    char_keys = supported_chars(keymap, deadkeys)
+    model = keyboard_model(iso)
+    return [
+        analyze_keymap(keymap, deadkeys, corpus, model, char_keys) for corpus in corpora
+    ]
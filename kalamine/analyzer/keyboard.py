@@ -0,0 +1,253 @@
+"""
+Physical keyboard model of the analyzer: fingers, rows and key qualities,
+as defined by the <x-keyboard> web component.
+
+Keys are identified by their web key code (`KeyA`, `Digit1`...) and by their
+index in KEY_CODES; n-gram categories are precomputed for all key pairs and
+triplets, so that n-grams can be classified with array lookups.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from ..key_sequences import is_1dfh
+
+# fmt: off
+# key codes of the <x-keyboard> SVG, in document order, and their finger
+# ('m1': thumb on the space bar; 'l1'/'r1': thumbs on the other keys)
+KEY_FINGERS: List[Tuple[str, str]] = [
+    ("Escape",        "l5"), ("Backquote",   "l5"), ("Digit1",        "l5"),
+    ("Digit2",        "l4"), ("Digit3",      "l3"), ("Digit4",        "l2"),
+    ("Digit5",        "l2"), ("Digit6",      "r2"), ("Digit7",        "r2"),
+    ("Digit8",        "r3"), ("Digit9",      "r4"), ("Digit0",        "r5"),
+    ("Minus",         "r5"), ("Equal",       "r5"), ("IntlYen",       "r5"),
+    ("Backspace",     "r5"), ("Tab",         "l5"), ("KeyQ",          "l5"),
+    ("KeyW",          "l4"), ("KeyE",        "l3"), ("KeyR",          "l2"),
+    ("KeyT",          "l2"), ("KeyY",        "r2"), ("KeyU",          "r2"),
+    ("KeyI",          "r3"), ("KeyO",        "r4"), ("KeyP",          "r5"),
+    ("BracketLeft",   "r5"), ("BracketRight", "r5"), ("Backslash",    "r5"),
+    ("CapsLock",      "l5"), ("KeyA",        "l5"), ("KeyS",          "l4"),
+    ("KeyD",          "l3"), ("KeyF",        "l2"), ("KeyG",          "l2"),
+    ("KeyH",          "r2"), ("KeyJ",        "r2"), ("KeyK",          "r3"),
+    ("KeyL",          "r4"), ("Semicolon",   "r5"), ("Quote",         "r5"),
+    ("Enter",         "r5"), ("ShiftLeft",   "l5"), ("IntlBackslash", "l5"),
+    ("KeyZ",          "l5"), ("KeyX",        "l4"), ("KeyC",          "l3"),
+    ("KeyV",          "l2"), ("KeyB",        "l2"), ("KeyN",          "r2"),
+    ("KeyM",          "r2"), ("Comma",       "r3"), ("Period",        "r4"),
+    ("Slash",         "r5"), ("IntlRo",      "r5"), ("ShiftRight",    "r5"),
+    ("ControlLeft",   "l5"), ("MetaLeft",    "l1"), ("AltLeft",       "l1"),
+    ("Lang2",         "l1"), ("NonConvert",  "l1"), ("Space",         "m1"),
+    ("Convert",       "r1"), ("KanaMode",    "r1"), ("Lang1",         "r1"),
+    ("AltRight",      "r1"), ("MetaRight",   "r1"), ("ContextMenu",   "r5"),
+    ("ControlRight",  "r5"),
+]
+
+# on ISO keyboards, the digit row is shifted by one key to the right
+ISO_DIGIT_FINGERS = ["l5", "l5", "l4", "l3", "l2", "l2", "r2", "r2", "r3", "r4"]
+
+# fingers used in the analysis, by hand: pinky to index, index to pinky
+FINGERS = ["l5", "l4", "l3", "l2", "r2", "r3", "r4", "r5"]
+
+GOOD_KEYS = {
+            "KeyW", "KeyE",                    "KeyI", "KeyO",
+    "KeyA", "KeyS", "KeyD", "KeyF",    "KeyJ", "KeyK", "KeyL", "Semicolon",
+                            "KeyV",    "KeyM",
+}
+MEH_KEYS = {"KeyC", "KeyR", "KeyG", "KeyH", "KeyU", "Comma"}
+QUALITIES = ["good", "meh", "bad"]
+
+NGRAM_CATEGORIES = [
+    # Bigrams
+    "sfb",              # Same Finger Bigram
+    "skb",              # Same Key Bigram
+    "lsb",              # Lateral Strech Bigram
+    "handChange",       # Two keys typed by different hands
+    "scissor",          # Roll with uncomfortable height difference between the keys
+    "extendedScissor",  # scissor + lsb
+    "inwardRoll",       # Roll in the pinky -> index direction
+    "outwardRoll",      # Roll in the index -> pinky direction
+
+    # Trigrams
+    "redirect",         # Two rolls going in different directions
+    "badRedirect",      # Redirect that doesn’t use the index
+    "sfs",              # Same Finger Skipgram (sfb with other key in the middle)
+    "sks",              # Same Key Skipgram (skb with other key in the middle)
+    "other",            # unused, is just two simple bigrams, nothing to note.
+]
+# fmt: on
+
+KEY_CODES = [key_code for key_code, _ in KEY_FINGERS]
+KEY_INDEX: Dict[str, int] = {key_code: i for i, key_code in enumerate(KEY_CODES)}
+CATEGORY_INDEX = {name: i for i, name in enumerate(NGRAM_CATEGORIES)}
+NO_CATEGORY = -1  # n-grams typed with the space bar are not classified
+
+
+def requires_extension(key_code: str) -> bool:
+    """Index inner column, or keys outside of the 3×10 matrix."""
+    return (len(key_code) > 3 and key_code[3] in "TGBNHY") or not is_1dfh(key_code)
+
+
+def key_row(key_code: str) -> int:
+    """0 for the space bar, 4 for the digit row; unknown keys are on row 0."""
+    if key_code == "Space":
+        return 0
+    if key_code.startswith("Digit"):
+        return 4
+    if key_code.startswith("Key"):
+        letter = key_code[3:4]
+        if letter in "QWERTYUIOP":
+            return 3
+        if letter in "ASDFGHJKL":
+            return 2
+        if letter in "ZXCVBNM":
+            return 1
+    if key_code in ["Backquote", "Minus"]:
+        return 4
+    if key_code in ["BracketLeft", "BracketRight"]:
+        return 3
+    if key_code in ["Semicolon", "Quote", "Backslash"]:
+        return 2
+    if key_code in ["Comma", "Period", "Slash", "IntlBackslash"]:
+        return 1
+    return 0
+
+
+def key_quality(key_code: str) -> str:
+    if key_code in GOOD_KEYS:
+        return "good"
+    if key_code in MEH_KEYS:
+        return "meh"
+    return "bad"
+
+
+def finger_assignments(iso: bool = False) -> Dict[str, List[str]]:
+    """Key codes typed by each finger of FINGERS, in document order."""
+    fingers = dict(KEY_FINGERS)
+    if iso:
+        for i, finger in enumerate(ISO_DIGIT_FINGERS):
+            fingers[f"Digit{(i + 1) % 10}"] = finger
+    return {
+        finger: [key_code for key_code in KEY_CODES if fingers[key_code] == finger]
+        for finger in FINGERS
+    }
+
+
+class KeyboardModel:
+    """Per-key arrays, and n-gram categories of all key pairs and triplets."""
+
+    def __init__(self, iso: bool = False) -> None:
+        fingers = {
+            key_code: finger
+            for finger, key_codes in finger_assignments(iso).items()
+            for key_code in key_codes
+        }
+        self.fingers = fingers
+
+        count = len(KEY_CODES)
+        self.hand = np.full(count, -1, dtype=np.int8)  # 0: left, 1: right
+        self.digit = np.zeros(count, dtype=np.int8)  # 2: index ... 5: pinky
+        self.row = np.array([key_row(k) for k in KEY_CODES], dtype=np.int8)
+        self.extension = np.array([requires_extension(k) for k in KEY_CODES])
+
+        # finger slot: hand * 4 + position, as in the finger load charts
+        self.slot = np.full(count, -1, dtype=np.int8)
+        self.quality = np.array(
+            [QUALITIES.index(key_quality(k)) for k in KEY_CODES], dtype=np.int8
+        )
+        for key_code, finger in fingers.items():
+            i = KEY_INDEX[key_code]
+            self.hand[i] = 0 if finger[0] == "l" else 1
+            self.digit[i] = int(finger[1])
+            self.slot[i] = FINGERS.index(finger)
+
+        self.bigram_types = self._bigram_types()
+        self.trigram_types = self._trigram_types()
+
+    def _bigram_types(self) -> np.ndarray:
+        """Category of each (previous key, current key) bigram."""
+
+        prev = np.arange(len(KEY_CODES))[:, None]
+        curr = np.arange(len(KEY_CODES))[None, :]
+        prev_hand, curr_hand = self.hand[prev], self.hand[curr]
+        prev_digit, curr_digit = self.digit[prev], self.digit[curr]
+        prev_row, curr_row = self.row[prev], self.row[curr]
+        same_finger = (prev_hand == curr_hand) & (prev_digit == curr_digit)
+        extension = self.extension[prev] | self.extension[curr]
+
+        # scissors: pinky + ring is stricter, but AW (qwerty) is fine
+        height = np.abs(curr_row.astype(int) - prev_row)
+        pinky_ring = ((curr_digit == 4) & (prev_digit == 5)) | (
+            (curr_digit == 5) & (prev_digit == 4)
+        )
+        low_row = np.where(curr_digit == 5, curr_row, prev_row)
+        high_row = np.where(curr_digit == 5, prev_row, curr_row)
+        scissor = np.where(
+            pinky_ring,
+            (height >= 1) & ~((low_row == 2) & (high_row == 3)),
+            height >= 2,
+        )
+
+        types = np.select(
+            [
+                prev == curr,
+                same_finger,
+                prev_hand != curr_hand,
+                scissor & extension,
+                scissor,
+                extension,
+                curr_digit < prev_digit,
+            ],
+            [
+                CATEGORY_INDEX[name]
+                for name in [
+                    "skb",
+                    "sfb",
+                    "handChange",
+                    "extendedScissor",
+                    "scissor",
+                    "lsb",
+                    "inwardRoll",
+                ]
+            ],
+            CATEGORY_INDEX["outwardRoll"],
+        )
+        unassigned = (self.hand[prev] < 0) | (self.hand[curr] < 0)
+        return np.where(unassigned, NO_CATEGORY, types).astype(np.int8)
+
+    def _trigram_types(self) -> np.ndarray:
+        """Category of each (previous, current, next key) trigram."""
+
+        keys = np.arange(len(KEY_CODES))
+        prev, curr, next = keys[:, None, None], keys[None, :, None], keys[None, None, :]
+        hand, digit = self.hand, self.digit
+
+        same_finger = (hand[prev] == hand[next]) & (digit[prev] == digit[next])
+        one_hand = (hand[prev] == hand[curr]) & (hand[curr] == hand[next])
+        repeated = (digit[prev] == digit[curr]) | (digit[curr] == digit[next])
+        first_inward = digit[prev] > digit[curr]
+        second_inward = digit[curr] > digit[next]
+        uses_index = (digit[prev] == 2) | (digit[curr] == 2) | (digit[next] == 2)
+        redirect = one_hand & ~repeated & (first_inward != second_inward)
+
+        types = np.select(
+            [
+                same_finger & (prev == next),
+                same_finger,
+                redirect & uses_index,
+                redirect,
+            ],
+            [
+                CATEGORY_INDEX[name]
+                for name in ["sks", "sfs", "redirect", "badRedirect"]
+            ],
+            CATEGORY_INDEX["other"],
+        )
+        unassigned = (hand[prev] < 0) | (hand[curr] < 0) | (hand[next] < 0)
+        return np.where(unassigned, NO_CATEGORY, types).astype(np.int8)
+
+
+@lru_cache(maxsize=None)
+def keyboard_model(iso: bool = False) -> KeyboardModel:
+    return KeyboardModel(iso)
@@ -0,0 +1,309 @@
+"""
+Layout optimizer: simulated annealing over key permutations.
+
+Keys are swapped within zones of the geometry rows (by default, the 3×10
+letter block). A swap moves whole keys, all layers included: the key windows
+of the corpus n-grams, as typed on the initial layout, are then relabelled
+rather than recomputed, and the score delta of a swap only depends on the
+n-grams that use one of the two swapped keys.
+
+The score of a layout is a weighted sum of its n-gram categories (%) and of
+the key qualities of its load (see WEIGHTS): the lower, the better.
+"""
+
+import copy
+import re
+from concurrent.futures import ProcessPoolExecutor
+from math import exp
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ..layout import GEOMETRY
+from ..utils import SCAN_CODES, Layer
+from .corpus import Corpus
+from .engine import KeyUsage, NgramTable, key_usage, supported_chars
+from .keyboard import (
+    KEY_CODES,
+    KEY_INDEX,
+    NGRAM_CATEGORIES,
+    KeyboardModel,
+    keyboard_model,
+)
+
+if TYPE_CHECKING:
+    from ..layout import KeyboardLayout
+
+# cost of each n-gram category, per % of the bigrams or trigrams; `effort` is
+# the cost of the key qualities (good: 0, meh: 1, bad: 2), per % of the load
+WEIGHTS: Dict[str, float] = {
+    "sfb": 5.0,
+    "skb": 0.0,
+    "lsb": 1.0,
+    "handChange": 0.0,
+    "scissor": 2.0,
+    "extendedScissor": 3.0,
+    "inwardRoll": -0.5,
+    "outwardRoll": -0.25,
+    "redirect": 0.5,
+    "badRedirect": 1.5,
+    "sfs": 0.5,
+    "sks": 0.0,
+    "other": 0.0,
+    "effort": 0.1,
+}
+
+# the 3×10 letter block, in all geometries
+DEFAULT_ZONES = ["ad01-ad10,ac01-ac10,ab01-ab10"]
+
+STEPS = 20_000  # swaps per annealing chain
+CHAINS = 4
+FINAL_TEMPERATURE = 1e-3  # relative to the initial temperature
+
+KEY_RANGE = re.compile(r"^(\w+)-(\w+)$")
+
+
+def parse_zone(spec: str, geometry: str) -> List[str]:
+    """Key names of a zone: comma-separated key names, or ranges of keys
+    within a row of the geometry, e.g. `ad01-ad10,ac01-ac10`."""
+
+    rows = [row.keys for row in GEOMETRY[geometry].rows]
+    keys: List[str] = []
+    for item in spec.replace(" ", "").split(","):
+        match = KEY_RANGE.match(item)
+        if not match:
+            if not any(item in row for row in rows):
+                raise ValueError(f"unknown key in the {geometry} geometry: {item}")
+            keys.append(item)
+            continue
+        first, last = match.groups()
+        for row in rows:
+            if first in row and last in row:
+                keys += row[row.index(first) : row.index(last) + 1]
+                break
+        else:
+            raise ValueError(f"invalid key range in the {geometry} geometry: {item}")
+    return keys
+
+
+def category_costs(types: np.ndarray, weights: Dict[str, float]) -> np.ndarray:
+    """Cost of each key pair or triplet, from its n-gram category."""
+    costs = [weights.get(category, 0.0) for category in NGRAM_CATEGORIES]
+    return np.array(costs + [0.0])[types]  # NO_CATEGORY (-1) costs nothing
+
+
+def merge_windows(table: NgramTable) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct key windows of an n-gram table, and their total frequency."""
+    if not len(table.names):
+        return table.keys, table.frequencies
+    keys, inverse = np.unique(table.keys, axis=0, return_inverse=True)
+    frequencies = np.bincount(inverse.ravel(), weights=table.frequencies)
+    return keys, frequencies
+
+
+class ScoreModel:
+    """Score of a layout, as a function of the position of its keys.
+
+    Keys are identified by their index in the initial layout (KEY_CODES):
+    `positions[key]` is the current position of a key, as a key index too.
+    """
+
+    def __init__(
+        self, usage: KeyUsage, model: KeyboardModel, weights: Dict[str, float]
+    ) -> None:
+        self.load = usage.load
+        self.key_costs = weights.get("effort", 0.0) * model.quality.astype(float)
+        self.bigram_costs = category_costs(model.bigram_types, weights)
+        self.trigram_costs = category_costs(model.trigram_types, weights)
+        self.bigrams = merge_windows(usage.bigrams)
+        self.trigrams = merge_windows(usage.trigrams)
+        self._rows: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def score(self, positions: np.ndarray) -> float:
+        """Score of a layout, from scratch."""
+        rv = float(self.load @ self.key_costs[positions])
+        for (keys, frequencies), costs in [
+            (self.bigrams, self.bigram_costs),
+            (self.trigrams, self.trigram_costs),
+        ]:
+            if len(keys):
+                rv += float(frequencies @ costs[tuple(positions[keys].T)])
+        return rv
+
+    def affected_rows(self, a: int, b: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Bigrams and trigrams that use key `a` or key `b`."""
+        pair = (min(a, b), max(a, b))
+        if pair not in self._rows:
+            bigram_rows, trigram_rows = [
+                np.flatnonzero(((keys == a) | (keys == b)).any(axis=1))
+                for keys, _ in [self.bigrams, self.trigrams]
+            ]
+            self._rows[pair] = (bigram_rows, trigram_rows)
+        return self._rows[pair]
+
+    def swap_delta(self, positions: np.ndarray, a: int, b: int) -> float:
+        """Score change when keys `a` and `b` swap their positions."""
+
+        pos_a, pos_b = positions[a], positions[b]
+        delta = (self.load[a] - self.load[b]) * (
+            self.key_costs[pos_b] - self.key_costs[pos_a]
+        )
+        for rows, (keys, frequencies), costs in zip(
+            self.affected_rows(a, b),
+            [self.bigrams, self.trigrams],
+            [self.bigram_costs, self.trigram_costs],
+        ):
+            if not len(rows):
+                continue
+            windows = keys[rows]
+            before = positions[windows]
+            after = np.where(windows == a, pos_b, np.where(windows == b, pos_a, before))
+            change = costs[tuple(after.T)] - costs[tuple(before.T)]
+            delta += frequencies[rows] @ change
+        return float(delta)
+
+
+class Chain(NamedTuple):
+    """Best layout found by an annealing chain."""
+
+    score: float
+    positions: np.ndarray
+
+
+def anneal(model: ScoreModel, zones: List[List[int]], steps: int, seed: int) -> Chain:
+    """Simulated annealing: random swaps within the zones, accepted if they
+    improve the score or, with a decreasing probability, if they don't."""
+
+    rng = np.random.default_rng(seed)
+    positions = np.arange(len(KEY_CODES))
+    key_at = np.arange(len(KEY_CODES))  # inverse permutation
+
+    # all swappable position pairs, and their random sequence
+    pairs = np.array(
+        [(p, q) for zone in zones for i, p in enumerate(zone) for q in zone[i + 1 :]]
+    )
+    swaps = pairs[rng.integers(len(pairs), size=steps)]
+    draws = rng.random(steps)
+
+    # initial temperature: the typical score change of a random swap
+    sample = pairs[rng.integers(len(pairs), size=min(100, len(pairs)))]
+    deltas = [abs(model.swap_delta(positions, p, q)) for p, q in sample]
+    t_start = max(float(np.mean(deltas)), 1e-9)
+
+    score = best_score = model.score(positions)
+    best_positions = positions.copy()
+    for step, ((p, q), draw) in enumerate(zip(swaps.tolist(), draws.tolist())):
+        temperature = t_start * FINAL_TEMPERATURE ** (step / steps)
+        a, b = key_at[p], key_at[q]
+        delta = model.swap_delta(positions, a, b)
+        if delta > 0 and draw >= exp(-delta / temperature):
+            continue
+        positions[a], positions[b] = q, p
+        key_at[p], key_at[q] = b, a
+        score += delta
+        if score < best_score - 1e-12:
+            best_score = score
+            best_positions = positions.copy()
+
+    # the score is updated incrementally: compute the final one from scratch
+    return Chain(model.score(best_positions), best_positions)
+
+
+def permute_keys(layout: "KeyboardLayout", moves: Dict[str, str]) -> "KeyboardLayout":
+    """Copy of a layout where keys are moved: {key name: new key name}."""
+
+    permuted = copy.deepcopy(layout)
+    for layer in Layer:
+        row = layout.layers[layer]
+        for key, new_key in moves.items():
+            permuted.layers.set(layer, new_key, row.get(key))
+    return permuted
+
+
+class OptimizedLayout(NamedTuple):
+    score: float
+    layout: "KeyboardLayout"
+
+
+class Optimizer:
+    """Score and optimize a keyboard layout for a given corpus."""
+
+    def __init__(
+        self,
+        layout: "KeyboardLayout",
+        corpus: Corpus,
+        zones: Optional[List[str]] = None,
+        weights: Optional[Dict[str, float]] = None,
+        iso: Optional[bool] = None,
+    ) -> None:
+        from ..generators.web import raw_json
+
+        self.layout = layout
+        self.corpus = corpus
+        self.weights = {**WEIGHTS, **(weights or {})}
+        self.iso = layout.geometry == "ISO" if iso is None else iso
+        self.model = keyboard_model(self.iso)
+
+        if zones is None:
+            zones = DEFAULT_ZONES
+        key_names = [parse_zone(zone, layout.geometry) for zone in zones]
+        all_names = [name for names in key_names for name in names]
+        if len(set(all_names)) != len(all_names):
+            raise ValueError("zones must not overlap")
+        web_codes = SCAN_CODES["web"]
+        self.key_names = {KEY_INDEX[web_codes[name]]: name for name in all_names}
+        self.zones = [
+            [KEY_INDEX[web_codes[name]] for name in names]
+            for names in key_names
+            if len(names) > 1
+        ]
+
+        data = raw_json(layout)
+        keymap, deadkeys = data["keymap"], data["deadkeys"]
+        usage = key_usage(keymap, deadkeys, corpus, supported_chars(keymap, deadkeys))
+        self.score_model = ScoreModel(usage, self.model, self.weights)
+
+    def score(self, layout: Optional["KeyboardLayout"] = None) -> float:
+        """Score of a layout (by default, the initial one), from scratch."""
+        if layout is None:
+            layout = self.layout
+        optimizer = Optimizer(layout, self.corpus, [], self.weights, self.iso)
+        return optimizer.score_model.score(np.arange(len(KEY_CODES)))
+
+    def apply(self, positions: np.ndarray) -> "KeyboardLayout":
+        """Layout with its keys at the given positions."""
+        moves = {
+            name: self.key_names[int(positions[key])]
+            for key, name in self.key_names.items()
+            if positions[key] != key
+        }
+        return permute_keys(self.layout, moves)
+
+    def optimize(
+        self,
+        steps: int = STEPS,
+        chains: int = CHAINS,
+        jobs: int = 1,
+        seed: Optional[int] = None,
+    ) -> List[OptimizedLayout]:
+        """Run several annealing chains (in parallel processes with several
+        jobs), and return their layouts, best first."""
+
+        if not self.zones:
+            raise ValueError("no keys to swap")
+        seeds = np.random.SeedSequence(seed).generate_state(chains).tolist()
+        args = (self.score_model, self.zones, steps)
+        if jobs == 1:
+            results = [anneal(*args, chain_seed) for chain_seed in seeds]
+        else:
+            with ProcessPoolExecutor(jobs or None) as pool:
+                futures = [pool.submit(anneal, *args, s) for s in seeds]
+                results = [future.result() for future in futures]
+
+        # key windows are relabelled during the annealing: score the layouts
+        # from scratch, as their easiest key sequences may have changed
+        layouts = [self.apply(chain.positions) for chain in results]
+        return sorted(
+            (OptimizedLayout(self.score(layout), layout) for layout in layouts),
+            key=lambda result: result.score,
+        )
@@ -0,0 +1,156 @@
+"""
+Analysis reports for `kalamine analyze`: the sections of the `watch` page
+(finger load, same finger/key usage, bottlenecks, bigrams, trigrams), for many
+layouts and corpora, as CSV rows or JSON documents.
+"""
+
+import csv
+import io
+import json
+from contextlib import redirect_stdout
+from functools import lru_cache
+from pathlib import Path
+from typing import IO, Dict, List, NamedTuple, Optional, Sequence
+
+from ..layout import KeyboardLayout, parse_layout
+from .corpus import Corpus, load_corpus
+from .engine import Analysis, analyze_all
+from .keyboard import FINGERS, NGRAM_CATEGORIES
+
+# n-gram tables of the `watch` page, by section
+SECTIONS = {
+    "bottlenecks": ["sfb", "lsb", "scissor"],
+    "bigrams": ["skb", "inwardRoll", "outwardRoll"],
+    "trigrams": ["sks", "sfs", "redirect", "badRedirect"],
+}
+
+PRECISION = 4  # decimals of the reported percentages
+
+
+def percent(value: float) -> float:
+    return round(value, PRECISION)
+
+
+def top_ngrams(ngrams: Dict[str, float], count: int) -> Dict[str, float]:
+    """Most frequent n-grams, as in the `watch` page tables."""
+    ranked = sorted(ngrams.items(), key=lambda item: item[1], reverse=True)
+    return {name: percent(freq) for name, freq in ranked[:count] if percent(freq)}
+
+
+def summary(analysis: Analysis) -> Dict[str, float]:
+    """Flat metrics of an analysis: one CSV row."""
+
+    load = [sum(finger.values()) for hand in analysis.load_groups for finger in hand]
+    sfu_sku = [finger for hand in analysis.total_sfu_sku_per_finger for finger in hand]
+    totals = analysis.totals()
+
+    row: Dict[str, float] = {
+        "unsupported": percent(analysis.total_unsupported_chars),
+        "imprecise": int(analysis.imprecise_data),
+        "load_left": percent(sum(load[:4])),
+        "load_right": percent(sum(load[4:])),
+    }
+    per_finger = {
+        "load": load,
+        "sfu": [finger["bad"] for finger in sfu_sku],
+        "sku": [finger["meh"] for finger in sfu_sku],
+    }
+    for prefix, values in per_finger.items():
+        for finger, value in zip(FINGERS, values):
+            row[f"{prefix}_{finger}"] = percent(value)
+    row.update({category: percent(totals[category]) for category in NGRAM_CATEGORIES})
+    return row
+
+
+def details(analysis: Analysis, count: int) -> Dict:
+    """Detailed analysis, as displayed on the `watch` page."""
+
+    def groups(values: List[List[Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+        fingers = [finger for hand in values for finger in hand]
+        return {
+            name: {quality: percent(value) for quality, value in finger.items()}
+            for name, finger in zip(FINGERS, fingers)
+        }
+
+    sections = {
+        section: {name: top_ngrams(analysis.ngrams[name], count) for name in names}
+        for section, names in SECTIONS.items()
+    }
+    sections["bottlenecks"]["unsupported"] = top_ngrams(
+        analysis.unsupported_chars, count
+    )
+    return {
+        "summary": summary(analysis),
+        "load": groups(analysis.load_groups),
+        "sfu_sku": groups(analysis.total_sfu_sku_per_finger),
+        **sections,
+    }
+
+
+@lru_cache(maxsize=None)
+def cached_corpus(name: str) -> Corpus:
+    """Corpora are loaded once per process, whatever the number of layouts."""
+    return load_corpus(name)
+
+
+class LayoutReport(NamedTuple):
+    input_file: Path
+    name: str
+    corpora: List[str]
+    analyses: List[Dict]
+    error: Optional[str]
+    warnings: List[str]  # layout warnings, which must not mix with the report
+
+
+def analyze_layout(
+    input_file: Path,
+    corpora: Sequence[str],
+    angle_mod: bool = False,
+    iso: Optional[bool] = None,
+    count: int = 10,
+) -> LayoutReport:
+    """Analyze one layout descriptor for several corpora. Errors and warnings
+    are returned instead of being raised or printed, so that batch analyses
+    can report them in order, apart from the report itself."""
+
+    name = input_file.stem
+    analyses: List[Dict] = []
+    error = None
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            layout = KeyboardLayout(parse_layout(input_file), angle_mod)
+        name = layout.meta["name"]
+        results = analyze_all(layout, map(cached_corpus, corpora), iso)
+        analyses = [details(analysis, count) for analysis in results]
+    except Exception as exc:
+        error = str(exc)
+    warnings = output.getvalue().splitlines()
+    return LayoutReport(input_file, name, list(corpora), analyses, error, warnings)
+
+
+def write_csv(reports: Sequence[LayoutReport], file: IO[str]) -> None:
+    """One row per layout and corpus, with the summary metrics."""
+
+    writer: Optional[csv.DictWriter] = None
+    for report in reports:
+        for corpus, analysis in zip(report.corpora, report.analyses):
+            row = {"layout": str(report.input_file), "name": report.name}
+            row.update({"corpus": corpus, **analysis["summary"]})
+            if writer is None:
+                writer = csv.DictWriter(file, fieldnames=list(row), lineterminator="\n")
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def write_json(reports: Sequence[LayoutReport], file: IO[str]) -> None:
+    """One document per layout and corpus, with all the `watch` page sections."""
+
+    data = [
+        {"layout": str(report.input_file), "name": report.name, "corpus": corpus}
+        | analysis
+        for report in reports
+        for corpus, analysis in zip(report.corpora, report.analyses)
+    ]
+    json.dump(data, file, indent=2, ensure_ascii=False)
+    file.write("\n")
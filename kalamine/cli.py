@@ -1,24 +1,100 @@
 #!/usr/bin/env python3
 
-from contextlib import contextmanager
-from importlib import metadata
+import io
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from importlib import import_module
+from itertools import repeat
 from pathlib import Path
-from typing import Iterator, List, Literal, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import click
 
-from .generators import ahk, keylayout, klc, web, xkb
-from .help import create_layout, user_guide
-from .layout import KeyboardLayout, load_layout
-from .server import keyboard_server
+from .layout import KeyboardLayout, parse_layout
+from .manifest import MANIFEST_FILE, BuildManifest, build_digest
 
 
 @click.group()
 def cli() -> None: ...
 
 
-def build_all(layout: KeyboardLayout, output_dir_path: Path) -> None:
-    """Generate all layout output files.
+class Output(NamedTuple):
+    """Output file format, and the generator that produces it."""
+
+    module: str  # generator module, only imported when needed
+    function: str
+    encoding: str = "utf-8"
+    newline: Optional[str] = "\n"
+    bom: bool = False
+    options: Tuple[str, ...] = ()  # build options passed to the generator
+
+
+OUTPUTS: Dict[str, Output] = {
+    ".ahk": Output("ahk", "write_ahk", bom=True),  # AHK scripts require a BOM
+    ".klc": Output("klc", "write_klc", encoding="utf-16le", newline="\r\n"),
+    ".keylayout": Output("keylayout", "write_keylayout"),
+    ".xkb_keymap": Output("xkb", "write_xkb_keymap"),
+    ".xkb_symbols": Output("xkb", "write_xkb_symbols"),
+    ".json": Output("web", "write_pretty_json", newline=None, options=("char_table",)),
+    ".svg": Output("web", "svg"),  # ElementTree writes the file by itself
+}
+
+
+def generator(output: Output) -> Callable:
+    """Import the generator function for an output format."""
+    module = import_module(f".generators.{output.module}", __package__)
+    return getattr(module, output.function)
+
+
+def write_output(
+    layout: KeyboardLayout,
+    output_file: Path,
+    output: Output,
+    log: Callable[[str], None] = click.echo,
+    options: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Generate an output file for the given layout."""
+
+    write = generator(output)
+    options = options or {}
+    kwargs = {name: options[name] for name in output.options if name in options}
+
+    if output.function == "svg":
+        write(layout).write(output_file, encoding="utf-8", xml_declaration=True)
+        return
+
+    with output_file.open(
+        "w", encoding=output.encoding, newline=output.newline
+    ) as file:
+        if output.bom:
+            file.write("\ufeff")
+        try:
+            write(layout, file, **kwargs)
+        except ValueError as err:
+            log(str(err))
+
+
+def build_all(
+    layout: KeyboardLayout,
+    output_dir_path: Path,
+    log: Callable[[str], None] = click.echo,
+    options: Optional[Dict[str, Any]] = None,
+) -> List[Path]:
+    """Generate all layout output files, and return their paths.
 
     Parameters
     ----------
@@ -28,6 +104,10 @@ def build_all(layout: KeyboardLayout, output_dir_path: Path) -> None:
         The output directory.
     msklc_dir : Path
         The MSKLC installation directory.
+    log : Callable
+        The function that reports each created file.
+    options : dict
+        Build options, for the generators that support them.
     """
 
     @contextmanager
@@ -35,47 +115,95 @@ def build_all(layout: KeyboardLayout, output_dir_path: Path) -> None:
         """Generate an output file path for extension EXT, return it and finally echo info."""
         path = output_dir_path / (layout.meta["fileName"] + ext)
         yield path
-        click.echo(f"... {path}")
+        log(f"... {path}")
+
+    # parallel builds may create the output directory concurrently
+    output_dir_path.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for ext, output in OUTPUTS.items():
+        with file_creation_context(ext) as path:
+            write_output(layout, path, output, log, options)
+        paths.append(path)
+    return paths
+
+
+def output_path(input_file: Path, out: Union[Path, Literal["all"]]) -> Path:
+    """Output file for a single-format build."""
 
-    if not output_dir_path.exists():
-        output_dir_path.mkdir(parents=True)
+    # quick output: reuse the input name and change the file extension
+    if out in ["keylayout", "klc", "xkb_keymap", "xkb_symbols", "svg"]:
+        return input_file.with_suffix(f".{out}")
+    return Path(out)
 
-    # AHK driver
-    with file_creation_context(".ahk") as ahk_path:
-        with ahk_path.open("w", encoding="utf-8", newline="\n") as file:
-            file.write("\ufeff")  # AHK scripts require a BOM
-            file.write(ahk.ahk(layout))
 
-    # Windows driver
-    with file_creation_context(".klc") as klc_path:
-        with klc_path.open("w", encoding="utf-16le", newline="\r\n") as file:
-            try:
-                file.write(klc.klc(layout))
-            except ValueError as err:
-                print(err)
+class BuildResult(NamedTuple):
+    input_file: Path
+    messages: List[str]
+    error: Optional[str]
+    duration: float
+    outputs: List[Path]
+    up_to_date: bool = False
 
-    # macOS driver
-    with file_creation_context(".keylayout") as osx_path:
-        with osx_path.open("w", encoding="utf-8", newline="\n") as file:
-            file.write(keylayout.keylayout(layout))
 
-    # Linux driver, user-space
-    with file_creation_context(".xkb_keymap") as xkb_path:
-        with xkb_path.open("w", encoding="utf-8", newline="\n") as file:
-            file.write(xkb.xkb_keymap(layout))
+class MessageStream(io.TextIOBase):
+    """A text stream that appends each line written to it to a message list."""
 
-    # Linux driver, root
-    with file_creation_context(".xkb_symbols") as xkb_custom_path:
-        with xkb_custom_path.open("w", encoding="utf-8", newline="\n") as file:
-            file.write(xkb.xkb_symbols(layout))
+    def __init__(self, messages: List[str]) -> None:
+        self.messages = messages
+        self.line = ""  # pending, incomplete line
 
-    # JSON data
-    with file_creation_context(".json") as json_path:
-        json_path.write_text(web.pretty_json(layout), encoding="utf8")
+    def write(self, text: str) -> int:
+        *lines, self.line = (self.line + text).split("\n")
+        self.messages.extend(lines)
+        return len(text)
 
-    # SVG data
-    with file_creation_context(".svg") as svg_path:
-        web.svg(layout).write(svg_path, encoding="utf-8", xml_declaration=True)
+
+def build_layout(
+    input_file: Path,
+    out: Union[Path, Literal["all"]],
+    angle_mod: bool,
+    qwerty_shortcuts: bool,
+    char_table: bool = False,
+) -> BuildResult:
+    """Build one layout descriptor. Messages and errors are returned instead of
+    being displayed, so that batch builds can report them in order: this
+    includes the warnings that the layout and the generators print."""
+
+    start = time.perf_counter()
+    messages: List[str] = []
+    outputs: List[Path] = []
+    error = None
+    stdout = MessageStream(messages)
+    try:
+        with redirect_stdout(stdout):
+            layout = KeyboardLayout(
+                parse_layout(input_file), angle_mod, qwerty_shortcuts
+            )
+            options = {"char_table": char_table}
+
+            # default: build all in the `dist` subdirectory
+            if out == "all":
+                outputs = build_all(layout, Path("dist"), messages.append, options)
+            else:
+                output_file = output_path(input_file, out)
+                write_output(
+                    layout,
+                    output_file,
+                    OUTPUTS[output_file.suffix],
+                    messages.append,
+                    options,
+                )
+                messages.append(f"... {output_file}")
+                outputs = [output_file]
+
+    except Exception as exc:
+        error = str(exc)
+    if stdout.line:
+        messages.append(stdout.line)
+
+    duration = time.perf_counter() - start
+    return BuildResult(input_file, messages, error, duration, outputs)
 
 
 @cli.command()
@@ -101,65 +229,379 @@ def build_all(layout: KeyboardLayout, output_dir_path: Path) -> None:
     is_flag=True,
     help="Keep shortcuts at their qwerty location",
 )
+@click.option(
+    "--char-table",
+    default=False,
+    is_flag=True,
+    help="Embed the easiest key sequence of each character in JSON outputs.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Number of layouts to build in parallel (0: one per CPU).",
+)
+@click.option(
+    "--force",
+    "-f",
+    default=False,
+    is_flag=True,
+    help=f"Rebuild all outputs, even those that are up to date in `{MANIFEST_FILE}`.",
+)
 def build(
     layout_descriptors: List[Path],
     out: Union[Path, Literal["all"]],
     angle_mod: bool,
     qwerty_shortcuts: bool,
+    char_table: bool,
+    jobs: int,
+    force: bool,
 ) -> None:
     """Convert TOML/YAML descriptions into OS-specific keyboard drivers."""
 
-    for input_file in layout_descriptors:
-        layout = KeyboardLayout(load_layout(input_file), angle_mod, qwerty_shortcuts)
-
-        # default: build all in the `dist` subdirectory
-        if out == "all":
-            build_all(layout, Path("dist"))
-            continue
+    if out != "all" and output_path(Path(), out).suffix not in OUTPUTS:
+        click.echo("Unsupported output format.", err=True)
+        return
 
-        # quick output: reuse the input name and change the file extension
-        if out in ["keylayout", "klc", "xkb_keymap", "xkb_symbols", "svg"]:
-            output_file = input_file.with_suffix(f".{out}")
+    # incremental build: skip the layouts whose inputs haven't changed
+    manifest = BuildManifest()
+    keys: Dict[Path, str] = {}
+    digests: Dict[Path, Optional[str]] = {}
+    for input_file in layout_descriptors:
+        keys[input_file] = f"{input_file.resolve()} -> {out}"
+        digests[input_file] = build_digest(
+            input_file, [out, angle_mod, qwerty_shortcuts, char_table]
+        )
+    up_to_date = [
+        input_file
+        for input_file in layout_descriptors
+        if not force and manifest.is_up_to_date(keys[input_file], digests[input_file])
+    ]
+    pending = [path for path in layout_descriptors if path not in up_to_date]
+
+    def run_builds() -> Iterator[BuildResult]:
+        args = (
+            pending,
+            repeat(out),
+            repeat(angle_mod),
+            repeat(qwerty_shortcuts),
+            repeat(char_table),
+        )
+        if jobs == 1:
+            yield from merge_results(map(build_layout, *args))
         else:
-            output_file = Path(out)
+            with ProcessPoolExecutor(jobs or None) as pool:
+                yield from merge_results(pool.map(build_layout, *args))
+
+    def merge_results(builds: Iterator[BuildResult]) -> Iterator[BuildResult]:
+        for input_file in layout_descriptors:
+            if input_file in up_to_date:
+                outputs = manifest.outputs(keys[input_file])
+                message = f"... {input_file}: up to date"
+                yield BuildResult(input_file, [message], None, 0, outputs, True)
+            else:
+                yield next(builds)
+
+    # results are reported in the input order, whatever the number of jobs
+    start = time.perf_counter()
+    failures = 0
+    results: List[BuildResult] = []
+    for result in run_builds():
+        for message in result.messages:
+            click.echo(message)
+        if result.error:
+            click.echo(f"{result.input_file}: {result.error}", err=True)
+            manifest.forget(keys[result.input_file])
+            failures += 1
+        elif not result.up_to_date:
+            key = keys[result.input_file]
+            manifest.record(key, digests[result.input_file], result.outputs)
+        results.append(result)
+
+    if pending:
+        manifest.save()
+
+    if len(results) > 1:
+        click.echo("--- build summary")
+        for result in results:
+            status = "failed" if result.error else "ok"
+            if result.up_to_date:
+                status = "cached"
+            click.echo(f"{result.duration:7.3f}s  {status:6}  {result.input_file}")
+        click.echo(
+            f"{time.perf_counter() - start:7.3f}s  "
+            f"{len(results) - failures}/{len(results)} layouts built"
+        )
+
+    if failures:
+        sys.exit(1)
 
-        # detailed output
-        if output_file.suffix == ".ahk":
-            with output_file.open("w", encoding="utf-8", newline="\n") as file:
-                file.write("\ufeff")  # AHK scripts require a BOM
-                file.write(ahk.ahk(layout))
 
-        elif output_file.suffix == ".klc":
-            with output_file.open("w", encoding="utf-16le", newline="\r\n") as file:
-                try:
-                    file.write(klc.klc(layout))
-                except ValueError as err:
-                    print(err)
-
-        elif output_file.suffix == ".keylayout":
-            with output_file.open("w", encoding="utf-8", newline="\n") as file:
-                file.write(keylayout.keylayout(layout))
+@cli.command()
+@click.argument(
+    "layout_descriptors",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--corpus",
+    "-c",
+    "corpora",
+    multiple=True,
+    help="Corpus name or JSON file (default: all corpora shipped with kalamine).",
+)
+@click.option(
+    "--out",
+    "-o",
+    default="-",
+    type=click.File("w", encoding="utf-8"),
+    help="Report file (default: standard output).",
+)
+@click.option(
+    "--format",
+    "report_format",
+    type=click.Choice(["csv", "json"]),
+    help="Report format (default: guessed from the report file, or CSV).",
+)
+@click.option(
+    "--top",
+    default=10,
+    type=click.IntRange(min=0),
+    help="Number of n-grams listed in each JSON report table.",
+)
+@click.option(
+    "--geometry",
+    type=click.Choice(["ISO", "ANSI"], case_sensitive=False),
+    help="Digit row fingering (default: the layout geometry).",
+)
+@click.option(
+    "--angle-mod/--no-angle-mod",
+    default=False,
+    help="Apply Angle-Mod (which is a [ZXCVB] permutation with the LSGT key (a.k.a. ISO key))",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Number of layouts to analyze in parallel (0: one per CPU).",
+)
+def analyze(
+    layout_descriptors: List[Path],
+    corpora: List[str],
+    out: IO[str],
+    report_format: Optional[str],
+    top: int,
+    geometry: Optional[str],
+    angle_mod: bool,
+    jobs: int,
+) -> None:
+    """Score layout descriptions against text corpora (CSV/JSON report)."""
+    try:
+        from .analyzer import report
+        from .analyzer.corpus import corpus_names
+    except ImportError as err:
+        click.echo(f"The analyzer requires NumPy: {err}", err=True)
+        click.echo("Install it with `pip install kalamine[analyzer]`.", err=True)
+        sys.exit(1)
+
+    # check the corpora before starting any analysis
+    corpora = list(corpora) or corpus_names()
+    for corpus in corpora:
+        try:
+            report.cached_corpus(corpus)
+        except (OSError, ValueError) as err:
+            click.echo(f"Error: {err}", err=True)
+            sys.exit(1)
+
+    iso = None if geometry is None else geometry.upper() == "ISO"
+    args = (
+        layout_descriptors,
+        repeat(corpora),
+        repeat(angle_mod),
+        repeat(iso),
+        repeat(top),
+    )
+    start = time.perf_counter()
+    if jobs == 1:
+        reports = list(map(report.analyze_layout, *args))
+    else:
+        with ProcessPoolExecutor(jobs or None) as pool:
+            reports = list(pool.map(report.analyze_layout, *args))
+
+    for result in reports:
+        for warning in result.warnings:
+            click.echo(f"{result.input_file}: {warning}", err=True)
+    failures = [result for result in reports if result.error]
+    for result in failures:
+        click.echo(f"{result.input_file}: {result.error}", err=True)
+
+    if report_format is None:
+        report_format = "json" if out.name.endswith(".json") else "csv"
+    write = report.write_json if report_format == "json" else report.write_csv
+    write([result for result in reports if not result.error], out)
+
+    if out.name != "<stdout>":
+        click.echo(
+            f"{time.perf_counter() - start:7.3f}s  "
+            f"{len(reports) - len(failures)}/{len(reports)} layouts analyzed "
+            f"-> {out.name}"
+        )
+    if failures:
+        sys.exit(1)
 
-        elif output_file.suffix == ".xkb_keymap":
-            with output_file.open("w", encoding="utf-8", newline="\n") as file:
-                file.write(xkb.xkb_keymap(layout))
 
-        elif output_file.suffix == ".xkb_symbols":
-            with output_file.open("w", encoding="utf-8", newline="\n") as file:
-                file.write(xkb.xkb_symbols(layout))
+@cli.command()
+@click.argument(
+    "layout_descriptor",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--corpus",
+    "-c",
+    default="en",
+    help="Corpus: a shipped corpus name, or a `*.json` or `*.kcorpus` file.",
+)
+@click.option(
+    "--zone",
+    "zones",
+    multiple=True,
+    help="Keys that can be swapped with each other: key names or ranges of a "
+    "geometry row, e.g. `ad01-ad10,ac01-ac10` (default: the 3×10 letter block).",
+)
+@click.option(
+    "--steps",
+    default=20_000,
+    type=click.IntRange(min=1),
+    help="Number of key swaps in each annealing chain.",
+)
+@click.option(
+    "--chains",
+    default=4,
+    type=click.IntRange(min=1),
+    help="Number of annealing chains.",
+)
+@click.option(
+    "--keep",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of layouts to write, best first.",
+)
+@click.option("--seed", type=int, help="Random seed, for reproducible results.")
+@click.option(
+    "--out",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Output descriptor (default: `<layout>-optimized.toml`).",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Number of annealing chains to run in parallel (0: one per CPU).",
+)
+def optimize(
+    layout_descriptor: Path,
+    corpus: str,
+    zones: List[str],
+    steps: int,
+    chains: int,
+    keep: int,
+    seed: Optional[int],
+    out: Optional[Path],
+    jobs: int,
+) -> None:
+    """Optimize a layout for a corpus, by swapping its keys (simulated annealing)."""
+    try:
+        from .analyzer.corpus import load_corpus
+        from .analyzer.optimizer import Optimizer
+    except ImportError as err:
+        click.echo(f"The optimizer requires NumPy: {err}", err=True)
+        click.echo("Install it with `pip install kalamine[analyzer]`.", err=True)
+        sys.exit(1)
+
+    from .help import write_layout
+
+    try:
+        layout = KeyboardLayout(parse_layout(layout_descriptor))
+        optimizer = Optimizer(layout, load_corpus(corpus), list(zones) or None)
+    except (OSError, ValueError) as err:
+        click.echo(f"Error: {err}", err=True)
+        sys.exit(1)
+
+    click.echo(f"{optimizer.score():10.3f}  {layout_descriptor}")
+    results = optimizer.optimize(steps, chains, jobs, seed)
+    if out is None:
+        out = Path(f"{layout_descriptor.stem}-optimized.toml")
+    for i, result in enumerate(results[:keep], 1):
+        path = out if keep == 1 else out.with_name(f"{out.stem}-{i}{out.suffix}")
+        write_layout(result.layout, path)
+        click.echo(f"{result.score:10.3f}  {path}")
+
+
+@cli.group()
+def corpus() -> None:
+    """Build text corpora for layout analysis."""
+
+
+@corpus.command("build")
+@click.argument(
+    "text_files",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--out",
+    "-o",
+    default="-",
+    type=click.File("w", encoding="utf-8"),
+    help="Corpus file (default: standard output).",
+)
+@click.option(
+    "--keep-case",
+    default=False,
+    is_flag=True,
+    help="Count upper- and lowercase letters separately.",
+)
+@click.option(
+    "--max-ngrams",
+    default=200_000,
+    type=click.IntRange(min=1000),
+    help="Maximum number of entries in each n-gram table, before pruning the least frequent ones.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Number of file shards to process in parallel (0: one per CPU).",
+)
+def corpus_build(
+    text_files: List[Path], out: IO[str], keep_case: bool, max_ngrams: int, jobs: int
+) -> None:
+    """Count symbols, bigrams and trigrams of (gzipped) text files."""
+    from .corpus_builder import build_corpus, write_corpus
 
-        elif output_file.suffix == ".json":
-            output_file.write_text(web.pretty_json(layout), encoding="utf8")
+    write_corpus(build_corpus(text_files, jobs, not keep_case, max_ngrams), out)
 
-        elif output_file.suffix == ".svg":
-            web.svg(layout).write(output_file, encoding="utf-8", xml_declaration=True)
 
-        else:
-            click.echo("Unsupported output format.", err=True)
-            return
+@corpus.command("convert")
+@click.argument(
+    "json_files",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+def corpus_convert(json_files: List[Path]) -> None:
+    """Convert JSON corpora to the binary `*.kcorpus` format."""
+    from .corpus_builder import convert_corpus
 
-        # successfully converted, display file name
-        click.echo(f"... {output_file}")
+    for json_file in json_files:
+        click.echo(f"... {convert_corpus(json_file)}")
 
 
 # TODO: Provide geometry choices
@@ -170,6 +612,8 @@ def build(
 @click.option("--1dk/--no-1dk", "odk", default=False, help="Set a custom dead key.")
 def new(output_file: Path, geometry: str, altgr: bool, odk: bool) -> None:
     """Create a new TOML layout description."""
+    from .help import create_layout
+
     create_layout(output_file, geometry, altgr, odk)
     click.echo(f"... {output_file}")
 
@@ -183,18 +627,24 @@ def new(output_file: Path, geometry: str, altgr: bool, odk: bool) -> None:
 )
 def watch(filepath: Path, angle_mod: bool) -> None:
     """Watch a layout description file and display it in a web browser."""
+    from .server import keyboard_server  # pulls in the whole web server stack
+
     keyboard_server(filepath, angle_mod)
 
 
 @cli.command()
 def guide() -> None:
     """Show user guide and exit."""
+    from .help import user_guide
+
     click.echo(user_guide())
 
 
 @cli.command()
 def version() -> None:
     """Show version number and exit."""
+    from importlib import metadata
+
     click.echo(f"kalamine {metadata.version('kalamine')}")
 
 
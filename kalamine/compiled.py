@@ -0,0 +1,118 @@
+"""
+Compiled layout: the per-key data of a layout, resolved once for all outputs.
+
+Each level of each key is resolved to a character or a dead key, with its
+code point and, for dead keys, their terminator (the character they produce
+when followed by a space). Dead key combinations are indexed by base char.
+Generators render from this representation instead of walking the layers and
+dead key tables on their own.
+"""
+
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .generators.windows import WindowsKeymap
+    from .layout import KeyboardLayout
+
+from .layers import KEY_NAMES
+from .utils import DK_INDEX, Layer, hex_ord
+
+
+class CompiledSymbol(NamedTuple):
+    """A key level: a character, or a dead key."""
+
+    symbol: str  # character, or dead key id
+    dead_key: bool
+    char: str  # the character, or the dead key terminator
+    code: str  # hex code point of `char` (empty for a multi-char symbol)
+
+
+class CompiledKey(NamedTuple):
+    """A key and its six levels (see `Layer`), None for unassigned levels."""
+
+    name: str
+    levels: Tuple[Optional[CompiledSymbol], ...]
+    alpha: bool  # the base level is a cased letter: CapsLock applies
+
+    def symbols(self, *layers: Layer) -> List[str]:
+        """Symbols of the assigned levels, among the given layers."""
+        levels = [self.levels[layer] for layer in layers]
+        return [level.symbol for level in levels if level]
+
+
+class CompiledDeadKey(NamedTuple):
+    """A dead key of the layout."""
+
+    id: str
+    name: str
+    table: Dict[str, str]  # base char -> output, including spaces and nesting
+    terminator: str  # output on a space
+    alt_self: str  # output when the dead key is pressed twice
+
+
+class CompiledLayout:
+    """Keys and dead keys of a layout, resolved for the generators.
+
+    Keys are listed in LAYER_KEYS order and dead keys in DK_INDEX order, which
+    are the output orders of all generators. The dead key tables are copies
+    of the layout ones, which are compared to detect changes: they must not
+    be modified.
+    """
+
+    def __init__(self, layout: "KeyboardLayout") -> None:
+        self.revision = layout.layers.revision
+        self.dead_key_tables = {
+            id: dict(table) for id, table in layout.dead_keys.items()
+        }
+        # Windows keymaps by keymap options, see `windows.windows_keymap`
+        self.windows_keymaps: Dict[Tuple, "WindowsKeymap"] = {}
+
+        self.dead_keys: Dict[str, CompiledDeadKey] = {}
+        for id, table in self.dead_key_tables.items():
+            self.dead_keys[id] = CompiledDeadKey(
+                id, DK_INDEX[id].name, table, table[" "], table[id]
+            )
+
+        # base char -> [(dead key id, output)], in dead key order
+        self.combos: Dict[str, List[Tuple[str, str]]] = {}
+        for id, dead_key in self.dead_keys.items():
+            for base, output in dead_key.table.items():
+                self.combos.setdefault(base, []).append((id, output))
+
+        symbols: Dict[str, CompiledSymbol] = {}
+
+        def compile_symbol(symbol: Optional[str]) -> Optional[CompiledSymbol]:
+            if symbol is None:
+                return None
+            if symbol not in symbols:
+                dead_key = symbol in self.dead_keys
+                char = self.dead_keys[symbol].terminator if dead_key else symbol
+                code = hex_ord(char) if len(char) == 1 else ""
+                symbols[symbol] = CompiledSymbol(symbol, dead_key, char, code)
+            return symbols[symbol]
+
+        self.keys: Dict[str, CompiledKey] = {}
+        for i, key_name in enumerate(KEY_NAMES):
+            levels = tuple(compile_symbol(row[i]) for row in layout.layers.rows)
+            if not any(levels):
+                continue
+            base_level = levels[Layer.BASE]
+            alpha = bool(
+                base_level
+                and not base_level.dead_key
+                and base_level.char.upper() != base_level.char
+            )
+            self.keys[key_name] = CompiledKey(key_name, levels, alpha)
+
+    def is_current(self, layout: "KeyboardLayout") -> bool:
+        """Check that the layers and dead keys of the layout are unchanged.
+        Layers have a revision number; dead key tables are plain dicts."""
+        if self.revision != layout.layers.revision:
+            return False
+        # same dead keys, in the same order, with the same tables
+        return list(self.dead_key_tables.items()) == list(layout.dead_keys.items())
+
+    def level(self, key_name: str, layer: Layer) -> Optional[CompiledSymbol]:
+        """A key level, None if it is unassigned."""
+        key = self.keys.get(key_name)
+        return key.levels[layer] if key else None
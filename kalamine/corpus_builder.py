@@ -0,0 +1,325 @@
+"""
+Corpus builder: symbol, bigram and trigram frequencies of raw text files,
+in the `www/corpus/*.json` format used by the layout analyzers.
+
+Text files are streamed in chunks, so that multi-GB dumps can be processed
+with bounded memory: n-gram tables are pruned to their most frequent entries
+when they grow too large, which only affects the long tail. Large plain text
+files are split into shards (at line boundaries) that can be processed in
+parallel; gzipped files are processed as a single shard each.
+
+Corpora can also be written in a compact binary format (`*.kcorpus`), which
+the analyzers can read without parsing: see `write_binary_corpus`.
+
+This module MUST only depend on the standard library, as it is also loaded
+by the build hook, outside of the `kalamine` package.
+"""
+
+import codecs
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    IO,
+    BinaryIO,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+CHUNK_SIZE = 1 << 20  # characters (or bytes, for plain text shards)
+SHARD_SIZE = 64 << 20  # bytes
+MAX_NGRAMS = 200_000  # entries per table, before pruning
+
+# frequency precision (decimals, in %) of each table, as in the shipped
+# corpora: less frequent symbols and n-grams are dropped
+TABLES = {"symbols": 3, "bigrams": 4, "trigrams": 3}
+
+WORDS = re.compile(r"\S+")
+LAST_WORD = re.compile(r"\s\S*\Z")  # and the whitespace before it
+
+# binary corpus format, little-endian, all sections are 4-byte aligned:
+#  - header: magic, format version, name size (bytes), alphabet size,
+#    number of symbols, bigrams and trigrams, and the digest of the JSON
+#    file the corpus has been converted from (see `source_digest`);
+#  - corpus name, UTF-8, zero-padded;
+#  - alphabet: uint32 code points;
+#  - symbols, bigrams, trigrams: uint32 indices in the alphabet (1, 2, 3 each);
+#  - symbol, bigram and trigram frequencies: float32, in %.
+BINARY_MAGIC = b"KCRP"
+BINARY_FORMAT = 2  # bump this when the binary layout changes
+BINARY_HEADER = struct.Struct("<4s6I16s")
+BINARY_SUFFIX = ".kcorpus"
+
+
+class Shard(NamedTuple):
+    """A part of a text file: a range of bytes, or the whole file."""
+
+    path: Path
+    start: int = 0
+    end: Optional[int] = None
+
+
+class NgramCounts(NamedTuple):
+    """Symbol, bigram and trigram counts, by table name (see TABLES).
+
+    Totals include the pruned entries, so that frequencies are not biased
+    by pruning.
+    """
+
+    tables: Dict[str, Counter]
+    totals: Counter
+
+    @classmethod
+    def empty(cls) -> "NgramCounts":
+        return cls({name: Counter() for name in TABLES}, Counter())
+
+    def update(self, other: "NgramCounts", max_entries: int = MAX_NGRAMS) -> None:
+        """Add the counts of another text."""
+        for name, table in self.tables.items():
+            table.update(other.tables[name])
+            prune(table, max_entries)
+        self.totals.update(other.totals)
+
+    def frequencies(self) -> Dict[str, Dict[str, float]]:
+        """Rounded frequencies (%) of each table, most frequent first."""
+        rv: Dict[str, Dict[str, float]] = {}
+        for name, precision in TABLES.items():
+            total = self.totals[name]
+            rv[name] = {}
+            for ngram, count in self.tables[name].most_common():
+                frequency = round(count * 100 / total, precision)
+                if not frequency:
+                    break
+                rv[name][ngram] = frequency
+        return rv
+
+
+def prune(table: Counter, max_entries: int) -> None:
+    """Keep the most frequent entries only, when a table grows too large."""
+    if len(table) > max_entries:
+        kept = table.most_common(max_entries // 2)
+        table.clear()
+        table.update(dict(kept))
+
+
+def open_text(path: Path) -> IO[str]:
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8-sig", errors="replace")
+    return path.open("r", encoding="utf-8-sig", errors="replace")
+
+
+def shards(paths: Iterable[Path], shard_size: int = SHARD_SIZE) -> Iterator[Shard]:
+    """Split plain text files in shards of about `shard_size` bytes."""
+    for path in paths:
+        size = path.stat().st_size
+        if path.suffix == ".gz" or size <= shard_size:
+            yield Shard(path)
+            continue
+        for start in range(0, size, shard_size):
+            yield Shard(path, start, min(start + shard_size, size))
+
+
+def read_chunks(shard: Shard, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Text of a shard, chunk by chunk.
+
+    A shard begins after the first line break before its start offset and
+    ends with the line that contains its end offset, so that each line
+    belongs to exactly one shard.
+    """
+    if shard.end is None:
+        with open_text(shard.path) as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+        return
+
+    with shard.path.open("rb") as file:
+        if shard.start:
+            file.seek(shard.start - 1)
+            file.readline()  # the end of this line belongs to the previous shard
+        elif file.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+            file.seek(0)  # no BOM: as with `utf-8-sig`, only skipped at the start
+        while file.tell() < shard.end:
+            data = file.read(min(chunk_size, shard.end - file.tell()))
+            if not data.endswith(b"\n"):  # don't split lines, nor UTF-8 chars
+                data += file.readline()
+            yield data.decode("utf-8", errors="replace")
+
+
+def count_words(words: Dict[str, int]) -> NgramCounts:
+    """Count the symbols and n-grams of words (sequences of non-space chars)."""
+
+    counts = NgramCounts.empty()
+    for n, (name, table) in enumerate(counts.tables.items(), 1):
+        for word, count in words.items():
+            windows = len(word) - n + 1
+            for i in range(windows):
+                table[word[i : i + n]] += count
+            if windows > 0:
+                counts.totals[name] += windows * count
+    return counts
+
+
+def count_text(
+    chunks: Iterable[str], lowercase: bool = True, max_entries: int = MAX_NGRAMS
+) -> NgramCounts:
+    """Count the symbols and n-grams of a text. Whitespace is not counted:
+    n-grams are sequences of symbols within a word or a punctuated group.
+
+    Words are counted first, as they are much less numerous than n-grams in
+    natural languages; each distinct word is then split into n-grams.
+    """
+
+    counts = NgramCounts.empty()
+    rest = ""  # last word of the previous chunk, which may be incomplete
+    for chunk in chunks:
+        text = rest + (chunk.lower() if lowercase else chunk)
+        # the last word is usually short: look for it at the end of the text first
+        last_word = LAST_WORD.search(text, max(len(text) - 256, 0))
+        last_word = last_word or LAST_WORD.search(text)
+        split = last_word.start() + 1 if last_word else 0
+        if not split and len(text) > CHUNK_SIZE:  # not a natural language...
+            split = len(text)
+        words = Counter(WORDS.findall(text, 0, split))
+        rest = text[split:]
+        counts.update(count_words(words), max_entries)
+    counts.update(count_words(Counter(WORDS.findall(rest))), max_entries)
+    return counts
+
+
+def count_shard(
+    shard: Shard, lowercase: bool = True, max_entries: int = MAX_NGRAMS
+) -> NgramCounts:
+    return count_text(read_chunks(shard), lowercase, max_entries)
+
+
+def build_corpus(
+    paths: List[Path],
+    jobs: int = 1,
+    lowercase: bool = True,
+    max_entries: int = MAX_NGRAMS,
+    shard_size: int = SHARD_SIZE,
+) -> Dict:
+    """Symbol, bigram and trigram frequencies of text files (plain or gzipped).
+
+    With several jobs, file shards are counted in parallel processes; memory
+    usage is bounded by the chunk size and by `max_entries`, in each process.
+    """
+
+    counts = NgramCounts.empty()
+    if jobs == 1:
+        for shard in shards(paths, shard_size):
+            counts.update(count_shard(shard, lowercase, max_entries), max_entries)
+    else:
+        # a few shards per process at most are pending, to bound memory usage
+        workers = jobs or os.cpu_count() or 1
+        pending: Deque[Future] = deque()
+        with ProcessPoolExecutor(workers) as pool:
+            for shard in shards(paths, shard_size):
+                pending.append(pool.submit(count_shard, shard, lowercase, max_entries))
+                if len(pending) >= 2 * workers:
+                    counts.update(pending.popleft().result(), max_entries)
+            while pending:
+                counts.update(pending.popleft().result(), max_entries)
+
+    return {
+        "corpus": ", ".join(path.name for path in paths),
+        **counts.frequencies(),
+    }
+
+
+def write_corpus(corpus: Dict, file: IO[str]) -> None:
+    json.dump(corpus, file, indent=4, ensure_ascii=False)
+    file.write("\n")
+
+
+def source_digest(content: bytes) -> bytes:
+    """Digest of a JSON corpus file, stored in the header of binary corpora
+    to detect the ones that are out of date."""
+    return hashlib.sha256(content).digest()[:16]
+
+
+def is_up_to_date(binary: Union[bytes, mmap.mmap], source: bytes) -> bool:
+    """Check that a binary corpus has been converted from a JSON file content,
+    in the current binary format."""
+    if len(binary) < BINARY_HEADER.size:
+        return False
+    magic, version, *_, digest = BINARY_HEADER.unpack_from(binary)
+    return (
+        magic == BINARY_MAGIC
+        and version == BINARY_FORMAT
+        and digest == source_digest(source)
+    )
+
+
+def write_binary_corpus(corpus: Dict, file: BinaryIO, digest: bytes = b"") -> None:
+    """Write a corpus (`www/corpus/*.json` data) in the binary format.
+
+    N-grams are stored as indices in an alphabet of interned symbols: each
+    symbol and n-gram must consist of 1, 2 or 3 code points. `digest` is the
+    `source_digest` of the JSON file, if the corpus comes from one.
+    """
+
+    alphabet: Dict[str, int] = {}
+    indices: List[array] = []
+    frequencies: List[array] = []
+    for n, name in enumerate(TABLES, 1):
+        table = corpus.get(name, {})
+        for ngram in table:
+            if len(ngram) != n:
+                raise ValueError(f"invalid {name[:-1]}: {ngram!r}")
+        indices.append(
+            array("I", (alphabet.setdefault(c, len(alphabet)) for c in "".join(table)))
+        )
+        frequencies.append(array("f", table.values()))
+
+    name = corpus.get("corpus", "").encode("utf-8")
+    name += bytes(-len(name) % 4)
+    counts = [len(values) for values in frequencies]
+    sections = [array("I", map(ord, alphabet)), *indices, *frequencies]
+    if sys.byteorder == "big":
+        for section in sections:
+            section.byteswap()
+
+    file.write(
+        BINARY_HEADER.pack(
+            BINARY_MAGIC, BINARY_FORMAT, len(name), len(alphabet), *counts, digest
+        )
+    )
+    file.write(name)
+    for section in sections:
+        section.tofile(file)
+
+
+def convert_corpus(json_path: Path) -> Path:
+    """Convert a JSON corpus to the binary format, next to it."""
+    content = json_path.read_bytes()
+    corpus = json.loads(content.decode("utf-8"))
+    path = json_path.with_suffix(BINARY_SUFFIX)
+    with path.open("wb") as file:
+        write_binary_corpus(corpus, file, source_digest(content))
+    return path
+
+
+def write_binary_corpora(corpus_dir: Path) -> List[Path]:
+    """Convert all JSON corpora of a directory, and return the binary files."""
+    return [convert_corpus(path) for path in sorted(corpus_dir.glob("*.json"))]
+
+
+if __name__ == "__main__":
+    for path in write_binary_corpora(Path(__file__).parent / "www" / "corpus"):
+        print(path)
@@ -0,0 +1,88 @@
+"""
+Compiled cache for the YAML data files in `kalamine/data`.
+
+Parsing YAML is the most expensive part of kalamine's startup, so the wheel
+ships a pickled copy of every data file, built by `hatch_build.py`. Each entry
+records the SHA-256 of its YAML source: a stale or missing entry is ignored and
+the YAML file is parsed instead.
+
+This module MUST only depend on the standard library and PyYAML, as it is also
+loaded by the build hook, outside of the `kalamine` package.
+"""
+
+import hashlib
+import pickle
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+CACHE_FORMAT = 1  # bump this when the cache layout changes
+CACHE_FILE = "data.pickle"
+
+Entry = Tuple[str, bytes]  # (source digest, pickled data)
+
+
+def yaml_load(source: bytes) -> Any:
+    """Parse YAML data, with the libyaml bindings if they are available."""
+    import yaml  # only needed when the cache is missing or outdated
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return yaml.load(source, Loader=loader)
+
+
+def source_digest(source: bytes) -> str:
+    return hashlib.sha256(source).hexdigest()
+
+
+def compile_entry(source: bytes) -> Entry:
+    data = yaml_load(source) if source else {}
+    return source_digest(source), pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+
+def compile_data(data_dir: Path) -> bytes:
+    """Compile all YAML files of a directory into a cache blob."""
+    entries = {
+        path.stem: compile_entry(path.read_bytes())
+        for path in sorted(data_dir.glob("*.yaml"))
+    }
+    return pickle.dumps({"format": CACHE_FORMAT, "entries": entries})
+
+
+def write_cache(data_dir: Path) -> Path:
+    """(Re)build the cache file of a data directory and return its path."""
+    cache_path = data_dir / CACHE_FILE
+    cache_path.write_bytes(compile_data(data_dir))
+    return cache_path
+
+
+class DataCache:
+    """Pre-parsed data files, with a fallback to the YAML sources."""
+
+    def __init__(
+        self,
+        read_source: Callable[[str], Optional[bytes]],
+        cache: Optional[bytes] = None,
+    ) -> None:
+        self._read_source = read_source
+        self._compiled: Dict[str, Entry] = {}
+        self._loaded: Dict[str, bytes] = {}
+        if cache:
+            try:
+                content = pickle.loads(cache)
+                if content["format"] == CACHE_FORMAT:
+                    self._compiled = content["entries"]
+            except Exception:  # corrupted or outdated cache: ignore it
+                pass
+
+    def load(self, name: str) -> Any:
+        """Return a fresh copy of the `name` data file contents."""
+        if name not in self._loaded:
+            source = self._read_source(name) or b""
+            entry = self._compiled.get(name)
+            if entry is None or entry[0] != source_digest(source):
+                entry = compile_entry(source)
+            self._loaded[name] = entry[1]
+        return pickle.loads(self._loaded[name])
+
+
+if __name__ == "__main__":
+    print(write_cache(Path(__file__).parent / "data"))
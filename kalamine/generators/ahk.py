@@ -6,13 +6,14 @@ FWIW, PKL and EPKL still rely on AHK 1.1, too.
 """
 
 import json
-from typing import TYPE_CHECKING, Dict, List
+from typing import TYPE_CHECKING, Dict, Iterator, List, TextIO
 
 if TYPE_CHECKING:
     from ..layout import KeyboardLayout
 
-from ..template import load_tpl, substitute_lines
-from ..utils import LAYER_KEYS, SCAN_CODES, Layer, load_data
+from ..template import tpl_chunks, write_chunks
+from ..utils import LAYER_KEYS, Layer
+from .windows import LEVELS, windows_keymap
 
 
 def ahk_keymap(layout: "KeyboardLayout", altgr: bool = False) -> List[str]:
@@ -27,15 +28,13 @@ def ahk_keymap(layout: "KeyboardLayout", altgr: bool = False) -> List[str]:
             return f"U+{ord(key):04x}" if (esc_all or key in specials) else key
         return f"{key}`" if key.endswith("`") else key  # deadkey identifier
 
+    compiled = layout.compiled
+    keymap = windows_keymap(layout)
+    space_actions = [(id, dk.terminator) for id, dk in compiled.dead_keys.items()]
+
     def ahk_actions(symbol: str) -> Dict[str, str]:
-        actions = {}
-        for key, dk in layout.dead_keys.items():
-            dk_id = ahk_escape(key)
-            if symbol == "spce":
-                actions[dk_id] = ahk_escape(dk[" "])
-            elif symbol in dk:
-                actions[dk_id] = ahk_escape(dk[symbol])
-        return actions
+        combos = space_actions if symbol == "spce" else compiled.combos.get(symbol, [])
+        return {ahk_escape(id): ahk_escape(output) for id, output in combos}
 
     output = []
     for key_name in LAYER_KEYS:
@@ -47,19 +46,20 @@ def ahk_keymap(layout: "KeyboardLayout", altgr: bool = False) -> List[str]:
         if key_name in ["ae13", "ab11"]:  # ABNT / JIS keys
             continue  # these two keys are not supported yet
 
-        sc = f"SC{SCAN_CODES['klc'][key_name]}"
+        key = keymap.keys[key_name]
+        sc = f"SC{key.scan_code}"
         for i in (
             [Layer.ALTGR, Layer.ALTGR_SHIFT] if altgr else [Layer.BASE, Layer.SHIFT]
         ):
-            layer = layout.layers[i]
-            if key_name not in layer:
+            level = key.levels[LEVELS.index(i)]
+            if not level:
                 continue
 
-            symbol = layer[key_name]
+            symbol = level.symbol
             sym = ahk_escape(symbol)
 
-            if symbol in layout.dead_keys:
-                actions = {sym: layout.dead_keys[symbol][symbol]}
+            if level.dead_key:
+                actions = {sym: compiled.dead_keys[symbol].alt_self}
             elif key_name == "spce":
                 actions = ahk_actions(key_name)
             else:
@@ -80,8 +80,8 @@ def ahk_shortcuts(layout: "KeyboardLayout") -> List[str]:
 
     prefixes = [" ^", "^+"]
     enabled = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    qwerty_vk = load_data("qwerty_vk")
 
+    keymap = windows_keymap(layout)
     output = []
     for key_name in LAYER_KEYS:
         if key_name.startswith("-"):
@@ -92,17 +92,18 @@ def ahk_shortcuts(layout: "KeyboardLayout") -> List[str]:
         if key_name in ["ae13", "ab11"]:  # ABNT / JIS keys
             continue  # these two keys are not supported yet
 
-        scan_code = SCAN_CODES["klc"][key_name]
+        key = keymap.keys[key_name]
         for i in [Layer.BASE, Layer.SHIFT]:
-            layer = layout.layers[i]
-            if key_name not in layer:
+            level = key.levels[LEVELS.index(i)]
+            if not level:
                 continue
 
-            symbol = layer[key_name]
-            if layout.qwerty_shortcuts:
-                symbol = qwerty_vk[scan_code]
+            symbol = level.symbol
+            if layout.qwerty_shortcuts and key.virtual_key:  # qwerty virtual key
+                symbol = key.virtual_key
             if symbol in enabled:
-                output.append(f"{prefixes[i]}SC{scan_code}::Send {prefixes[i]}{symbol}")
+                sc = f"SC{key.scan_code}"
+                output.append(f"{prefixes[i]}{sc}::Send {prefixes[i]}{symbol}")
 
         if output[-1]:
             output.append("")
@@ -110,13 +111,21 @@ def ahk_shortcuts(layout: "KeyboardLayout") -> List[str]:
     return output
 
 
+def _ahk_chunks(layout: "KeyboardLayout") -> Iterator[str]:
+    # fmt: off
+    return tpl_chunks(layout, ".ahk", lines={
+        "LAYOUT":    ahk_keymap(layout),
+        "ALTGR":     ahk_keymap(layout, True),
+        "SHORTCUTS": ahk_shortcuts(layout),
+    })
+    # fmt: on
+
+
 def ahk(layout: "KeyboardLayout") -> str:
     """Windows AHK driver"""
+    return "".join(_ahk_chunks(layout))
 
-    # fmt: off
-    out = load_tpl(layout, ".ahk")
-    out = substitute_lines(out, "LAYOUT",    ahk_keymap(layout))
-    out = substitute_lines(out, "ALTGR",     ahk_keymap(layout, True))
-    out = substitute_lines(out, "SHORTCUTS", ahk_shortcuts(layout))
-    # fmt: on
-    return out
+
+def write_ahk(layout: "KeyboardLayout", fp: TextIO) -> None:
+    """Windows AHK driver, streamed to a text file (BOM not included)"""
+    write_chunks(fp, _ahk_chunks(layout))
@@ -3,13 +3,13 @@ macOS: keylayout output
 https://developer.apple.com/library/content/technotes/tn2056/
 """
 
-from typing import TYPE_CHECKING, List, Tuple
+from typing import TYPE_CHECKING, Iterator, List, TextIO, Tuple
 
 if TYPE_CHECKING:
     from ..layout import KeyboardLayout
 
-from ..template import load_tpl, substitute_lines
-from ..utils import DK_INDEX, LAYER_KEYS, SCAN_CODES, Layer, hex_ord
+from ..template import tpl_chunks, write_chunks
+from ..utils import LAYER_KEYS, SCAN_CODES, Layer, hex_ord
 
 
 def _xml_proof(char: str) -> str:
@@ -28,21 +28,18 @@ def macos_keymap(layout: "KeyboardLayout") -> List[List[str]]:
     if layout.qwerty_shortcuts:
         print("WARN: keeping qwerty shortcuts is not yet supported for MacOS")
 
+    compiled = layout.compiled
+
+    def has_dead_keys(letter: str) -> bool:
+        if letter in "\u0020\u00a0\u202f":  # space
+            return True
+        return letter in compiled.combos
+
+    layers = [Layer.BASE, Layer.SHIFT, Layer.BASE, Layer.ALTGR, Layer.ALTGR_SHIFT]
     ret_str = []
-    for index in range(5):
-        layer = layout.layers[
-            [Layer.BASE, Layer.SHIFT, Layer.BASE, Layer.ALTGR, Layer.ALTGR_SHIFT][index]
-        ]
+    for index, layer in enumerate(layers):
         caps = index == 2
 
-        def has_dead_keys(letter: str) -> bool:
-            if letter in "\u0020\u00a0\u202f":  # space
-                return True
-            for k in layout.dead_keys:
-                if letter in layout.dead_keys[k]:
-                    return True
-            return False
-
         output: List[str] = []
         for key_name in LAYER_KEYS:
             if key_name in ["ae13", "ab11"]:  # ABNT / JIS keys
@@ -57,10 +54,11 @@ def macos_keymap(layout: "KeyboardLayout") -> List[List[str]]:
             symbol = "&#x0010;"
             final_key = True
 
-            if key_name in layer:
-                key = layer[key_name]
-                if key in layout.dead_keys:
-                    symbol = f"dead_{DK_INDEX[key].name}"
+            level = compiled.level(key_name, layer)
+            if level:
+                key = level.symbol
+                if level.dead_key:
+                    symbol = f"dead_{compiled.dead_keys[key].name}"
                     final_key = False
                 else:
                     symbol = _xml_proof(key.upper() if caps else key)
@@ -82,12 +80,14 @@ def macos_keymap(layout: "KeyboardLayout") -> List[List[str]]:
 def macos_actions(layout: "KeyboardLayout") -> List[str]:
     """macOS layout, dead key actions."""
 
+    compiled = layout.compiled
+    dead_keys = compiled.dead_keys
     ret_actions = []
 
     def when(state: str, action: str) -> str:
         state_attr = f'state="{state}"'.ljust(18)
-        if action in layout.dead_keys:
-            action_attr = f'next="{DK_INDEX[action].name}"'
+        if action in dead_keys:
+            action_attr = f'next="{dead_keys[action].name}"'
         elif action.startswith("dead_"):
             action_attr = f'next="{action[5:]}"'
         else:
@@ -102,16 +102,15 @@ def macos_actions(layout: "KeyboardLayout") -> List[str]:
         ret_actions.append("</action>")
 
     # dead key definitions
-    for key in layout.dead_keys:
-        name = DK_INDEX[key].name
-        term = layout.dead_keys[key][key]
+    for dead_key in dead_keys.values():
+        name = dead_key.name
+        term = dead_key.alt_self
         ret_actions.append(f'<action id="dead_{name}">')
         ret_actions.append(f'  <when state="none" next="{name}" />')
-        if name == "1dk" and term in layout.dead_keys:
-            nested_dk = DK_INDEX[term].name
+        if name == "1dk" and term in dead_keys:
+            nested_dk = dead_keys[term].name
             ret_actions.append(f'  <when state="1dk" next="{nested_dk}" />')
         ret_actions.append("</action>")
-        continue
 
     # normal key actions
     for key_name in LAYER_KEYS:
@@ -120,29 +119,28 @@ def macos_actions(layout: "KeyboardLayout") -> List[str]:
             ret_actions.append(f"<!--{key_name[1:]} -->")
             continue
 
-        for i in [Layer.BASE, Layer.SHIFT, Layer.ALTGR, Layer.ALTGR_SHIFT]:
-            if key_name == "spce" or key_name not in layout.layers[i]:
-                continue
+        compiled_key = compiled.keys.get(key_name)
+        if key_name == "spce" or not compiled_key:
+            continue
 
-            key = layout.layers[i][key_name]
-            if i and key == layout.layers[Layer.BASE][key_name]:
+        base = compiled_key.levels[Layer.BASE]
+        for i in [Layer.BASE, Layer.SHIFT, Layer.ALTGR, Layer.ALTGR_SHIFT]:
+            level = compiled_key.levels[i]
+            if not level or level.dead_key:
                 continue
-            if key in layout.dead_keys:
+            if i and base and level.symbol == base.symbol:
                 continue
 
-            actions: List[Tuple[str, str]] = []
-            for k in DK_INDEX:
-                if k in layout.dead_keys:
-                    if key in layout.dead_keys[k]:
-                        actions.append((DK_INDEX[k].name, layout.dead_keys[k][key]))
+            key = level.symbol
+            actions: List[Tuple[str, str]] = [
+                (dead_keys[k].name, output)
+                for k, output in compiled.combos.get(key, [])
+            ]
             if actions:
                 append_actions(key_name, _xml_proof(key), actions)
 
     # spacebar actions
-    actions = []
-    for k in DK_INDEX:
-        if k in layout.dead_keys:
-            actions.append((DK_INDEX[k].name, layout.dead_keys[k][" "]))
+    actions = [(dead_key.name, dead_key.terminator) for dead_key in dead_keys.values()]
     append_actions("spce", "&#x0020;", actions)  # space
     append_actions("spce", "&#x00a0;", actions)  # no-break space
     append_actions("spce", "&#x202f;", actions)  # fine no-break space
@@ -153,27 +151,31 @@ def macos_actions(layout: "KeyboardLayout") -> List[str]:
 def macos_terminators(layout: "KeyboardLayout") -> List[str]:
     """macOS layout, dead key terminators."""
 
+    dead_keys = layout.compiled.dead_keys
     ret_terminators = []
-    for key in DK_INDEX:
-        if key not in layout.dead_keys:
-            continue
-        dk = layout.dead_keys[key]
-        name = DK_INDEX[key].name
-        term = dk[key]
-        if name == "1dk" and term in layout.dead_keys:
-            term = dk[" "]
+    for dead_key in dead_keys.values():
+        name = dead_key.name
+        term = dead_key.alt_self
+        if name == "1dk" and term in dead_keys:
+            term = dead_key.terminator
         state = f'state="{name}"'.ljust(18)
         output = f'output="{_xml_proof(term)}"'
         ret_terminators.append(f"<when {state} {output} />")
     return ret_terminators
 
 
+def _keylayout_chunks(layout: "KeyboardLayout") -> Iterator[str]:
+    lines = {"LAYER_" + str(i): layer for i, layer in enumerate(macos_keymap(layout))}
+    lines["ACTIONS"] = macos_actions(layout)
+    lines["TERMINATORS"] = macos_terminators(layout)
+    return tpl_chunks(layout, ".keylayout", lines=lines)
+
+
 def keylayout(layout: "KeyboardLayout") -> str:
     """macOS driver"""
+    return "".join(_keylayout_chunks(layout))
+
 
-    out = load_tpl(layout, ".keylayout")
-    for i, layer in enumerate(macos_keymap(layout)):
-        out = substitute_lines(out, "LAYER_" + str(i), layer)
-    out = substitute_lines(out, "ACTIONS", macos_actions(layout))
-    out = substitute_lines(out, "TERMINATORS", macos_terminators(layout))
-    return out
+def write_keylayout(layout: "KeyboardLayout", fp: TextIO) -> None:
+    """macOS driver, streamed to a text file"""
+    write_chunks(fp, _keylayout_chunks(layout))
@@ -11,168 +11,58 @@ because they are not recognized by KBDEdit (as of v19.8.0).
 """
 
 import re
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Iterator, List, TextIO
 
 if TYPE_CHECKING:
     from ..layout import KeyboardLayout
 
-from ..template import load_tpl, substitute_lines, substitute_token
-from ..utils import DK_INDEX, LAYER_KEYS, SCAN_CODES, Layer, hex_ord, load_data
+from ..template import tpl_chunks, write_chunks
+from ..utils import hex_ord, load_data
+from .windows import WindowsKey, klc_wchar, windows_keymap
 
-
-# return the corresponding char for a symbol
-def _get_chr(symbol: str) -> str:
-    if len(symbol) > 1 and symbol.endswith("@"):
-        # remove dead key symbol for dict access
-        key = symbol[:-1]
-    else:
-        key = symbol
-
-    if len(symbol) == 4:
-        char = chr(int(key, base=16))
-    else:
-        char = symbol
-
-    return char
+WIN_LOCALES = load_data("win_locales")
 
 
 def _get_langid(locale: str) -> str:
-    locale_codes = load_data("win_locales")
-    if locale not in locale_codes:
+    if locale not in WIN_LOCALES:
         raise ValueError(f"`{locale}` is not a valid locale")
-    return locale_codes[locale]
-
-
-oem_idx = 0
-
-
-def klc_virtual_key(layout: "KeyboardLayout", symbols: list, scan_code: str) -> str:
-    oem_102_scan_code = "56"
-    if layout.angle_mod:
-        oem_102_scan_code = "30"
-    if scan_code == oem_102_scan_code:
-        # manage the ISO key (between shift and Z on ISO keyboards).
-        # We're assuming that its scancode is always 56
-        # https://www.win.tue.nl/~aeb/linux/kbd/scancodes.html
-        return "OEM_102"
-
-    base = _get_chr(symbols[0])
-    shifted = _get_chr(symbols[1])
-
-    # Can’t use `isdigit()` because `²` is a digit but we don't want that as a VK
-    allowed_digit = "0123456789"
-    # We assume that digit row always have digit as VK
-    if base in allowed_digit:
-        return base
-    elif shifted in allowed_digit:
-        return shifted
-
-    if shifted.isascii() and shifted.isalpha():
-        return shifted
-
-    # VK_OEM_* case
-    if base == "," or shifted == ",":
-        return "OEM_COMMA"
-    elif base == "." or shifted == ".":
-        return "OEM_PERIOD"
-    elif base == "+" or shifted == "+":
-        return "OEM_PLUS"
-    elif base == "-" or shifted == "-":
-        return "OEM_MINUS"
-    elif base == " ":
-        return "SPACE"
-    else:
-        MAX_OEM = 9
-        # We affect abitrary OEM VK and it will not match the one
-        # in distributed layout. It can cause issue if a application
-        # is awaiting a particular OEM_ for a hotkey
-        global oem_idx
-        oem_idx += 1
-        if oem_idx <= MAX_OEM:
-            return "OEM_" + str(oem_idx)
-        else:
-            raise Exception("Too many OEM keys")
+    return WIN_LOCALES[locale]
+
+
+def virtual_key(key: WindowsKey) -> str:
+    if key.virtual_key is None:
+        raise Exception("Too many OEM keys")
+    return key.virtual_key
 
 
 def klc_keymap(layout: "KeyboardLayout") -> List[str]:
     """Windows layout, main part."""
 
-    supported_symbols = "1234567890abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
-
-    global oem_idx
-    oem_idx = 0  # Python trick to do equivalent of C static variable
     output = []
-    qwerty_vk = load_data("qwerty_vk")
-
-    for key_name in LAYER_KEYS:
-        if key_name.startswith("-"):
-            continue
-
-        if key_name in ["ae13", "ab11"]:  # ABNT / JIS keys
-            continue  # these two keys are not supported yet
-
-        symbols = []
+    for key in windows_keymap(layout).keys.values():
+        symbols = [
+            klc_wchar(level, char) for level, char in zip(key.levels, key.wchars)
+        ]
         description = "//"
-        is_alpha = False
-
-        for i in [Layer.BASE, Layer.SHIFT, Layer.ALTGR, Layer.ALTGR_SHIFT]:
-            layer = layout.layers[i]
-
-            if key_name in layer:
-                symbol = layer[key_name]
-                desc = symbol
-                if symbol in layout.dead_keys:
-                    desc = layout.dead_keys[symbol][" "]
-                    symbol = hex_ord(desc) + "@"
-                else:
-                    if i == Layer.BASE:
-                        is_alpha = symbol.upper() != symbol
-                    if symbol not in supported_symbols:
-                        symbol = hex_ord(symbol)
-                symbols.append(symbol)
-            else:
-                desc = " "
-                symbols.append("-1")
-            description += " " + desc
-
-        scan_code = SCAN_CODES["klc"][key_name]
-
-        virtual_key = qwerty_vk[scan_code]
-        if not layout.qwerty_shortcuts:
-            virtual_key = klc_virtual_key(layout, symbols, scan_code)
-
+        for level in key.levels:
+            description += " " + (level.char if level else " ")
+
+        cols = [
+            key.scan_code,
+            virtual_key(key),
+            "1" if key.caps_lock else "0",  # affected by CapsLock?
+            symbols[0],
+            symbols[1],  # base layer
+            "-1",
+            "-1",  # ctrl layer
+        ]
         if layout.has_altgr:
-            output.append(
-                "\t".join(
-                    [
-                        scan_code,
-                        virtual_key,
-                        "1" if is_alpha else "0",  # affected by CapsLock?
-                        symbols[0],
-                        symbols[1],  # base layer
-                        "-1",
-                        "-1",  # ctrl layer
-                        symbols[2],
-                        symbols[3],  # altgr layer
-                        description.strip(),
-                    ]
-                )
-            )
-        else:
-            output.append(
-                "\t".join(
-                    [
-                        scan_code,
-                        virtual_key,
-                        "1" if is_alpha else "0",  # affected by CapsLock?
-                        symbols[0],
-                        symbols[1],  # base layer
-                        "-1",
-                        "-1",  # ctrl layer
-                        description.strip(),
-                    ]
-                )
-            )
+            cols += [
+                symbols[2],
+                symbols[3],  # altgr layer
+            ]
+        cols.append(description.strip())
+        output.append("\t".join(cols))
 
     return output
 
@@ -181,28 +71,12 @@ def klc_deadkeys(layout: "KeyboardLayout") -> List[str]:
     """Windows layout, dead keys."""
 
     output = []
+    for dead_key in windows_keymap(layout).dead_keys.values():
+        output.append(f"// DEADKEY: {dead_key.name.upper()} //" + "{{{")
+        output.append(f"DEADKEY\t{hex_ord(dead_key.terminator)}")
 
-    for k in DK_INDEX:
-        if k not in layout.dead_keys:
-            continue
-        dk = layout.dead_keys[k]
-
-        output.append(f"// DEADKEY: {DK_INDEX[k].name.upper()} //" + "{{{")
-        output.append(f"DEADKEY\t{hex_ord(dk[' '])}")
-
-        for base, alt in dk.items():
-            if base == k and alt in base:
-                continue
-
-            if base in layout.dead_keys:
-                base = layout.dead_keys[base][" "]
-
-            if alt in layout.dead_keys:
-                alt = layout.dead_keys[alt][" "]
-                ext = hex_ord(alt) + "@"
-            else:
-                ext = hex_ord(alt)
-
+        for base, alt, chained in dead_key.transitions:
+            ext = hex_ord(alt) + ("@" if chained else "")
             output.append(f"{hex_ord(base)}\t{ext}\t// {base} -> {alt}")
 
         output.append("//}}}")
@@ -215,108 +89,58 @@ def klc_dk_index(layout: "KeyboardLayout") -> List[str]:
     """Windows layout, dead key index."""
 
     output = []
-    for k in DK_INDEX:
-        if k not in layout.dead_keys:
-            continue
-        dk = layout.dead_keys[k]
-        output.append(f'{hex_ord(dk[" "])}\t"{DK_INDEX[k].name.upper()}"')
+    for dead_key in windows_keymap(layout).dead_keys.values():
+        name = dead_key.name.upper()
+        output.append(f'{hex_ord(dead_key.terminator)}\t"{name}"')
     return output
 
 
 def c_keymap(layout: "KeyboardLayout") -> List[str]:
     """Windows C layout, main part."""
 
-    supported_symbols = "1234567890abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    qwerty_vk = load_data("qwerty_vk")
+    def process_symbol(symbol: str) -> str:
+        if len(symbol) == 4:
+            return f"0x{symbol}"
+        if len(symbol) == 1:
+            return f"'{symbol}'"
+        return symbol
+
+    def key_list(key_syms: List[str], virt_key: str, is_alpha: bool) -> str:
+        cols = [
+            virt_key,
+            "CAPLOK" if is_alpha else "0",  # affected by CapsLock?
+            key_syms[0],
+            key_syms[1],  # base layer
+            "WCH_NONE",
+            "WCH_NONE",  # ctrl layer
+        ]
+        if layout.has_altgr:
+            cols += [
+                key_syms[2],
+                key_syms[3],
+            ]
+        return "\t,".join(cols)
 
-    global oem_idx
-    oem_idx = 0  # Python trick to do equivalent of C static variable
     output = []
-    for key_name in LAYER_KEYS:
-        if key_name.startswith("-"):
-            continue
-
-        if key_name in ["ae13", "ab11"]:  # ABNT / JIS keys
-            continue  # these two keys are not supported yet
-
+    for key in windows_keymap(layout).keys.values():
         symbols = []
         dead_symbols = []
-        is_alpha = False
-        has_dead_key = False
-
-        for i in [Layer.BASE, Layer.SHIFT, Layer.ALTGR, Layer.ALTGR_SHIFT]:
-            layer = layout.layers[i]
-
-            if key_name in layer:
-                symbol = layer[key_name]
-                desc = symbol
-                dead = "WCH_NONE"
-                if symbol in layout.dead_keys:
-                    desc = layout.dead_keys[symbol][" "]
-                    symbol = "WCH_DEAD"
-                    dead = hex_ord(desc)
-                    has_dead_key = True
-                else:
-                    if i == Layer.BASE:
-                        is_alpha = symbol.upper() != symbol
-                    if symbol not in supported_symbols:
-                        symbol = hex_ord(symbol)
-                symbols.append(symbol)
-                dead_symbols.append(dead)
-            else:
-                desc = " "
+        for level, char in zip(key.levels, key.wchars):
+            if not level or char is None:
                 symbols.append("WCH_NONE")
                 dead_symbols.append("WCH_NONE")
+            elif level.dead_key:
+                symbols.append("WCH_DEAD")
+                dead_symbols.append(process_symbol(char))
+            else:
+                symbols.append(process_symbol(char))
+                dead_symbols.append("WCH_NONE")
 
-        scan_code = SCAN_CODES["klc"][key_name]
-
-        virtual_key = qwerty_vk[scan_code]
-        if not layout.qwerty_shortcuts:
-            virtual_key = klc_virtual_key(layout, symbols, scan_code)
-
-        if len(virtual_key) == 1:
-            virtual_key_id = f"'{virtual_key}'"
-        else:
-            virtual_key_id = f"VK_{virtual_key}"
-
-        def process_symbol(symbol: str) -> str:
-            if len(symbol) == 4:
-                return f"0x{symbol}"
-            if len(symbol) == 1:
-                return f"'{symbol}'"
-            return symbol
-
-        symbols[:] = [process_symbol(symbol) for symbol in symbols]
-        dead_symbols[:] = [process_symbol(symbol) for symbol in dead_symbols]
-
-        def key_list(
-            key_syms: List[str],
-            virt_key: str = "0xff",
-            has_altgr: bool = False,
-            is_alpha: bool = False,
-        ) -> str:
-            cols = [
-                virt_key,
-                "CAPLOK" if is_alpha else "0",  # affected by CapsLock?
-                key_syms[0],
-                key_syms[1],  # base layer
-                "WCH_NONE",
-                "WCH_NONE",  # ctrl layer
-            ]
-            if has_altgr:
-                cols += [
-                    key_syms[2],
-                    key_syms[3],
-                ]
-            return "\t,".join(cols)
-
-        output.append(
-            f"\t{{{key_list(symbols, virtual_key_id, layout.has_altgr, is_alpha)}}},"
-        )
-        if has_dead_key:
-            output.append(
-                f"\t{{{key_list(dead_symbols, has_altgr=layout.has_altgr, is_alpha=is_alpha)}}},"
-            )
+        vk = virtual_key(key)
+        virtual_key_id = f"'{vk}'" if len(vk) == 1 else f"VK_{vk}"
+        output.append(f"\t{{{key_list(symbols, virtual_key_id, key.caps_lock)}}},")
+        if key.has_dead_key:
+            output.append(f"\t{{{key_list(dead_symbols, '0xff', key.caps_lock)}}},")
 
     return output
 
@@ -325,30 +149,14 @@ def c_deadkeys(layout: "KeyboardLayout") -> List[str]:
     """Windows C layout, dead keys."""
 
     output = []
+    for dead_key in windows_keymap(layout).dead_keys.values():
+        output.append(f"// DEADKEY: {dead_key.name.upper()}")
+        term = hex_ord(dead_key.terminator)
 
-    for k in DK_INDEX:
-        if k not in layout.dead_keys:
-            continue
-        dk = layout.dead_keys[k]
-
-        output.append(f"// DEADKEY: {DK_INDEX[k].name.upper()}")
-
-        for base, alt in dk.items():
-            if base == k and alt in base:
-                continue
-
-            if base in layout.dead_keys:
-                base = layout.dead_keys[base][" "]
-
-            if alt in layout.dead_keys:
-                alt = layout.dead_keys[alt][" "]
-                dead_alt = "0x0001"
-            else:
-                dead_alt = "0x0000"
-            ext = hex_ord(alt)
-
+        for base, alt, chained in dead_key.transitions:
+            dead_alt = "0x0001" if chained else "0x0000"
             output.append(
-                f"DEADTRANS(0x{hex_ord(base)}\t, 0x{hex_ord(dk[' '])}\t, 0x{ext}\t, {dead_alt}), /* {base} -> {alt} */"
+                f"DEADTRANS(0x{hex_ord(base)}\t, 0x{term}\t, 0x{hex_ord(alt)}\t, {dead_alt}), /* {base} -> {alt} */"
             )
 
         output.append("")
@@ -360,17 +168,13 @@ def c_dk_index(layout: "KeyboardLayout") -> List[str]:
     """Windows layout, dead key index."""
 
     output = []
-    for k in DK_INDEX:
-        if k not in layout.dead_keys:
-            continue
-        term = layout.dead_keys[k][" "]
-        output.append(f'L"\\\\x{hex_ord(term)}"\tL"{DK_INDEX[k].name.upper()}",')
+    for dead_key in windows_keymap(layout).dead_keys.values():
+        term = hex_ord(dead_key.terminator)
+        output.append(f'L"\\x{term}"\tL"{dead_key.name.upper()}",')
     return output
 
 
-def klc(layout: "KeyboardLayout") -> str:
-    """Windows driver (warning: requires CR/LF + UTF16LE encoding)"""
-
+def _klc_chunks(layout: "KeyboardLayout") -> Iterator[str]:
     if len(layout.meta["name8"]) > 8:
         raise ValueError("`name8` max length is 8 charaters")
 
@@ -383,30 +187,59 @@ def klc(layout: "KeyboardLayout") -> str:
     langid = _get_langid(locale)
 
     # fmt: off
-    out = load_tpl(layout, ".klc")
-    out = substitute_lines(out, "LAYOUT",         klc_keymap(layout))
-    out = substitute_lines(out, "DEAD_KEYS",      klc_deadkeys(layout))
-    out = substitute_lines(out, "DEAD_KEY_INDEX", klc_dk_index(layout))
-    out = substitute_token(out, "localeid",       f"0000{langid}")
-    out = substitute_token(out, "locale",         locale)
-    out = substitute_token(out, "encoding",       "utf-16le")
+    return tpl_chunks(layout, ".klc", lines={
+        "LAYOUT":         klc_keymap(layout),
+        "DEAD_KEYS":      klc_deadkeys(layout),
+        "DEAD_KEY_INDEX": klc_dk_index(layout),
+    }, tokens={
+        "localeid":       f"0000{langid}",
+        "locale":         locale,
+        "encoding":       "utf-16le",
+    })
     # fmt: on
-    return out
 
 
-def klc_rc(layout: "KeyboardLayout") -> str:
-    """Windows resource file for C drivers"""
-    out = load_tpl(layout, ".RC")
+def _klc_rc_chunks(layout: "KeyboardLayout") -> Iterator[str]:
     # version numbers are in "a,b,c,d" format
     version = layout.meta["version"].replace(".", ",")
-    out = substitute_token(out, "rc_version", version)
-    return out
+    return tpl_chunks(layout, ".RC", tokens={"rc_version": version})
+
+
+def _klc_c_chunks(layout: "KeyboardLayout") -> Iterator[str]:
+    # fmt: off
+    return tpl_chunks(layout, ".C", lines={
+        "LAYOUT":         c_keymap(layout),
+        "DEAD_KEYS":      c_deadkeys(layout),
+        "DEAD_KEY_INDEX": c_dk_index(layout),
+    })
+    # fmt: on
+
+
+def klc(layout: "KeyboardLayout") -> str:
+    """Windows driver (warning: requires CR/LF + UTF16LE encoding)"""
+    return "".join(_klc_chunks(layout))
+
+
+def klc_rc(layout: "KeyboardLayout") -> str:
+    """Windows resource file for C drivers"""
+    return "".join(_klc_rc_chunks(layout))
 
 
 def klc_c(layout: "KeyboardLayout") -> str:
     """Windows keymap file for C drivers"""
-    out = load_tpl(layout, ".C")
-    out = substitute_lines(out, "LAYOUT", c_keymap(layout))
-    out = substitute_lines(out, "DEAD_KEYS", c_deadkeys(layout))
-    out = substitute_lines(out, "DEAD_KEY_INDEX", c_dk_index(layout))
-    return out
+    return "".join(_klc_c_chunks(layout))
+
+
+def write_klc(layout: "KeyboardLayout", fp: TextIO) -> None:
+    """Windows driver, streamed to a text file (CR/LF + UTF16LE)"""
+    write_chunks(fp, _klc_chunks(layout))
+
+
+def write_klc_rc(layout: "KeyboardLayout", fp: TextIO) -> None:
+    """Windows resource file for C drivers, streamed to a text file"""
+    write_chunks(fp, _klc_rc_chunks(layout))
+
+
+def write_klc_c(layout: "KeyboardLayout", fp: TextIO) -> None:
+    """Windows keymap file for C drivers, streamed to a text file"""
+    write_chunks(fp, _klc_c_chunks(layout))
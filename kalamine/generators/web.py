@@ -6,54 +6,67 @@ https://github.com/OneDeadKey/x-keyboard
 
 import json
 import pkgutil
-from typing import TYPE_CHECKING, Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, TextIO
 from xml.etree import ElementTree as ET
 
 if TYPE_CHECKING:
     from ..layout import KeyboardLayout
 
-from ..utils import LAYER_KEYS, ODK_ID, SCAN_CODES, Layer, upper_key
+from .. import key_sequences
+from ..compiled import CompiledKey, CompiledSymbol
+from ..utils import ODK_ID, SCAN_CODES, Layer, upper_key
 
 
 # fmt: off
-def raw_json(layout: "KeyboardLayout") -> Dict:
-    """JSON layout descriptor"""
+def raw_json(layout: "KeyboardLayout", char_table: bool = False) -> Dict:
+    """JSON layout descriptor, with an optional table of the easiest key
+    sequence for each character: {char: [[key code, level], ...]}"""
 
     # flatten the keymap: each key has an array of 2-4 characters
     # correcponding to Base, Shift, AltGr, AltGr+Shift
+    compiled = layout.compiled
     keymap: Dict[str, List[str]] = {}
-    for key_name in LAYER_KEYS:
-        if key_name.startswith("-"):
-            continue
-        chars = list("")
-        for i in [Layer.BASE, Layer.SHIFT, Layer.ALTGR, Layer.ALTGR_SHIFT]:
-            if key_name in layout.layers[i]:
-                chars.append(layout.layers[i][key_name])
+    for key in compiled.keys.values():
+        chars = key.symbols(Layer.BASE, Layer.SHIFT, Layer.ALTGR, Layer.ALTGR_SHIFT)
         if chars:
-            keymap[SCAN_CODES["web"][key_name]] = chars
+            keymap[SCAN_CODES["web"][key.name]] = chars
+    deadkeys = {id: dead_key.table for id, dead_key in compiled.dead_keys.items()}
 
-    return {
+    descriptor = {
         "name":        layout.meta["name"],
         "description": layout.meta["description"],
         "geometry":    layout.meta["geometry"].lower(),
         "keymap":      keymap,
-        "deadkeys":    layout.dead_keys,
+        "deadkeys":    deadkeys,
         "altgr":       layout.has_altgr,
     }
+    if char_table:
+        descriptor["chars"] = key_sequences.char_table(keymap, deadkeys)
+    return descriptor
 # fmt: on
 
 
-def pretty_json(layout: "KeyboardLayout") -> str:
+def pretty_json(layout: "KeyboardLayout", char_table: bool = False) -> str:
     """Pretty-print the JSON layout."""
 
     return (
-        json.dumps(raw_json(layout), indent=2, ensure_ascii=False)
+        json.dumps(raw_json(layout, char_table), indent=2, ensure_ascii=False)
+        .replace("\n        ", " ")  # key sequences of the char table
         .replace("\n      ", " ")
         .replace("\n    ]", " ]")
         .replace("\n    }", " }")
     )
 
 
+def write_pretty_json(
+    layout: "KeyboardLayout", fp: TextIO, char_table: bool = False
+) -> None:
+    """Pretty-print the JSON layout to a text file."""
+
+    # the JSON descriptor is small, and its pretty-printing needs the whole text
+    fp.write(pretty_json(layout, char_table))
+
+
 def svg(layout: "KeyboardLayout") -> ET.ElementTree:
     """SVG drawing"""
 
@@ -61,11 +74,14 @@ def svg(layout: "KeyboardLayout") -> ET.ElementTree:
     ET.register_namespace("", svg_ns)
     ns = {"": svg_ns}
 
-    def set_key_label(key: Optional[ET.Element], lvl: int, char: str) -> None:
+    def set_key_label(
+        key: Optional[ET.Element], lvl: int, symbol: CompiledSymbol
+    ) -> None:
         if not key:
             return
+        char = symbol.symbol
         for label in key.findall(f'g/text[@class="level{lvl}"]', ns):
-            if char not in layout.dead_keys:
+            if not symbol.dead_key:
                 label.text = char
             else:  # only show last char for deadkeys
                 if char == ODK_ID:
@@ -76,12 +92,12 @@ def svg(layout: "KeyboardLayout") -> ET.ElementTree:
                     label.text = char[-1]
                 label.set("class", f"{label.get('class')} deadKey")
 
-    def same_symbol(key_name: str, lower: Layer, upper: Layer):
-        up = layout.layers[upper]
-        low = layout.layers[lower]
-        if key_name not in up or key_name not in low:
+    def same_symbol(key: CompiledKey, lower: Layer, upper: Layer):
+        up = key.levels[upper]
+        low = key.levels[lower]
+        if not up or not low:
             return False
-        return up[key_name] == upper_key(low[key_name], blank_if_obvious=False)
+        return up.symbol == upper_key(low.symbol, blank_if_obvious=False)
 
     # Parse the SVG template
     # res = pkgutil.get_data(__package__, "templates/x-keyboard.svg")
@@ -90,10 +106,7 @@ def svg(layout: "KeyboardLayout") -> ET.ElementTree:
         return ET.ElementTree()
     svg = ET.ElementTree(ET.fromstring(res.decode("utf-8")))
 
-    for key_name in LAYER_KEYS:
-        if key_name.startswith("-"):
-            continue
-
+    for compiled_key in layout.compiled.keys.values():
         level = 0
         for i in [
             Layer.BASE,
@@ -104,16 +117,18 @@ def svg(layout: "KeyboardLayout") -> ET.ElementTree:
             Layer.ODK_SHIFT,
         ]:
             level += 1
-            if key_name not in layout.layers[i]:
+            symbol = compiled_key.levels[i]
+            if not symbol:
                 continue
-            if level == 1 and same_symbol(key_name, Layer.BASE, Layer.SHIFT):
+            if level == 1 and same_symbol(compiled_key, Layer.BASE, Layer.SHIFT):
                 continue
-            if level == 4 and same_symbol(key_name, Layer.ALTGR, Layer.ALTGR_SHIFT):
+            if level == 4 and same_symbol(compiled_key, Layer.ALTGR, Layer.ALTGR_SHIFT):
                 continue
-            if level == 6 and same_symbol(key_name, Layer.ODK, Layer.ODK_SHIFT):
+            if level == 6 and same_symbol(compiled_key, Layer.ODK, Layer.ODK_SHIFT):
                 continue
 
-            key = svg.find(f'.//g[@id="{SCAN_CODES["web"][key_name]}"]', ns)
-            set_key_label(key, level, layout.layers[i][key_name])
+            key_id = SCAN_CODES["web"][compiled_key.name]
+            key = svg.find(f'.//g[@id="{key_id}"]', ns)
+            set_key_label(key, level, symbol)
 
     return svg
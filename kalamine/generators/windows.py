@@ -0,0 +1,213 @@
+"""
+Windows keymap model, shared by the KLC, C, RC and AHK outputs.
+
+Keys are resolved once per layout: scan code, virtual key, CapsLock flag,
+and the WCHAR of each level (base, shift, altgr, altgr+shift). Dead keys are
+resolved to their transitions, where nested dead keys are represented by
+their terminator.
+"""
+
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from ..layout import KeyboardLayout
+
+from ..compiled import CompiledSymbol
+from ..utils import LAYER_KEYS, SCAN_CODES, Layer, load_data
+
+QWERTY_VK = load_data("qwerty_vk")
+
+LEVELS = [Layer.BASE, Layer.SHIFT, Layer.ALTGR, Layer.ALTGR_SHIFT]
+
+# characters that can be used as such in KLC and C keymaps
+SUPPORTED_SYMBOLS = "1234567890abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+# return the corresponding char for a symbol
+def _get_chr(symbol: str) -> str:
+    if len(symbol) > 1 and symbol.endswith("@"):
+        # remove dead key symbol for dict access
+        key = symbol[:-1]
+    else:
+        key = symbol
+
+    if len(symbol) == 4:
+        char = chr(int(key, base=16))
+    else:
+        char = symbol
+
+    return char
+
+
+class VirtualKeys:
+    """Virtual key assignment of a Windows keymap, for a single keymap.
+
+    OEM virtual keys are allocated in key order: each keymap has its own
+    allocator, so that layouts can be processed concurrently.
+    """
+
+    MAX_OEM = 9
+
+    def __init__(self, layout: "KeyboardLayout") -> None:
+        self.layout = layout
+        self.oem_idx = 0
+
+    def get(self, symbols: List[str], scan_code: str) -> Optional[str]:
+        """Virtual key of a key, from its base and shift KLC symbols.
+        None if there are too many OEM keys."""
+
+        virtual_key = QWERTY_VK[scan_code]
+        if self.layout.qwerty_shortcuts:
+            return virtual_key
+
+        oem_102_scan_code = "56"
+        if self.layout.angle_mod:
+            oem_102_scan_code = "30"
+        if scan_code == oem_102_scan_code:
+            # manage the ISO key (between shift and Z on ISO keyboards).
+            # We're assuming that its scancode is always 56
+            # https://www.win.tue.nl/~aeb/linux/kbd/scancodes.html
+            return "OEM_102"
+
+        base = _get_chr(symbols[0])
+        shifted = _get_chr(symbols[1])
+
+        # Can’t use `isdigit()` because `²` is a digit but we don't want that as a VK
+        allowed_digit = "0123456789"
+        # We assume that digit row always have digit as VK
+        if base in allowed_digit:
+            return base
+        elif shifted in allowed_digit:
+            return shifted
+
+        if shifted.isascii() and shifted.isalpha():
+            return shifted
+
+        # VK_OEM_* case
+        if base == "," or shifted == ",":
+            return "OEM_COMMA"
+        elif base == "." or shifted == ".":
+            return "OEM_PERIOD"
+        elif base == "+" or shifted == "+":
+            return "OEM_PLUS"
+        elif base == "-" or shifted == "-":
+            return "OEM_MINUS"
+        elif base == " ":
+            return "SPACE"
+        else:
+            # We affect abitrary OEM VK and it will not match the one
+            # in distributed layout. It can cause issue if a application
+            # is awaiting a particular OEM_ for a hotkey
+            self.oem_idx += 1
+            if self.oem_idx <= self.MAX_OEM:
+                return "OEM_" + str(self.oem_idx)
+            return None
+
+
+class WindowsKey(NamedTuple):
+    """A key of a Windows keymap."""
+
+    name: str
+    scan_code: str
+    virtual_key: Optional[str]  # None: no OEM virtual key left
+    caps_lock: bool
+    levels: Tuple[Optional[CompiledSymbol], ...]  # base, shift, altgr, altgr+shift
+    wchars: Tuple[Optional[str], ...]  # character or hex code (dead key terminator)
+
+    @property
+    def has_dead_key(self) -> bool:
+        return any(level and level.dead_key for level in self.levels)
+
+
+class DeadKeyTransition(NamedTuple):
+    """A dead key combination: nested dead keys are given by their terminator."""
+
+    base: str
+    output: str
+    chained: bool  # the output is a dead key
+
+
+class WindowsDeadKey(NamedTuple):
+    name: str
+    terminator: str
+    transitions: List[DeadKeyTransition]
+
+
+class WindowsKeymap:
+    """Keys and dead keys of a layout, resolved for the Windows outputs."""
+
+    def __init__(self, layout: "KeyboardLayout") -> None:
+        compiled = layout.compiled
+        virtual_keys = VirtualKeys(layout)
+
+        self.keys: Dict[str, WindowsKey] = {}
+        for key_name in LAYER_KEYS:
+            if key_name.startswith("-"):
+                continue
+
+            if key_name in ["ae13", "ab11"]:  # ABNT / JIS keys
+                continue  # these two keys are not supported yet
+
+            key = compiled.keys.get(key_name)
+            levels = tuple(key.levels[i] if key else None for i in LEVELS)
+            wchars = tuple(level_wchar(level) for level in levels)
+            klc_symbols = [
+                klc_wchar(level, char) for level, char in zip(levels, wchars)
+            ]
+            scan_code = SCAN_CODES["klc"][key_name]
+            self.keys[key_name] = WindowsKey(
+                key_name,
+                scan_code,
+                virtual_keys.get(klc_symbols, scan_code),
+                key.alpha if key else False,
+                levels,
+                wchars,
+            )
+
+        self.dead_keys: Dict[str, WindowsDeadKey] = {}
+        dead_keys = compiled.dead_keys
+        for k, dead_key in dead_keys.items():
+            transitions = []
+            for base, alt in dead_key.table.items():
+                if base == k and alt in base:
+                    continue
+
+                if base in dead_keys:
+                    base = dead_keys[base].terminator
+
+                chained = alt in dead_keys
+                if chained:
+                    alt = dead_keys[alt].terminator
+
+                transitions.append(DeadKeyTransition(base, alt, chained))
+
+            self.dead_keys[k] = WindowsDeadKey(
+                dead_key.name, dead_key.terminator, transitions
+            )
+
+
+def level_wchar(level: Optional[CompiledSymbol]) -> Optional[str]:
+    """WCHAR of a key level: character or hex code (dead key terminator)."""
+    if not level:
+        return None
+    if not level.dead_key and level.char in SUPPORTED_SYMBOLS:
+        return level.char
+    return level.code
+
+
+def klc_wchar(level: Optional[CompiledSymbol], char: Optional[str]) -> str:
+    """KLC notation of a key level: character, hex code, `@` for dead keys."""
+    if not level or char is None:
+        return "-1"
+    return char + "@" if level.dead_key else char
+
+
+def windows_keymap(layout: "KeyboardLayout") -> WindowsKeymap:
+    """Windows keymap of a layout, computed once for all Windows outputs and
+    stored in the compiled layout: it is rebuilt when the layout changes."""
+
+    options = (layout.qwerty_shortcuts, layout.angle_mod)
+    keymaps = layout.compiled.windows_keymaps
+    if options not in keymaps:
+        keymaps[options] = WindowsKeymap(layout)
+    return keymaps[options]
@@ -4,13 +4,13 @@ GNU/Linux: XKB
 - xkb symbols/patch for XOrg (system-wide) & Wayland (system-wide/user-space)
 """
 
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Iterator, List, TextIO
 
 if TYPE_CHECKING:
     from ..layout import KeyboardLayout
 
-from ..template import load_tpl, substitute_lines
-from ..utils import DK_INDEX, LAYER_KEYS, ODK_ID, hex_ord, load_data
+from ..template import tpl_chunks, write_chunks
+from ..utils import LAYER_KEYS, ODK_ID, Layer, load_data
 
 XKB_KEY_SYM = load_data("key_sym")
 
@@ -26,6 +26,7 @@ def xkb_table(layout: "KeyboardLayout", xkbcomp: bool = False) -> List[str]:
     odk_symbol = "ISO_Level5_Latch" if eight_level else "ISO_Level3_Latch"
     max_length = 16  # `ISO_Level3_Latch` should be the longest symbol name
 
+    compiled = layout.compiled
     output: List[str] = []
     for key_name in LAYER_KEYS:
         if key_name.startswith("-"):  # separator
@@ -36,20 +37,21 @@ def xkb_table(layout: "KeyboardLayout", xkbcomp: bool = False) -> List[str]:
 
         descs = []
         symbols = []
-        for layer in layout.layers.values():
-            if key_name in layer:
-                keysym = layer[key_name]
+        for layer in Layer:
+            level = compiled.level(key_name, layer)
+            if level:
+                keysym = level.symbol
                 desc = keysym
                 # dead key?
-                if keysym in DK_INDEX:
-                    name = DK_INDEX[keysym].name
-                    desc = layout.dead_keys[keysym][keysym]
-                    symbol = odk_symbol if keysym == ODK_ID else f"dead_{name}"
+                if level.dead_key:
+                    dead_key = compiled.dead_keys[keysym]
+                    desc = dead_key.alt_self
+                    symbol = odk_symbol if keysym == ODK_ID else f"dead_{dead_key.name}"
                 # regular key: use a keysym if possible, utf-8 otherwise
                 elif keysym in XKB_KEY_SYM and len(XKB_KEY_SYM[keysym]) <= max_length:
                     symbol = XKB_KEY_SYM[keysym]
                 else:
-                    symbol = f"U{hex_ord(keysym).upper()}"
+                    symbol = f"U{level.code.upper()}"
             else:
                 desc = " "
                 symbol = "VoidSymbol"
@@ -85,17 +87,32 @@ def xkb_table(layout: "KeyboardLayout", xkbcomp: bool = False) -> List[str]:
     return output
 
 
+def _xkb_keymap_chunks(layout: "KeyboardLayout") -> Iterator[str]:
+    lines = {"LAYOUT": xkb_table(layout, xkbcomp=True)}
+    return tpl_chunks(layout, ".xkb_keymap", lines=lines)
+
+
+def _xkb_symbols_chunks(layout: "KeyboardLayout") -> Iterator[str]:
+    lines = {"LAYOUT": xkb_table(layout, xkbcomp=False)}
+    chunks = tpl_chunks(layout, ".xkb_symbols", lines=lines)
+    return (chunk.replace("//#", "//") for chunk in chunks)
+
+
 def xkb_keymap(self) -> str:  # will not work with Wayland
     """GNU/Linux driver (standalone / user-space)"""
-
-    out = load_tpl(self, ".xkb_keymap")
-    out = substitute_lines(out, "LAYOUT", xkb_table(self, xkbcomp=True))
-    return out
+    return "".join(_xkb_keymap_chunks(self))
 
 
 def xkb_symbols(self) -> str:
     """GNU/Linux driver (xkb patch, system or user-space)"""
+    return "".join(_xkb_symbols_chunks(self))
+
+
+def write_xkb_keymap(layout: "KeyboardLayout", fp: TextIO) -> None:
+    """GNU/Linux driver (standalone / user-space), streamed to a text file"""
+    write_chunks(fp, _xkb_keymap_chunks(layout))
+
 
-    out = load_tpl(self, ".xkb_symbols")
-    out = substitute_lines(out, "LAYOUT", xkb_table(self, xkbcomp=False))
-    return out.replace("//#", "//")
+def write_xkb_symbols(layout: "KeyboardLayout", fp: TextIO) -> None:
+    """GNU/Linux driver (xkb patch), streamed to a text file"""
+    write_chunks(fp, _xkb_symbols_chunks(layout))
@@ -1,9 +1,9 @@
+import json
 from pathlib import Path
 from typing import Dict, List
 
-from .layout import KeyboardLayout
-from .template import SCAN_CODES
-from .utils import Layer, load_data
+from .layout import CONFIG, SPACEBAR, KeyboardLayout
+from .utils import SCAN_CODES, Layer, load_data
 
 SEPARATOR = (
     "--------------------------------------------------------------------------------"
@@ -29,6 +29,20 @@ url         = "https://OneDeadKey.github.com/kalamine"
 version     = "0.0.1"
 geometry    = """
 
+# metadata written by `layout_descriptor`, in this order
+META_KEYS = [
+    "name",
+    "name8",
+    "locale",
+    "variant",
+    "author",
+    "description",
+    "url",
+    "license",
+    "version",
+    "geometry",
+]
+
 TOML_FOOTER = """
 [spacebar]
 1dk         = "'"  # apostrophe
@@ -101,11 +115,8 @@ def dummy_layout(
     return layout
 
 
-def draw_layout(geometry: str = "ISO", altgr: bool = False, odk: bool = False) -> str:
-    """Draw a ASCII art description of a default layout."""
-
-    # make a KeyboardLayout, just to get the ASCII arts
-    layout = dummy_layout(geometry, altgr, odk)
+def draw_layers(layout: KeyboardLayout, altgr: bool, odk: bool) -> str:
+    """ASCII art description of the layers of a layout."""
 
     def keymap(layer_name: str) -> str:
         layer = "\n".join(getattr(layout, layer_name))
@@ -124,6 +135,14 @@ def draw_layout(geometry: str = "ISO", altgr: bool = False, odk: bool = False) -
     return content
 
 
+def draw_layout(geometry: str = "ISO", altgr: bool = False, odk: bool = False) -> str:
+    """Draw a ASCII art description of a default layout."""
+
+    # make a KeyboardLayout, just to get the ASCII arts
+    layout = dummy_layout(geometry, altgr, odk)
+    return draw_layers(layout, altgr, odk)
+
+
 ###
 # Public API
 ##
@@ -152,3 +171,47 @@ def create_layout(output_file: Path, geometry: str, altgr: bool, odk: bool) -> N
 
     with open(output_file, "w", encoding="utf-8", newline="\n") as file:
         file.write(content.replace(" \n", "\n"))
+
+
+def layout_descriptor(layout: KeyboardLayout) -> str:
+    """TOML description of a layout: metadata, layers and space bar."""
+
+    # TOML basic strings use the same escape sequences as JSON
+    def toml_value(value: str) -> str:
+        return json.dumps(value, ensure_ascii=False)
+
+    content = "# kalamine keyboard layout descriptor\n"
+    for key in META_KEYS:
+        value = layout.meta.get(key)
+        if value is None or (key != "geometry" and value == CONFIG.get(key)):
+            continue
+        content += f"{key:<11} = {toml_value(str(value))}\n"
+    content += draw_layers(layout, layout.has_altgr, layout.has_1dk)
+
+    spacebar = {
+        "shift": layout.layers[Layer.SHIFT].get("spce"),
+        "1dk": layout.layers[Layer.ODK].get("spce"),
+        "shift_1dk": layout.layers[Layer.ODK_SHIFT].get("spce"),
+    }
+    if layout.has_altgr:
+        spacebar["altgr"] = layout.layers[Layer.ALTGR].get("spce")
+        spacebar["altgr_shift"] = layout.layers[Layer.ALTGR_SHIFT].get("spce")
+    defaults = {**SPACEBAR, "shift_1dk": spacebar["1dk"]}
+    custom_spacebar = {
+        key: value
+        for key, value in spacebar.items()
+        if value is not None and value != defaults[key]
+    }
+    if custom_spacebar:
+        content += "\n[spacebar]\n"
+        for key, value in custom_spacebar.items():
+            content += f"{key:<11} = {toml_value(value)}\n"
+
+    return content
+
+
+def write_layout(layout: KeyboardLayout, output_file: Path) -> None:
+    """Write the TOML description of a layout."""
+
+    with open(output_file, "w", encoding="utf-8", newline="\n") as file:
+        file.write(layout_descriptor(layout).replace(" \n", "\n"))
@@ -0,0 +1,139 @@
+"""
+Key sequences: the easiest way to type each character of a layout, through
+its dead keys if needed, as in `www/mjs/layout-analyzer.js`.
+
+This table is used by the layout analyzers, and can be embedded in the JSON
+layout descriptor (see `generators.web.raw_json`). This module only depends
+on the standard library: it is used by the build, without NumPy.
+"""
+
+from functools import lru_cache
+from math import inf
+from typing import Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+KeyStroke = Tuple[str, int]  # key code, level
+KeySequence = Tuple[KeyStroke, ...]
+
+
+###
+# JavaScript compatibility, so that results match the web analyzer
+#
+
+
+@lru_cache(maxsize=None)
+def js_len(text: str) -> int:
+    """Length of a string in UTF-16 code units, as in JavaScript."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def js_items(obj: Dict[str, T]) -> List[Tuple[str, T]]:
+    """Object entries in the JavaScript order: integer-like keys first."""
+
+    def order(key: str) -> float:
+        if key.isascii() and key.isdigit() and (key == "0" or key[0] != "0"):
+            return int(key) if int(key) < 2**32 - 1 else inf
+        return inf
+
+    return sorted(obj.items(), key=lambda item: order(item[0]))
+
+
+###
+# Key sequences
+#
+
+
+def is_1dfh(key_code: str) -> bool:
+    """Keys of the 3×10 matrix (one deviation from home) and the space bar."""
+    return key_code.startswith("Key") or key_code in [
+        "Space",
+        "Comma",
+        "Period",
+        "Slash",
+        "Semicolon",
+    ]
+
+
+def requires_less_effort(
+    original: KeySequence, new: KeySequence, odk: Optional[KeyStroke]
+) -> bool:
+    """Tell whether a new key sequence is easier to type than the original one."""
+
+    def cmp(val1: float, val2: float) -> int:
+        return (val1 > val2) - (val1 < val2)
+
+    # sequences that don’t use the 1dk are preferred
+    if odk is not None and len(original) > 1 and len(new) > 1:
+        cmp_1dk = cmp(odk in original, odk in new)
+        if cmp_1dk:
+            return cmp_1dk < 0
+
+    # prefer sequences with fewer keys out of the 3×10 matrix
+    # => altgr[B] rather than shift[9] for `#`
+    cmp_not_1dfh = cmp(
+        sum(not is_1dfh(key_code) for key_code, _ in new),
+        sum(not is_1dfh(key_code) for key_code, _ in original),
+    )
+    if cmp_not_1dfh:
+        return cmp_not_1dfh < 0
+
+    # prefer sequences with lower levels
+    # => 1dk -> `r` rather than altgr[D] for `)`
+    cmp_level = cmp(max(level for _, level in new), max(lvl for _, lvl in original))
+    if cmp_level:
+        return cmp_level < 0
+
+    # prefer shorter sequences
+    # => 1dk -> `i` rather than 1dk -> 1dk -> `i` for `ï`
+    return len(new) < len(original)
+
+
+def supported_chars(
+    keymap: Dict[str, List[str]], deadkeys: Dict[str, Dict[str, str]]
+) -> Dict[str, KeySequence]:
+    """Easiest key sequence for each character that the layout can type."""
+
+    char_table: Dict[str, KeySequence] = {}
+    dead_table: Dict[str, KeySequence] = {}
+
+    def odk() -> Optional[KeyStroke]:
+        if "**" in deadkeys and "**" in char_table:
+            return char_table["**"][0]
+        return None
+
+    def insert(table: Dict[str, KeySequence], char: str, seq: KeySequence) -> None:
+        if char not in table or requires_less_effort(table[char], seq, odk()):
+            table[char] = seq
+
+    def insert_dead_key_sequences(name: str, sequence: KeySequence) -> None:
+        for base_char, output_char in js_items(deadkeys.get(name, {})):
+            if base_char not in char_table:
+                continue
+            new_sequence = sequence + char_table[base_char]
+            if js_len(output_char) == 1:
+                insert(char_table, output_char, new_sequence)
+            else:
+                insert_dead_key_sequences(output_char, new_sequence)
+
+    for key_code, chars in keymap.items():
+        for level, char in enumerate(chars):
+            sequence: KeySequence = ((key_code, level),)
+            insert(char_table, char, sequence)
+            if js_len(char) != 1:
+                insert(dead_table, char, sequence)
+
+    for dead_key, sequence in list(dead_table.items()):
+        insert_dead_key_sequences(dead_key, sequence)
+
+    return char_table
+
+
+def char_table(
+    keymap: Dict[str, List[str]], deadkeys: Dict[str, Dict[str, str]]
+) -> Dict[str, List[List]]:
+    """JSON version of `supported_chars`: {char: [[key code, level], ...]}."""
+    return {
+        char: [list(key) for key in sequence]
+        for char, sequence in supported_chars(keymap, deadkeys).items()
+    }
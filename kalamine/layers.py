@@ -0,0 +1,123 @@
+"""
+Dense storage of keyboard layers.
+
+All layers share a fixed enumeration of key names, so that each layer is a
+tuple of interned symbols (None for unassigned keys): whole layers can be
+compared and hashed cheaply, and a layout weighs a few hundred bytes.
+The usual `layers[Layer.BASE]["ad01"]` dict-like API is provided by views.
+"""
+
+import sys
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .utils import LAYER_KEYS, Layer
+
+KEY_NAMES: Tuple[str, ...] = tuple(key for key in LAYER_KEYS if not key.startswith("-"))
+KEY_INDEX: Dict[str, int] = {key: i for i, key in enumerate(KEY_NAMES)}
+
+Row = Tuple[Optional[str], ...]
+EMPTY_ROW: Row = (None,) * len(KEY_NAMES)
+
+
+class LayerView(MutableMapping[str, str]):
+    """Dict-like view of one layer: key name -> symbol."""
+
+    __slots__ = ("_table", "_layer")
+
+    def __init__(self, table: "LayerTable", layer: Layer) -> None:
+        self._table = table
+        self._layer = layer
+
+    def __getitem__(self, key: str) -> str:
+        symbol = self._table.rows[self._layer][KEY_INDEX[key]]
+        if symbol is None:
+            raise KeyError(key)
+        return symbol
+
+    def __setitem__(self, key: str, symbol: str) -> None:
+        if key not in KEY_INDEX:
+            raise KeyError(f"unknown key name: {key}")
+        self._table.set(self._layer, key, symbol)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._table.set(self._layer, key, None)
+
+    def __contains__(self, key: object) -> bool:
+        i = KEY_INDEX.get(key) if isinstance(key, str) else None
+        return i is not None and self._table.rows[self._layer][i] is not None
+
+    def __iter__(self) -> Iterator[str]:
+        row = self._table.rows[self._layer]
+        return (key for key, symbol in zip(KEY_NAMES, row) if symbol is not None)
+
+    def __len__(self) -> int:
+        return len(KEY_NAMES) - self._table.rows[self._layer].count(None)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class LayerTable(Mapping[Layer, LayerView]):
+    """The six layers of a layout, as a 6×N table of interned symbols.
+
+    A reverse index (symbol -> [(layer, key name)]) is kept in sync with the
+    table, and a revision number is bumped on every change.
+    """
+
+    __slots__ = ("rows", "revision", "char_index", "_views")
+
+    def __init__(self) -> None:
+        self.rows: Tuple[Row, ...] = (EMPTY_ROW,) * len(Layer)
+        self.revision = 0
+        self.char_index: Dict[str, List[Tuple[Layer, str]]] = {}
+        self._views = tuple(LayerView(self, layer) for layer in Layer)
+
+    def set(self, layer: Layer, key: str, symbol: Optional[str]) -> None:
+        """Assign a symbol to a key (or clear it, with None)."""
+
+        layer = Layer(layer)
+        i = KEY_INDEX[key]
+        row = list(self.rows[layer])
+
+        previous = row[i]
+        if previous is not None:
+            self.char_index[previous].remove((layer, key))
+            if not self.char_index[previous]:
+                del self.char_index[previous]
+        if symbol is not None:
+            symbol = sys.intern(symbol)
+            self.char_index.setdefault(symbol, []).append((layer, key))
+
+        row[i] = symbol
+        rows = list(self.rows)
+        rows[layer] = tuple(row)
+        self.rows = tuple(rows)
+        self.revision += 1
+
+    def __getitem__(self, layer: Union[Layer, int]) -> LayerView:
+        return self._views[layer]
+
+    def __iter__(self) -> Iterator[Layer]:
+        return iter(Layer)
+
+    def __len__(self) -> int:
+        return len(Layer)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, LayerTable):
+            return self.rows == other.rows
+        return super().__eq__(other)
+
+    def __repr__(self) -> str:
+        return repr({layer: view for layer, view in self.items()})
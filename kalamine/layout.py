@@ -1,15 +1,20 @@
 import copy
-import sys
+import hashlib
+import json
+import threading
 import tomllib
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Type, TypeVar
+from typing import Collection, Dict, List, Optional, Set, Tuple, Type, TypeVar
 
 import click
-import yaml
 
+from .compiled import CompiledLayout
+from .data_cache import yaml_load
+from .layers import LayerTable, Row
 from .utils import (
-    DEAD_KEYS,
+    DEAD_KEY_IDS,
+    DK_INDEX,
     LAYER_KEYS,
     ODK_ID,
     Layer,
@@ -23,43 +28,120 @@ from .utils import (
 #
 
 
-def load_layout(layout_path: Path) -> Dict:
-    """Load the TOML/YAML layout description data (and its ancessor, if any)."""
-
-    def load_descriptor(file_path: Path) -> Dict:
-        if file_path.suffix in [".yaml", ".yml"]:
-            with file_path.open(encoding="utf-8") as file:
-                return yaml.load(file, Loader=yaml.SafeLoader)
+class DescriptorError(ValueError):
+    """A layout descriptor can't be loaded."""
+
+
+class DescriptorCache:
+    """Parsed descriptor files, keyed by path and invalidated when their mtime
+    or size changes: in a batch, shared ancessors are parsed only once."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[Path, Tuple[Tuple[int, int], Dict]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, file_path: Path) -> Dict:
+        """Return a fresh copy of the contents of a descriptor file."""
+
+        path = file_path.resolve()
+        try:
+            stat = path.stat()
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                entry = self._entries.get(path)
+            if entry is None or entry[0] != stamp:
+                entry = (stamp, self._parse(path, path.read_bytes()))
+                with self._lock:
+                    self._entries[path] = entry
+        except OSError as exc:
+            raise DescriptorError(f"{file_path}: {exc.strerror}") from exc
+        return copy.deepcopy(entry[1])
+
+    @staticmethod
+    def _parse(path: Path, source: bytes) -> Dict:
+        try:
+            if path.suffix in [".yaml", ".yml"]:
+                data = yaml_load(source)
+            else:
+                data = tomllib.loads(source.decode("utf-8"))
+        except Exception as exc:  # TOML, YAML or UTF-8 errors
+            raise DescriptorError(f"{path}: {exc}") from exc
+        if not isinstance(data, dict):
+            raise DescriptorError(f"{path}: not a layout descriptor")
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+DESCRIPTORS = DescriptorCache()
+
+
+def load_descriptor(file_path: Path) -> Dict:
+    """Load a single TOML/YAML descriptor file, without its ancessors."""
+    return DESCRIPTORS.load(file_path)
+
+
+def descriptor_chain(layout_path: Path) -> List[Path]:
+    """List the descriptor files a layout is made of: itself and its ancessors,
+    following `extends` (relative to each descriptor) from child to root."""
+
+    chain = [layout_path]
+    cfg = load_descriptor(layout_path)
+    while "extends" in cfg:
+        if not isinstance(cfg["extends"], str):
+            raise DescriptorError(f"{chain[-1]}: `extends` must be a file path")
+        parent_path = chain[-1].parent / cfg["extends"]
+        resolved = [path.resolve() for path in chain]
+        if parent_path.resolve() in resolved:
+            cycle = " -> ".join(str(path) for path in [*chain, parent_path])
+            raise DescriptorError(f"circular `extends`: {cycle}")
+        chain.append(parent_path)
+        cfg = load_descriptor(parent_path)
+    return chain
+
+
+def parse_layout(layout_path: Path) -> Dict:
+    """Load the TOML/YAML layout description data (and its ancessors, if any).
+    Raise a DescriptorError if the description data can't be loaded."""
+
+    chain = descriptor_chain(layout_path)
+    cfg: Dict = {}
+    for path in reversed(chain):  # root ancessor first
+        cfg.update(load_descriptor(path))
+    if "name" not in load_descriptor(layout_path):
+        cfg["name"] = layout_path.stem
+    if not isinstance(cfg["name"], str):
+        raise DescriptorError(f"Layout name must be a string, got `{cfg['name']}`")
+    if "version" in cfg:
+        if not isinstance(cfg["version"], str):
+            raise DescriptorError(
+                f'Layout version number must be a string like "1.0.0", '
+                f"got `version={cfg['version']}`"
+            )
+        version_check = cfg["version"].split(".")
+        if len(version_check) > 3:
+            raise DescriptorError(
+                f"Layout version number **must** follow `x.y.z` format\nCurrently got `version={cfg['version']}`"
+            )
+        missing_digits = (3 - len(version_check)) * ["0"]
+        cfg["version"] = ".".join(version_check + missing_digits)
+    else:
+        cfg["version"] = MetaDescr.version
 
-        with file_path.open(mode="rb") as dfile:
-            return tomllib.load(dfile)
+    return cfg
 
-    try:
-        cfg = load_descriptor(layout_path)
-        if "name" not in cfg:
-            cfg["name"] = layout_path.stem
-        if "extends" in cfg:
-            parent_path = layout_path.parent / cfg["extends"]
-            ext = load_descriptor(parent_path)
-            ext.update(cfg)
-            cfg = ext
-        if "version" in cfg:
-            version_check = cfg["version"].split(".")
-            if len(version_check) > 3:
-                raise Exception(
-                    f"Layout version number **must** follow `x.y.z` format\nCurrently got `version={cfg['version']}`"
-                )
-            missing_digits = (3 - len(version_check)) * ["0"]
-            cfg["version"] = ".".join(version_check + missing_digits)
-        else:
-            cfg["version"] = MetaDescr.version
 
-        return cfg
+def load_layout(layout_path: Path) -> Dict:
+    """Load the TOML/YAML layout description data (and its ancessors, if any),
+    for CLI commands: errors are raised as click exceptions, which click
+    reports before exiting."""
 
-    except Exception as exc:
-        click.echo("File could not be parsed.", err=True)
-        click.echo(f"Error: {exc}.", err=True)
-        sys.exit(1)
+    try:
+        return parse_layout(layout_path)
+    except DescriptorError as exc:
+        raise click.ClickException(f"File could not be parsed.\n{exc}") from exc
 
 
 ###
@@ -120,6 +202,17 @@ T = TypeVar("T", bound="GeometryDescr")
 class GeometryDescr:
     template: str
     rows: List[RowDescr]
+    lines: Tuple[str, ...] = field(init=False, repr=False)
+    cells: Tuple[Tuple[str, int, int], ...] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Pre-parse the template: (key name, row, column) of each key cell."""
+        self.lines = tuple(self.template.split("\n")[:-1])
+        self.cells = tuple(
+            (key, j, row.offset + 6 * n)
+            for j, row in enumerate(self.rows)
+            for n, key in enumerate(row.keys)
+        )
 
     @classmethod
     def from_dict(cls: Type[T], src: Dict) -> T:
@@ -133,6 +226,44 @@ GEOMETRY = {
 }
 
 
+@dataclass(frozen=True, eq=False)
+class FrozenLayout:
+    """Immutable snapshot of a keyboard layout, usable as a cache key.
+
+    Snapshots are compared and hashed with a content digest, which is stable
+    across processes and computed only once.
+    """
+
+    layers: Tuple[Row, ...]
+    dead_keys: Tuple[Tuple[str, Tuple[Tuple[str, str], ...]], ...]
+    meta: Tuple[Tuple[str, str], ...]
+    has_altgr: bool
+    has_1dk: bool
+    angle_mod: bool
+    qwerty_shortcuts: bool
+    digest: str = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        content = json.dumps(
+            [
+                self.layers,
+                self.dead_keys,
+                self.meta,
+                [self.has_altgr, self.has_1dk, self.angle_mod, self.qwerty_shortcuts],
+            ]
+        )
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        object.__setattr__(self, "digest", digest)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FrozenLayout):
+            return NotImplemented
+        return self.digest == other.digest
+
+    def __hash__(self) -> int:
+        return int(self.digest[:16], 16)
+
+
 ###
 # Main
 #
@@ -149,7 +280,10 @@ class KeyboardLayout:
         """Import a keyboard layout to instanciate the object."""
 
         # initialize a blank layout
-        self.layers: Dict[Layer, Dict[str, str]] = {layer: {} for layer in Layer}
+        self.layers = LayerTable()
+        self._views: Dict[Tuple, Tuple[str, ...]] = {}  # geometry views
+        self._views_revision = -1
+        self._compiled: Optional[CompiledLayout] = None
         self.dk_set: Set[str] = set()
         self.dead_keys: Dict[str, Dict[str, str]] = {}  # dictionary subset of DEAD_KEYS
         # self.meta = Dict[str, str] = {} # default parameters, hardcoded
@@ -224,16 +358,12 @@ class KeyboardLayout:
     def _parse_dead_keys(self, spc: Dict[str, str]) -> None:
         """Build a deadkey dict."""
 
-        def layout_has_char(char: str) -> bool:
-            all_layers = [Layer.BASE, Layer.SHIFT]
-            if self.has_altgr:
-                all_layers += [Layer.ALTGR, Layer.ALTGR_SHIFT]
+        all_layers = [Layer.BASE, Layer.SHIFT]
+        if self.has_altgr:
+            all_layers += [Layer.ALTGR, Layer.ALTGR_SHIFT]
 
-            for layer_index in all_layers:
-                for id in self.layers[layer_index]:
-                    if self.layers[layer_index][id] == char:
-                        return True
-            return False
+        def layout_has_char(char: str) -> bool:
+            return self.has_char(char, all_layers)
 
         all_spaces: List[str] = []
         for space in ["\u0020", "\u00a0", "\u202f"]:
@@ -241,8 +371,7 @@ class KeyboardLayout:
                 all_spaces.append(space)
 
         self.dead_keys = {}
-        for dk in DEAD_KEYS:
-            id = dk.char
+        for id, dk in DK_INDEX.items():
             if id not in self.dk_set:
                 continue
 
@@ -264,11 +393,9 @@ class KeyboardLayout:
                     deadkey[space] = spc["1dk"]
 
             else:
-                base = dk.base
-                alt = dk.alt
-                for i in range(len(base)):
-                    if layout_has_char(base[i]):
-                        deadkey[base[i]] = alt[i]
+                for base, alt in dk.table.items():
+                    if layout_has_char(base):
+                        deadkey[base] = alt
                 for space in all_spaces:
                     deadkey[space] = dk.alt_space
 
@@ -308,21 +435,75 @@ class KeyboardLayout:
                 if shift_key != " ":
                     self.layers[layer_number.next()][key] = shift_key
 
-                for dk in DEAD_KEYS:
-                    if base_key == dk.char or shift_key == dk.char:
-                        self.dk_set.add(dk.char)
+                if base_key in DEAD_KEY_IDS:
+                    self.dk_set.add(base_key)
+                if shift_key in DEAD_KEY_IDS:
+                    self.dk_set.add(shift_key)
 
                 i += 6
             j += 1
 
+    def freeze(self) -> FrozenLayout:
+        """Immutable snapshot of the layout: layers, dead keys, metadata, flags."""
+
+        return FrozenLayout(
+            layers=self.layers.rows,
+            dead_keys=tuple(
+                (id, tuple(sorted(deadkey.items())))
+                for id, deadkey in sorted(self.dead_keys.items())
+            ),
+            meta=tuple(sorted((key, str(value)) for key, value in self.meta.items())),
+            has_altgr=self.has_altgr,
+            has_1dk=self.has_1dk,
+            angle_mod=self.angle_mod,
+            qwerty_shortcuts=self.qwerty_shortcuts,
+        )
+
+    @property
+    def compiled(self) -> CompiledLayout:
+        """Keys and dead keys resolved for the generators: built once, and
+        memoised until the layers or the dead keys change."""
+        compiled = self._compiled
+        if compiled is None or not compiled.is_current(self):
+            compiled = self._compiled = CompiledLayout(self)
+        return compiled
+
+    ###
+    # Reverse lookup: how to type a given character
+    #
+
+    @property
+    def char_index(self) -> Dict[str, List[Tuple[Layer, str]]]:
+        """Symbol -> [(layer, key name)] index, kept in sync with the layers."""
+        return self.layers.char_index
+
+    def find_char(
+        self, char: str, layers: Optional[Collection[Layer]] = None
+    ) -> List[Tuple[Layer, str]]:
+        """List the (layer, key name) positions producing a character, in
+        parsing order; dead keys are looked up with their `*x` identifier.
+        The search can be restricted to some layers."""
+
+        positions = self.char_index.get(char, [])
+        if layers is None:
+            return list(positions)
+        return [position for position in positions if position[0] in layers]
+
+    def has_char(self, char: str, layers: Optional[Collection[Layer]] = None) -> bool:
+        """Tell whether a character can be typed on the given layers."""
+
+        if layers is None:
+            return char in self.char_index
+        return any(position[0] in layers for position in self.char_index.get(char, []))
+
     ###
     # Geometry: base, full, altgr
     #
 
     def _fill_template(
-        self, template: List[str], rows: List[RowDescr], layer_number: Layer
-    ) -> List[str]:
-        """Fill a template with a keyboard layer."""
+        self, template: List[List[str]], geometry: GeometryDescr, layer_number: Layer
+    ) -> None:
+        """Fill a template (as lists of characters) with a keyboard layer."""
 
         if layer_number == Layer.BASE:
             col_offset = 0
@@ -331,60 +512,56 @@ class KeyboardLayout:
             col_offset = 2
             shift_prevails = False
 
-        j = 0
-        for row in rows:
-            i = row.offset + col_offset
-            keys = row.keys
-
-            base = list(template[2 + j * 3])
-            shift = list(template[1 + j * 3])
+        base_layer = self.layers[layer_number]
+        shift_layer = self.layers[layer_number.next()]
 
-            for key in keys:
-                base_key = " "
-                if key in self.layers[layer_number]:
-                    base_key = self.layers[layer_number][key]
+        for key, j, column in geometry.cells:
+            i = column + col_offset
+            base = template[2 + j * 3]
+            shift = template[1 + j * 3]
 
-                shift_key = " "
-                if key in self.layers[layer_number.next()]:
-                    shift_key = self.layers[layer_number.next()][key]
+            base_key = base_layer.get(key, " ")
+            shift_key = shift_layer.get(key, " ")
 
-                dead_base = len(base_key) == 2 and base_key[0] == "*"
-                dead_shift = len(shift_key) == 2 and shift_key[0] == "*"
+            dead_base = len(base_key) == 2 and base_key[0] == "*"
+            dead_shift = len(shift_key) == 2 and shift_key[0] == "*"
 
-                if shift_prevails:
-                    shift[i] = shift_key[-1]
-                    if dead_shift:
-                        shift[i - 1] = "*"
-                    if upper_key(base_key) != shift_key:
-                        base[i] = base_key[-1]
-                        if dead_base:
-                            base[i - 1] = "*"
-                else:
+            if shift_prevails:
+                shift[i] = shift_key[-1]
+                if dead_shift:
+                    shift[i - 1] = "*"
+                if upper_key(base_key) != shift_key:
                     base[i] = base_key[-1]
                     if dead_base:
                         base[i - 1] = "*"
-                    if upper_key(base_key) != shift_key:
-                        shift[i] = shift_key[-1]
-                        if dead_shift:
-                            shift[i - 1] = "*"
-
-                i += 6
-
-            template[2 + j * 3] = "".join(base)
-            template[1 + j * 3] = "".join(shift)
-            j += 1
-
-        return template
+            else:
+                base[i] = base_key[-1]
+                if dead_base:
+                    base[i - 1] = "*"
+                if upper_key(base_key) != shift_key:
+                    shift[i] = shift_key[-1]
+                    if dead_shift:
+                        shift[i - 1] = "*"
 
     def _get_geometry(self, layers: Optional[List[Layer]] = None) -> List[str]:
-        """`geometry` view of the requested layers."""
+        """`geometry` view of the requested layers.
+
+        Views are memoised until the layers or the geometry change.
+        """
         layers = layers or [Layer.BASE]
 
-        rows = GEOMETRY[self.geometry].rows
-        template = GEOMETRY[self.geometry].template.split("\n")[:-1]
-        for i in layers:
-            template = self._fill_template(template, rows, i)
-        return template
+        if self._views_revision != self.layers.revision:
+            self._views.clear()
+            self._views_revision = self.layers.revision
+
+        view_id = (self.geometry, *layers)
+        if view_id not in self._views:
+            geometry = GEOMETRY[self.geometry]
+            template = [list(line) for line in geometry.lines]
+            for i in layers:
+                self._fill_template(template, geometry, i)
+            self._views[view_id] = tuple("".join(line) for line in template)
+        return list(self._views[view_id])
 
     @property
     def geometry(self) -> str:
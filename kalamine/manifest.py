@@ -0,0 +1,93 @@
+"""
+Build manifest, for incremental builds.
+
+For each layout build, `kalamine build` records a digest of everything the
+output files depend on: the descriptor files, the build options, the kalamine
+version and its templates and data files. A build is skipped when this digest
+is unchanged and all its output files still exist.
+"""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .layout import descriptor_chain
+
+MANIFEST_FILE = ".kalamine-cache"
+MANIFEST_FORMAT = 1  # bump this when the manifest structure changes
+
+
+@lru_cache(maxsize=None)
+def package_digest() -> str:
+    """Digest of the kalamine version, templates and data files."""
+    from importlib import metadata
+
+    try:
+        version = metadata.version("kalamine")
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+
+    root = Path(__file__).parent
+    digest = hashlib.sha256(version.encode("utf-8"))
+    for path in sorted([*root.glob("templates/*"), *root.glob("data/*.yaml")]):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def build_digest(input_file: Path, options: Sequence) -> Optional[str]:
+    """Digest of all the inputs of a layout build; None if it can't be computed,
+    e.g. when a descriptor can't be parsed: the build will report the error."""
+    try:
+        digest = hashlib.sha256(package_digest().encode("utf-8"))
+        digest.update(json.dumps([str(option) for option in options]).encode("utf-8"))
+        for path in descriptor_chain(input_file):
+            digest.update(str(path.resolve()).encode("utf-8"))
+            digest.update(path.read_bytes())
+    except Exception:
+        return None
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """Input digests and output files of previous layout builds."""
+
+    def __init__(self, path: Path = Path(MANIFEST_FILE)) -> None:
+        self.path = path
+        self.builds: Dict[str, Dict] = {}
+        try:
+            content = json.loads(path.read_text(encoding="utf-8"))
+            if content["format"] == MANIFEST_FORMAT:
+                self.builds = content["builds"]
+        except (OSError, ValueError, KeyError):  # missing or outdated manifest
+            pass
+
+    def is_up_to_date(self, key: str, digest: Optional[str]) -> bool:
+        build = self.builds.get(key)
+        if digest is None or build is None or build["inputs"] != digest:
+            return False
+        return all(Path(output).exists() for output in build["outputs"])
+
+    def outputs(self, key: str) -> List[Path]:
+        return [Path(output) for output in self.builds[key]["outputs"]]
+
+    def record(self, key: str, digest: Optional[str], outputs: List[Path]) -> None:
+        if digest is None:
+            self.forget(key)
+        else:
+            self.builds[key] = {
+                "inputs": digest,
+                "outputs": [str(output) for output in outputs],
+            }
+
+    def forget(self, key: str) -> None:
+        self.builds.pop(key, None)
+
+    def save(self) -> None:
+        content = {"format": MANIFEST_FORMAT, "builds": self.builds}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(content, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
@@ -1,25 +1,307 @@
+import gzip
+import hashlib
+import mimetypes
 import threading
 import webbrowser
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from importlib import metadata
 from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
 from xml.etree import ElementTree as ET
 
 import click
-from livereload import Server  # type: ignore
 
+from .corpus_builder import BINARY_SUFFIX, is_up_to_date
 from .generators import ahk, keylayout, klc, web, xkb
-from .layout import KeyboardLayout, load_layout
+from .layout import KeyboardLayout, descriptor_chain, load_layout, parse_layout
+
+
+def svg(layout: KeyboardLayout) -> str:
+    root_element = web.svg(layout).getroot()
+    return (
+        ET.tostring(root_element, encoding="unicode")
+        if root_element is not None
+        else ""
+    )
+
+
+class Endpoint(NamedTuple):
+    """Layout artifact served on a given path."""
+
+    render: Callable[[KeyboardLayout], str]
+    content_type: str = "text/plain"
+    charset: str = "utf-8"
+
+
+ENDPOINTS: Dict[str, Endpoint] = {
+    "/json": Endpoint(partial(web.pretty_json, char_table=True), "application/json"),
+    "/keylayout": Endpoint(keylayout.keylayout),
+    "/ahk": Endpoint(ahk.ahk),
+    "/klc": Endpoint(klc.klc, "text", "utf-16-le"),
+    "/rc": Endpoint(klc.klc_rc, "text"),
+    "/c": Endpoint(klc.klc_c, "text"),
+    "/xkb_keymap": Endpoint(xkb.xkb_keymap),
+    "/xkb_symbols": Endpoint(xkb.xkb_symbols),
+    "/svg": Endpoint(svg, "image/svg+xml"),
+}
+
+
+class Artifact(NamedTuple):
+    body: bytes
+    content_type: str
+    etag: str
+
+
+def render_artifact(layout: KeyboardLayout, path: str) -> Artifact:
+    endpoint = ENDPOINTS[path]
+    body = endpoint.render(layout).encode(endpoint.charset)
+    return Artifact(
+        body,
+        f"{endpoint.content_type}; charset={endpoint.charset}",
+        f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+    )
+
+
+class ArtifactCache:
+    """Rendered artifacts of the current layout revision.
+
+    Artifacts are rendered on demand by a pool of workers, and kept until the
+    layout changes; concurrent requests for the same artifact share a single
+    rendering. Their strong ETag is a digest of their encoded content.
+    """
+
+    def __init__(self, workers: int = 4) -> None:
+        self.revision: Optional[str] = None
+        self.artifacts: Dict[str, "Future[Artifact]"] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(workers, "kalamine-render")
+
+    def request(self, layout: KeyboardLayout, path: str) -> "Future[Artifact]":
+        """Get an artifact, or schedule its rendering."""
+        revision = layout.freeze().digest
+        with self.lock:
+            if revision != self.revision:
+                self.artifacts = {}
+                self.revision = revision
+            if path not in self.artifacts:
+                future = self.executor.submit(render_artifact, layout, path)
+                self.artifacts[path] = future
+            return self.artifacts[path]
+
+    def get(self, layout: KeyboardLayout, path: str) -> Artifact:
+        return self.request(layout, path).result()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an `If-None-Match` request header against a strong ETag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+
+
+class LayoutWatcher:
+    """Keep a layout in sync with its descriptor files.
+
+    The descriptor and its ancessors are polled: when their mtime or size has
+    changed, their content is hashed, and the layout is parsed again only if
+    the content has actually changed. The new layout then replaces the
+    previous one in a single assignment, so readers always get a consistent
+    layout; a descriptor that can't be parsed keeps the previous layout.
+    """
+
+    def __init__(self, file_path: Path, angle_mod: bool = False) -> None:
+        self.file_path = file_path
+        self.angle_mod = angle_mod
+        self.layout = KeyboardLayout(load_layout(file_path), angle_mod)
+        self.revision = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self._chain = descriptor_chain(file_path)
+        self._stamps = self._stat()
+        self._digest = self._hash()
+
+    def _stat(self) -> List[Optional[Tuple[int, int]]]:
+        stamps: List[Optional[Tuple[int, int]]] = []
+        for path in self._chain:
+            try:
+                stat = path.stat()
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def _hash(self) -> str:
+        digest = hashlib.sha256()
+        for path in self._chain:
+            try:
+                digest.update(path.read_bytes())
+            except OSError:
+                pass
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def check(self) -> bool:
+        """Reload the layout if its descriptors have changed.
+        Return True if a new layout has been loaded."""
+
+        with self.lock:
+            try:  # the ancessors might have changed
+                self._chain = descriptor_chain(self.file_path)
+            except Exception:  # broken descriptor: keep watching the same files
+                pass
+
+            stamps = self._stat()
+            if stamps == self._stamps:
+                return False
+            self._stamps = stamps
+
+            digest = self._hash()
+            if digest == self._digest:
+                return False
+            self._digest = digest
+
+            try:
+                layout = KeyboardLayout(parse_layout(self.file_path), self.angle_mod)
+            except Exception as exc:
+                click.echo("File could not be parsed.", err=True)
+                click.echo(f"Error: {exc}.", err=True)
+                return False
+
+            self.layout = layout
+            self.revision += 1
+            self.changed.notify_all()
+            return True
+
+    def wait(self, revision: int, timeout: Optional[float] = None) -> int:
+        """Wait until the layout revision differs from `revision`, or until the
+        timeout expires. Return the current revision."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.revision != revision, timeout)
+            return self.revision
+
+    def watch(self, stop: threading.Event, interval: float = 0.5) -> None:
+        """Poll the descriptors until `stop` is set."""
+        while not stop.wait(interval):
+            self.check()
+
+
+class Asset(NamedTuple):
+    bodies: Dict[str, bytes]  # content-encoding -> content
+    content_type: str
+    digest: str
+    mtime: int  # seconds since the epoch
+    stamp: Tuple[int, int]  # file mtime and size, to detect changes
+
+
+COMPRESSIBLE_TYPES = [
+    "application/json",
+    "application/octet-stream",  # binary corpora
+    "image/svg+xml",
+    "text/",
+]
+COMPRESSION_THRESHOLD = 1024  # bytes
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> List[str]:
+    """Parse an `Accept-Encoding` header, by decreasing preference."""
+    encodings: List[Tuple[float, str]] = []
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        if name and quality > 0:
+            encodings.append((-quality, name.strip().lower()))
+    return [name for _, name in sorted(encodings, key=lambda item: item[0])]
+
+
+class StaticAssets:
+    """In-memory cache of static files, with precompressed variants.
+
+    Files are read and compressed on first request (gzip, and brotli if the
+    `brotli` module is installed), and read again only when they change.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.assets: Dict[Path, Asset] = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: Path) -> Optional[Asset]:
+        """Get a static file, or None if it does not exist."""
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        asset = self.assets.get(path)
+        if asset is None or asset.stamp != stamp:
+            with self.lock:
+                asset = self.assets.get(path)
+                if asset is None or asset.stamp != stamp:
+                    asset = self.load(path, stamp)
+                    self.assets[path] = asset
+        return asset
+
+    def load(self, path: Path, stamp: Tuple[int, int]) -> Asset:
+        content = path.read_bytes()
+        mime_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if mime_type.endswith("javascript"):  # either text/ or application/
+            mime_type = "text/javascript"
+        compressible = any(mime_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+        content_type = mime_type
+        if mime_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+
+        bodies = {"identity": content}
+        if compressible and len(content) >= COMPRESSION_THRESHOLD:
+            bodies["gzip"] = gzip.compress(content, 9, mtime=0)
+            try:
+                import brotli  # type: ignore  # optional
+
+                bodies["br"] = brotli.compress(content)
+            except ImportError:
+                pass
+
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        return Asset(bodies, content_type, digest, stamp[0] // 10**9, stamp)
+
+    def is_outdated(self, path: Path, asset: Asset) -> bool:
+        """Binary corpora are build artifacts: they are outdated when their
+        JSON source has been modified since, and must not be served then."""
+        if path.suffix != BINARY_SUFFIX:
+            return False
+        source = self.get(path.with_suffix(".json"))
+        if source is None:
+            return False
+        return not is_up_to_date(asset.bodies["identity"], source.bodies["identity"])
 
 
 def keyboard_server(file_path: Path, angle_mod: bool = False) -> None:
-    kb_layout = KeyboardLayout(load_layout(file_path), angle_mod)
+    watcher = LayoutWatcher(file_path, angle_mod)
+    artifacts = ArtifactCache()
+    assets = StaticAssets(Path(__file__).parent / "www")
+    stopped = threading.Event()
 
     host_name = "localhost"
     webserver_port = 1664
-    lr_server_port = 5500
 
-    def main_page(layout: KeyboardLayout, angle_mod: bool = False) -> str:
+    def main_page(
+        layout: KeyboardLayout, revision: int, angle_mod: bool = False
+    ) -> str:
         layout_ref = layout.meta["name"]
         if "url" in layout.meta:
             layout_ref = f"""<a href="{layout.meta["url"]}">{layout.meta["name"]}</a>"""
@@ -31,7 +313,10 @@ def keyboard_server(file_path: Path, angle_mod: bool = False) -> None:
                 <meta charset="utf-8">
                 <title>Kalamine</title>
                 <link rel="stylesheet" type="text/css" href="style.css">
-                <script src="http://{host_name}:{lr_server_port}/livereload.js"></script>
+                <script>
+                    new EventSource("/events?revision={revision}")
+                        .addEventListener("reload", () => location.reload());
+                </script>
                 <script type="module" src="mjs/x-keyboard.js"></script>
                 <script type="module" src="mjs/layout-analyzer.js"></script>
                 <script type="module" src="mjs/stats-canvas.js"></script>
@@ -155,7 +440,7 @@ def keyboard_server(file_path: Path, angle_mod: bool = False) -> None:
 
     class LayoutHandler(SimpleHTTPRequestHandler):
         def __init__(self, *args, **kwargs) -> None:  # type: ignore
-            kwargs["directory"] = str(Path(__file__).parent / "www")
+            kwargs["directory"] = str(assets.root)
             super().__init__(*args, **kwargs)
 
         def do_GET(self) -> None:
@@ -170,58 +455,127 @@ def keyboard_server(file_path: Path, angle_mod: bool = False) -> None:
                 self.send_header("Expires", "0")
                 self.end_headers()
                 self.wfile.write(bytes(page, charset))
-                # self.wfile.write(page.encode(charset))
-
-            # XXX always reloads the layout on the root page, never in sub pages
-            nonlocal kb_layout
-            nonlocal angle_mod
-            if self.path == "/json":
-                send(web.pretty_json(kb_layout), content="application/json")
-            elif self.path == "/keylayout":
-                # send(keylayout.keylayout(kb_layout), content='application/xml')
-                send(keylayout.keylayout(kb_layout))
-            elif self.path == "/ahk":
-                send(ahk.ahk(kb_layout))
-            elif self.path == "/klc":
-                send(klc.klc(kb_layout), charset="utf-16-le", content="text")
-            elif self.path == "/rc":
-                send(klc.klc_rc(kb_layout), content="text")
-            elif self.path == "/c":
-                send(klc.klc_c(kb_layout), content="text")
-            elif self.path == "/xkb_keymap":
-                send(xkb.xkb_keymap(kb_layout))
-            elif self.path == "/xkb_symbols":
-                send(xkb.xkb_symbols(kb_layout))
-            elif self.path == "/svg":
-                root_element = web.svg(kb_layout).getroot()
-                if root_element is not None:
-                    utf8 = ET.tostring(root_element, encoding="unicode")
-                    send(utf8, content="image/svg+xml")
-            elif self.path == "/":
-                kb_layout = KeyboardLayout(load_layout(file_path), angle_mod)  # refresh
-                send(main_page(kb_layout, angle_mod), content="text/html")
+
+            def send_artifact(artifact: Artifact) -> None:
+                # cached by the browser, but revalidated on each request
+                if etag_matches(self.headers.get("If-None-Match"), artifact.etag):
+                    self.send_response(304)
+                    self.send_header("ETag", artifact.etag)
+                    self.send_header("Cache-Control", "no-cache")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-type", artifact.content_type)
+                self.send_header("Content-Length", str(len(artifact.body)))
+                self.send_header("ETag", artifact.etag)
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(artifact.body)
+
+            def send_events(revision: int) -> None:
+                # server-sent events: ask the page to reload on each change
+                self.send_response(200)
+                self.send_header("Content-type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    self.wfile.write(b"retry: 1000\n\n")
+                    while not stopped.is_set():
+                        if watcher.revision != revision:
+                            revision = watcher.revision
+                            self.wfile.write(
+                                f"event: reload\ndata: {revision}\n\n".encode()
+                            )
+                        else:  # keep-alive, also detects closed connections
+                            self.wfile.write(b": \n\n")
+                        self.wfile.flush()
+                        watcher.wait(revision, timeout=15)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def send_asset(asset: Asset) -> None:
+                encoding = "identity"
+                for name in accepted_encodings(self.headers.get("Accept-Encoding")):
+                    if name in asset.bodies:
+                        encoding = name
+                        break
+                body = asset.bodies[encoding]
+
+                # strong ETags must differ from one encoding to another
+                etag = f'"{asset.digest}"'
+                if encoding != "identity":
+                    etag = f'"{asset.digest}-{encoding}"'
+
+                if_none_match = self.headers.get("If-None-Match")
+                if_modified_since = self.headers.get("If-Modified-Since")
+                not_modified = etag_matches(if_none_match, etag)
+                if not if_none_match and if_modified_since:
+                    try:
+                        since = parsedate_to_datetime(if_modified_since)
+                        not_modified = asset.mtime <= since.timestamp()
+                    except (TypeError, ValueError):
+                        pass
+
+                self.send_response(304 if not_modified else 200)
+                if not not_modified:
+                    self.send_header("Content-type", asset.content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    if encoding != "identity":
+                        self.send_header("Content-Encoding", encoding)
+                if len(asset.bodies) > 1:
+                    self.send_header("Vary", "Accept-Encoding")
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", formatdate(asset.mtime, usegmt=True))
+                # cached by the browser, but revalidated on each request
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                if not not_modified:
+                    self.wfile.write(body)
+
+            url = urlsplit(self.path)
+            if url.path in ENDPOINTS:
+                try:
+                    artifact = artifacts.get(watcher.layout, url.path)
+                except Exception as exc:
+                    self.send_error(500, explain=str(exc))
+                    return
+                send_artifact(artifact)
+            elif url.path == "/events":
+                query = parse_qs(url.query).get("revision", [""])[0]
+                send_events(int(query) if query.isdigit() else watcher.revision)
+            elif url.path == "/":
+                # the page may be reloaded before the watcher notices a change
+                watcher.check()
+                with watcher.lock:
+                    layout, revision = watcher.layout, watcher.revision
+                send(main_page(layout, revision, angle_mod), content="text/html")
             else:
-                SimpleHTTPRequestHandler.do_GET(self)
+                path = Path(self.translate_path(self.path))
+                asset = assets.get(path) if path.is_file() else None
+                if asset and assets.is_outdated(path, asset):
+                    # the client falls back to the JSON corpus
+                    self.send_error(404, explain="outdated binary corpus")
+                elif asset:
+                    send_asset(asset)
+                else:  # directory listings, 404 errors
+                    SimpleHTTPRequestHandler.do_GET(self)
 
-    webserver = HTTPServer((host_name, webserver_port), LayoutHandler)
-    thread = threading.Thread(None, webserver.serve_forever)
+    webserver = ThreadingHTTPServer((host_name, webserver_port), LayoutHandler)
+    watch_thread = threading.Thread(None, watcher.watch, args=(stopped,))
 
     try:
-        thread.start()
+        watch_thread.start()
         url = f"http://{host_name}:{webserver_port}"
         print(f"Server started: {url}")
         print("Hit Ctrl-C to stop.")
         webbrowser.open(url)
-
-        # livereload
-        lr_server = Server()
-        lr_server.watch(str(file_path))
-        lr_server.serve(host=host_name, port=lr_server_port)
+        webserver.serve_forever()
 
     except KeyboardInterrupt:
         pass
 
-    webserver.shutdown()
+    stopped.set()
     webserver.server_close()
-    thread.join()
+    watch_thread.join()
+    artifacts.close()
     click.echo("Server stopped.")
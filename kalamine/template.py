@@ -1,17 +1,25 @@
 import datetime
 import pkgutil
 import re
-from typing import TYPE_CHECKING, List
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TextIO,
+    Union,
+)
 
-from .utils import lines_to_text, load_data
+from .utils import lines_to_text
 
 if TYPE_CHECKING:
     from .layout import KeyboardLayout
 
 
-SCAN_CODES = load_data("scan_codes")
-
-
 def substitute_lines(text: str, variable: str, lines: List[str]) -> str:
     prefix = "KALAMINE::"
     exp = re.compile(".*" + prefix + variable + ".*")
@@ -31,21 +39,144 @@ def substitute_token(text: str, token: str, value: str) -> str:
     return exp.sub(value, text)
 
 
-def load_tpl(layout: "KeyboardLayout", ext: str, tpl: str = "base") -> str:
-    date = datetime.date.today().isoformat()
+###
+# Compiled templates
+#
+
+LINES_PLACEHOLDER = re.compile(r"^(.*?)KALAMINE::(\w+).*$")
+TOKEN_PLACEHOLDER = re.compile(r"\$\{(\w+)(?:=[^\}]*)?\}")
+
+
+class Lines(NamedTuple):
+    """`KALAMINE::name` placeholder: the whole line is replaced by a block."""
+
+    name: str
+    indent: str
+    raw: str
+
+
+class Token(NamedTuple):
+    """`${name}` or `${name=default}` placeholder, replaced inline."""
+
+    name: str
+    raw: str
+
+
+Segment = Union[str, Lines, Token]
+
+
+class Template:
+    """Template text, split once into literals and placeholders."""
+
+    def __init__(self, text: str) -> None:
+        self.segments: List[Segment] = []
+        literal: List[str] = []
+
+        def flush() -> None:
+            if literal:
+                self.segments.append("".join(literal))
+                literal.clear()
+
+        for i, line in enumerate(text.split("\n")):
+            if i:
+                literal.append("\n")
+            m = LINES_PLACEHOLDER.match(line)
+            if m:
+                flush()
+                self.segments.append(Lines(m.group(2), m.group(1), line))
+                continue
+            pos = 0
+            for tok in TOKEN_PLACEHOLDER.finditer(line):
+                literal.append(line[pos : tok.start()])
+                flush()
+                self.segments.append(Token(tok.group(1), tok.group()))
+                pos = tok.end()
+            literal.append(line[pos:])
+        flush()
+
+        self.line_names = {seg.name for seg in self.segments if isinstance(seg, Lines)}
+
+    def chunks(
+        self, lines: Dict[str, List[str]], tokens: Dict[str, str]
+    ) -> Iterator[str]:
+        """Yield the rendered text, piece by piece."""
+        for seg in self.segments:
+            if isinstance(seg, str):
+                yield seg
+            elif isinstance(seg, Token):
+                yield tokens.get(seg.name, seg.raw)
+            elif seg.name not in lines:
+                yield seg.raw
+            else:
+                for i, line in enumerate(lines[seg.name]):
+                    yield ("\n" if i else "") + (seg.indent + line if line else "")
+
+    def render(
+        self,
+        lines: Optional[Dict[str, List[str]]] = None,
+        tokens: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """Render the template in a single pass."""
+        return "".join(self.chunks(lines or {}, tokens or {}))
+
+
+@lru_cache(maxsize=None)
+def get_template(name: str, ext: str) -> Template:
+    """Load and compile a template file; compiled templates are cached."""
+    bin = pkgutil.get_data(__package__, f"templates/{name}{ext}")
+    return Template(bin.decode("utf-8") if bin else "")
+
+
+def template_name(layout: "KeyboardLayout", ext: str, tpl: str = "base") -> str:
+    """Select the template variant matching the layout features."""
     if tpl == "base":
         if layout.has_altgr or ext.startswith(".RC"):
             tpl = "full"
             if layout.has_1dk and ext.startswith(".xkb"):
                 tpl = "full_1dk"
-    bin = pkgutil.get_data(__package__, f"templates/{tpl}{ext}")
-    if bin is None:
-        return ""
-    out = bin.decode("utf-8")
-    out = substitute_lines(out, "GEOMETRY_base", layout.base)
-    out = substitute_lines(out, "GEOMETRY_full", layout.full)
-    out = substitute_lines(out, "GEOMETRY_altgr", layout.altgr)
-    out = substitute_token(out, "KALAMINE", f"Generated by kalamine on {date}")
-    for key, value in layout.meta.items():
-        out = substitute_token(out, key, value)
-    return out
+    return tpl
+
+
+def tpl_chunks(
+    layout: "KeyboardLayout",
+    ext: str,
+    lines: Optional[Dict[str, List[str]]] = None,
+    tokens: Optional[Dict[str, str]] = None,
+    tpl: str = "base",
+) -> Iterator[str]:
+    """Render a template with the layout geometry, metadata and given values."""
+    template = get_template(template_name(layout, ext, tpl), ext)
+
+    # geometry views are only computed when the template uses them
+    all_lines = dict(lines or {})
+    for view in ["base", "full", "altgr"]:
+        if f"GEOMETRY_{view}" in template.line_names:
+            all_lines[f"GEOMETRY_{view}"] = getattr(layout, view)
+
+    # layout metadata prevails over generator tokens
+    date = datetime.date.today().isoformat()
+    all_tokens = dict(tokens or {})
+    all_tokens.update({key: str(value) for key, value in layout.meta.items()})
+    all_tokens["KALAMINE"] = f"Generated by kalamine on {date}"
+
+    return template.chunks(all_lines, all_tokens)
+
+
+def render_tpl(
+    layout: "KeyboardLayout",
+    ext: str,
+    lines: Optional[Dict[str, List[str]]] = None,
+    tokens: Optional[Dict[str, str]] = None,
+    tpl: str = "base",
+) -> str:
+    return "".join(tpl_chunks(layout, ext, lines, tokens, tpl))
+
+
+def write_chunks(fp: TextIO, chunks: Iterable[str]) -> None:
+    """Stream rendered chunks to a text file."""
+    for chunk in chunks:
+        fp.write(chunk)
+
+
+def load_tpl(layout: "KeyboardLayout", ext: str, tpl: str = "base") -> str:
+    return render_tpl(layout, ext, tpl=tpl)
@@ -1,9 +1,9 @@
 import pkgutil
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import IntEnum
 from typing import Dict, List, Optional
 
-import yaml
+from .data_cache import CACHE_FILE, DataCache
 
 
 def hex_ord(char: str) -> str:
@@ -17,12 +17,7 @@ def lines_to_text(lines: List[str], indent: str = "") -> str:
     Example: lines_to_text(["one", "two", "three"], "  ") returns
     '  one\n  two\n  three'
     """
-    out = ""
-    for line in lines:
-        if len(line):
-            out += indent + line
-        out += "\n"
-    return out[:-1]
+    return "\n".join(indent + line if len(line) else "" for line in lines)
 
 
 def text_to_lines(text: str) -> List[str]:
@@ -30,11 +25,23 @@ def text_to_lines(text: str) -> List[str]:
     return text.split("\n")
 
 
+def _read_data(filename: str) -> Optional[bytes]:
+    return pkgutil.get_data(__package__, f"data/{filename}")
+
+
+def _read_cache() -> Optional[bytes]:
+    try:
+        return _read_data(CACHE_FILE)
+    except OSError:  # no compiled cache, e.g. in a source checkout
+        return None
+
+
+_DATA_CACHE = DataCache(lambda name: _read_data(f"{name}.yaml"), _read_cache())
+
+
 def load_data(filename: str) -> Dict:
-    descriptor = pkgutil.get_data(__package__, f"data/{filename}.yaml")
-    if not descriptor:
-        return {}
-    return yaml.safe_load(descriptor.decode("utf-8"))
+    """Load a `kalamine/data` file, from the compiled cache when possible."""
+    return _DATA_CACHE.load(filename)
 
 
 class Layer(IntEnum):
@@ -98,12 +105,20 @@ class DeadKeyDescr:
     alt_space: str
     alt_self: str
 
+    # compiled from `base` and `alt`: {base char: alt char}, and its
+    # `str.translate` equivalent (for duplicate base chars, the last one wins)
+    table: Dict[str, str] = field(init=False, repr=False, compare=False)
+    translation: Dict[int, str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.table = dict(zip(self.base, self.alt))
+        self.translation = str.maketrans(self.table)
+
 
 DEAD_KEYS = [DeadKeyDescr(**data) for data in load_data("dead_keys")]
 
-DK_INDEX = {}
-for dk in DEAD_KEYS:
-    DK_INDEX[dk.char] = dk
+DK_INDEX = {dk.char: dk for dk in DEAD_KEYS}
+DEAD_KEY_IDS = frozenset(DK_INDEX)
 
 SCAN_CODES = load_data("scan_codes")
 
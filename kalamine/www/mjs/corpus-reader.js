@@ -0,0 +1,63 @@
+// Corpus reader: JSON corpora, or binary `*.kcorpus` corpora.
+// See `kalamine/corpus_builder.py` for the binary format: a small header,
+// an alphabet of code points, n-grams as uint32 indices in this alphabet,
+// and float32 frequencies. Typed arrays are views on the fetched buffer, so
+// there’s no JSON text to parse; the n-gram tables are still rebuilt from
+// these arrays, in the same structure as the JSON corpora.
+//
+// Binary corpora are build artifacts: the server doesn’t serve them when
+// their JSON source has been modified since (see `StaticAssets.is_outdated`).
+
+const MAGIC = 'KCRP';
+const FORMAT = 2;
+const HEADER_SIZE = 44; // the source digest is only checked by the server
+const TABLES = ['symbols', 'bigrams', 'trigrams'];
+
+export function parseBinaryCorpus(buffer) {
+  const header = new DataView(buffer, 0, HEADER_SIZE);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC || header.getUint32(4, true) !== FORMAT) {
+    throw new Error('unsupported corpus format');
+  }
+  const [sourceSize, alphabetSize, ...counts] = [8, 12, 16, 20, 24]
+    .map(offset => header.getUint32(offset, true));
+
+  // all sections are 4-byte aligned, and little-endian like most platforms
+  let offset = HEADER_SIZE;
+  const section = (TypedArray, length) => {
+    const array = new TypedArray(buffer, offset, length);
+    offset += array.byteLength;
+    return array;
+  };
+  const source = new TextDecoder()
+    .decode(section(Uint8Array, sourceSize))
+    .replace(/\0+$/, '');
+  const alphabet = Array.from(section(Uint32Array, alphabetSize),
+    codePoint => String.fromCodePoint(codePoint));
+  const indices = counts.map((count, i) => section(Uint32Array, count * (i + 1)));
+  const frequencies = counts.map(count => section(Float32Array, count));
+
+  // same structure as the JSON corpora: { ngram: frequency }
+  const corpus = { corpus: source };
+  TABLES.forEach((name, i) => {
+    const n = i + 1;
+    const table = {};
+    for (let j = 0; j < counts[i]; j++) {
+      let ngram = '';
+      for (let k = 0; k < n; k++) ngram += alphabet[indices[i][j * n + k]];
+      table[ngram] = frequencies[i][j];
+    }
+    corpus[name] = table;
+  });
+  return corpus;
+}
+
+// fetch a corpus by name: binary version first, JSON as a fallback
+export function fetchCorpus(baseURL) {
+  const fetchJSON = () => fetch(`${baseURL}.json`).then(response => response.json());
+  return fetch(`${baseURL}.kcorpus`)
+    .then(response => {
+      if (!response.ok) return fetchJSON();
+      return response.arrayBuffer().then(parseBinaryCorpus).catch(fetchJSON);
+    });
+}
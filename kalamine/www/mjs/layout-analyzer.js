@@ -136,6 +136,14 @@ export function getSupportedChars(keymap, deadkeys) {
     return charTable;
 }
 
+// char table precomputed by kalamine (`chars` in the JSON layout descriptor):
+// { char: [[keyCode, level], ...] }, same result as `getSupportedChars`
+export function parseCharTable(chars) {
+  return Object.fromEntries(Object.entries(chars).map(([char, sequence]) =>
+    [char, sequence.map(([keyCode, level]) => ({ keyCode, level }))]
+  ));
+}
+
 
 // XXX thsis should be part of x-keyboard
 function getKeyPositionQuality(keyCode) {
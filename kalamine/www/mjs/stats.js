@@ -1,8 +1,16 @@
-import { analyzeKeyboardLayout } from './layout-analyzer.js';
+import { analyzeKeyboardLayout, parseCharTable } from './layout-analyzer.js';
+import { fetchCorpus } from './corpus-reader.js';
 
 window.addEventListener('DOMContentLoaded', () => {
   const keyboard = document.querySelector('x-keyboard');
   let corpus = {};
+  const corpora = {}; // corpus name -> promise of the parsed corpus
+
+  // key sequences of the layout chars, if the server has precomputed them
+  const keyChars = fetch(keyboard.getAttribute('src'))
+    .then(response => response.json())
+    .then(layout => layout.chars ? parseCharTable(layout.chars) : undefined)
+    .catch(() => undefined);
 
   // display a percentage value
   const fmtPercent = (num, p) => `${Math.round(10 ** p * num) / 10 ** p}%`;
@@ -50,8 +58,8 @@ window.addEventListener('DOMContentLoaded', () => {
     trigrams.updateTableData('#bad-redirect',     ngrams.badRedirect, 2);
   };
 
-  const showReport = () => {
-    const report = analyzeKeyboardLayout(keyboard, corpus);
+  const showReport = (chars) => {
+    const report = analyzeKeyboardLayout(keyboard, corpus, chars);
 
     document.querySelector('#sfu stats-canvas').renderData({
       values: report.totalSfuSkuPerFinger,
@@ -91,11 +99,12 @@ window.addEventListener('DOMContentLoaded', () => {
       if (noCorpus) {
         return;
       }
-      fetch(`corpus/${corpusName}.json`)
-        .then(response => response.json())
-        .then(data => {
-          corpus = data;
-          showReport();
-        });
+      if (!corpora[corpusName]) {
+        corpora[corpusName] = fetchCorpus(`corpus/${corpusName}`);
+      }
+      Promise.all([corpora[corpusName], keyChars]).then(([data, chars]) => {
+        corpus = data;
+        showReport(chars);
+      });
     });
 });
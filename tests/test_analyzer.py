@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import pkgutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from kalamine import KeyboardLayout
+from kalamine.generators.web import raw_json
+
+from .util import get_layout_dict
+
+analyzer = pytest.importorskip("kalamine.analyzer", exc_type=ImportError)
+
+LAYOUTS = Path(__file__).parent.parent / "layouts"
+
+
+def test_supported_chars():
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    data = raw_json(layout)
+    chars = analyzer.supported_chars(data["keymap"], data["deadkeys"])
+    assert chars["a"] == (("KeyA", 0),)
+    assert chars["A"] == (("KeyA", 1),)
+    # `é` is typed with the 1dk rather than with a dead key
+    assert len(chars["é"]) == 2
+    assert chars["é"][0] == chars["**"][0]
+
+
+def test_analyze():
+    layout = KeyboardLayout(get_layout_dict("ansi"))
+    corpus = analyzer.Corpus.from_dict(
+        "test",
+        {
+            "symbols": {"a": 40, "s": 40, "’": 10, "é": 10},
+            "bigrams": {"as": 60, "ff": 30, "aé": 10},
+            "trigrams": {"asd": 50, "sas": 50},
+        },
+    )
+    analysis = analyzer.analyze(layout, corpus)
+
+    # unsupported characters, substitutes
+    assert analysis.unsupported_chars == {"é": 10}
+    assert analysis.total_unsupported_chars == 10
+    assert analysis.imprecise_data
+    left_pinky, left_ring = analysis.load_groups[0][:2]
+    assert left_pinky == {"good": 40, "meh": 0, "bad": 0}
+    assert left_ring == {"good": 40, "meh": 0, "bad": 0}
+    assert analysis.load_groups[1][3]["bad"] == 10  # `’` -> `'`
+
+    # n-grams with unsupported characters count in the total
+    assert analysis.ngrams["inwardRoll"] == {"as": 60}
+    assert analysis.ngrams["skb"] == {"ff": 30}
+    assert analysis.ngrams["other"] == {"asd": 50}
+    assert analysis.ngrams["sks"] == {"sas": 50}
+    assert analysis.totals()["sfb"] == 0
+    assert analysis.total_sfu_sku_per_finger[0][3] == {"good": 0, "meh": 30, "bad": 0}
+
+
+def test_shipped_corpora():
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    names = analyzer.corpus_names()
+    assert "en" in names
+    with pytest.raises(ValueError):
+        analyzer.load_corpus("klingon")
+
+    analyses = analyzer.analyze_all(layout, map(analyzer.load_corpus, names))
+    for analysis in analyses:
+        totals = analysis.totals()
+        bigrams = sum(totals[name] for name in analyzer.NGRAM_CATEGORIES[:8])
+        assert 90 < bigrams <= 100
+        assert not analysis.imprecise_data
+
+
+def test_analyze_command(tmp_path: Path):
+    report = tmp_path / "report.json"
+    layouts = [str(LAYOUTS / f"{name}.toml") for name in ["ansi", "intl"]]
+    subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "analyze", *layouts]
+        + ["--corpus", "en", "--corpus", "fr", "--jobs", "2", "--out", str(report)],
+        check=True,
+        capture_output=True,
+    )
+    results = json.loads(report.read_text(encoding="utf-8"))
+    assert [(result["name"], result["corpus"]) for result in results] == [
+        ("qwerty-ansi", "en"),
+        ("qwerty-ansi", "fr"),
+        ("qwerty-intl", "en"),
+        ("qwerty-intl", "fr"),
+    ]
+    for result in results:
+        assert set(result) >= {"summary", "load", "sfu_sku", "bottlenecks"}
+        assert len(result["bottlenecks"]["sfb"]) == 10
+
+    # CSV: one row per layout and corpus
+    result = subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "analyze", *layouts, "-c", "en"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = list(csv.DictReader(io.StringIO(result.stdout)))
+    assert [row["name"] for row in rows] == ["qwerty-ansi", "qwerty-intl"]
+    assert float(rows[0]["sfb"]) == results[0]["summary"]["sfb"]
+
+    # layout warnings are reported on stderr, not in the report
+    result = subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "analyze", layouts[0], "-c", "en"]
+        + ["--angle-mod"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    assert result.stdout.startswith("layout,name,corpus,")
+    assert "angle-mod" in result.stderr
+
+
+def test_binary_corpus(tmp_path: Path):
+    json_file = tmp_path / "fr.json"
+    json_file.write_bytes(pkgutil.get_data("kalamine", "www/corpus/fr.json"))
+    subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "corpus", "convert", str(json_file)],
+        check=True,
+        capture_output=True,
+    )
+    corpus = analyzer.load_corpus(json_file)
+    binary = analyzer.load_corpus(tmp_path / "fr.kcorpus")
+    assert binary.alphabet == corpus.alphabet
+    assert binary.source == corpus.source
+    for name in ["symbols", "bigrams", "trigrams"]:
+        table = corpus.table(getattr(corpus, name))
+        assert binary.table(getattr(binary, name)) == pytest.approx(table, rel=1e-6)
+
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    expected = analyzer.analyze(layout, corpus).totals()
+    assert analyzer.analyze(layout, binary).totals() == pytest.approx(expected)
+
+    with pytest.raises(ValueError):
+        analyzer.Corpus.from_buffer("fr", b"JSON" + bytes(40))
+
+
+def test_outdated_binary_corpus(tmp_path: Path, monkeypatch):
+    json_file = tmp_path / "fr.json"
+    json_file.write_text('{"symbols": {"a": 100}}', "utf-8")
+    subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "corpus", "convert", str(json_file)],
+        check=True,
+        capture_output=True,
+    )
+
+    # shipped corpora are read from their JSON file if the binary is outdated
+    monkeypatch.setattr(analyzer.corpus, "CORPUS_DIR", tmp_path)
+    corpus = analyzer.load_corpus("fr")
+    assert corpus.table(corpus.symbols) != {"a": 100}
+    assert corpus.to_dict() == json.loads(
+        pkgutil.get_data("kalamine", "www/corpus/fr.json")
+    )
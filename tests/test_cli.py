@@ -0,0 +1,137 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+LAYOUTS = Path(__file__).parent.parent / "layouts"
+
+# modules that only the `watch` command needs
+WEB_SERVER_STACK = ["livereload", "tornado", "http.server", "webbrowser"]
+
+RUN_CLI = """
+import json, sys
+from kalamine.cli import cli
+cli(sys.argv[1:], standalone_mode=False)
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def imported_modules(*args: str) -> set:
+    """Run the kalamine CLI in a fresh process and list the imported modules."""
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_CLI, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def test_lazy_imports(tmp_path: Path):
+    output = tmp_path / "x.xkb_symbols"
+    modules = imported_modules(
+        "build", "--out", str(output), str(LAYOUTS / "ansi.toml")
+    )
+    assert output.exists()
+    assert "kalamine.generators.xkb" in modules
+    assert "kalamine.generators.klc" not in modules
+    for name in WEB_SERVER_STACK:
+        assert name not in modules, f"`{name}` should not be imported"
+
+    assert "numpy" not in modules  # only needed by `kalamine analyze`
+
+    modules = imported_modules("version")
+    assert not [name for name in modules if name.startswith("kalamine.generators")]
+
+
+def test_parallel_build(tmp_path: Path):
+    descriptors = []
+    for name in ["ansi", "intl", "prog"]:
+        descriptors.append(tmp_path / f"{name}.toml")
+        descriptors[-1].write_text((LAYOUTS / f"{name}.toml").read_text("utf-8"))
+    broken = tmp_path / "broken.toml"
+    broken.write_text('name = "broken"\nbase = 3\n')
+    descriptors.insert(1, broken)
+
+    result = subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "build", "--jobs", "2"]
+        + [str(path) for path in descriptors],
+        capture_output=True,
+        text=True,
+        cwd=tmp_path,
+    )
+    assert result.returncode == 1
+    assert str(broken) in result.stderr
+
+    # one bad descriptor does not prevent the others from being built,
+    # and the build report follows the input order
+    built = [line[4:] for line in result.stdout.splitlines() if line.startswith("... ")]
+    assert built[0] == str(Path("dist") / "q-ansi.ahk")
+    assert built[-1] == str(Path("dist") / "q-prog.svg")
+    assert len(built) == 3 * 7
+    for path in built:
+        assert (tmp_path / path).exists()
+
+    # generator warnings are reported with the messages of their layout
+    result = subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "build", "--jobs", "2", "--force"]
+        + ["--qwerty-shortcuts"]
+        + [str(path) for path in descriptors if path != broken],
+        capture_output=True,
+        text=True,
+        cwd=tmp_path,
+        check=True,
+    )
+    lines = result.stdout.splitlines()
+    for name in ["ansi", "intl", "prog"]:
+        start = lines.index(f"... {Path('dist') / f'q-{name}.ahk'}")
+        end = lines.index(f"... {Path('dist') / f'q-{name}.svg'}")
+        warnings = [line for line in lines[start:end] if "WARN" in line]
+        assert len(warnings) == 3
+        assert all(line.startswith("WARN: ") for line in warnings)
+
+
+def test_incremental_build(tmp_path: Path):
+    descriptor = tmp_path / "ansi.toml"
+    descriptor.write_text((LAYOUTS / "ansi.toml").read_text("utf-8"))
+
+    def build(*args: str) -> str:
+        cmd = [sys.executable, "-m", "kalamine.cli", "build", str(descriptor)]
+        return subprocess.run(
+            cmd + list(args), capture_output=True, text=True, cwd=tmp_path, check=True
+        ).stdout
+
+    output = tmp_path / "dist" / "q-ansi.keylayout"
+    assert f"... {Path('dist') / 'q-ansi.keylayout'}" in build()
+    mtime = output.stat().st_mtime_ns
+
+    # no-op rebuild: the outputs are left untouched
+    assert "up to date" in build()
+    assert output.stat().st_mtime_ns == mtime
+
+    # any input change triggers a rebuild
+    assert "up to date" not in build("--angle-mod")
+    assert "up to date" in build("--angle-mod")
+    descriptor.write_text(descriptor.read_text("utf-8") + "\n# edited\n")
+    assert "up to date" not in build("--angle-mod")
+    output.unlink()
+    assert "up to date" not in build("--angle-mod")
+    assert output.exists()
+    assert "up to date" not in build("--angle-mod", "--force")
+
+
+def test_char_table(tmp_path: Path):
+    output = tmp_path / "intl.json"
+    modules = imported_modules(
+        "build", "--char-table", "--out", str(output), str(LAYOUTS / "intl.toml")
+    )
+    assert "numpy" not in modules
+    layout = json.loads(output.read_text(encoding="utf-8"))
+    chars = layout["chars"]
+    assert chars["a"] == [["KeyA", 0]]
+    assert chars["A"] == [["KeyA", 1]]
+    # `é` is typed with the 1dk rather than with a dead key
+    assert chars["é"] == [chars["**"][0], ["KeyE", 0]]
+
+    imported_modules("build", "--out", str(output), str(LAYOUTS / "intl.toml"))
+    assert "chars" not in json.loads(output.read_text(encoding="utf-8"))
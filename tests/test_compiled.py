@@ -0,0 +1,44 @@
+from kalamine import KeyboardLayout
+from kalamine.utils import ODK_ID, Layer
+
+from .util import get_layout_dict
+
+
+def test_compiled_keys():
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    compiled = layout.compiled
+
+    q = compiled.keys["ad01"]
+    assert q.alpha
+    assert q.symbols(Layer.BASE, Layer.SHIFT, Layer.ALTGR) == ["q", "Q"]
+    assert q.levels[Layer.BASE].code == "0071"
+    assert not compiled.keys["ae01"].alpha
+
+    # dead keys are resolved to their terminator
+    odk = compiled.level("ac11", Layer.BASE)
+    assert odk.dead_key and odk.symbol == ODK_ID
+    assert odk.char == compiled.dead_keys[ODK_ID].terminator
+    assert odk.code == f"{ord(odk.char):04x}"
+    assert compiled.level("ab11", Layer.BASE) is None  # no such key on ISO
+
+    # dead key combinations, indexed by base char
+    for id, output in compiled.combos["e"]:
+        assert layout.dead_keys[id]["e"] == output
+    assert [id for id, _ in compiled.combos[" "]] == list(layout.dead_keys)
+
+
+def test_compiled_cache():
+    layout = KeyboardLayout(get_layout_dict("ansi"))
+    compiled = layout.compiled
+    assert layout.compiled is compiled  # built once...
+
+    layout.layers[Layer.BASE]["ad01"] = "a"  # ...until the layers change
+    assert layout.compiled is not compiled
+    assert layout.compiled.level("ad01", Layer.BASE).symbol == "a"
+
+    # dead key tables are plain dicts: they are compared
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    compiled = layout.compiled
+    layout.dead_keys[ODK_ID]["a"] = "æ"
+    assert layout.compiled is not compiled
+    assert (ODK_ID, "æ") in layout.compiled.combos["a"]
@@ -0,0 +1,120 @@
+import gzip
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from kalamine import corpus_builder
+from kalamine.corpus_builder import (
+    BINARY_HEADER,
+    BINARY_MAGIC,
+    build_corpus,
+    count_shard,
+    count_text,
+    is_up_to_date,
+    read_chunks,
+    shards,
+    source_digest,
+    write_binary_corpus,
+)
+
+TEXT = "Le cœur a ses raisons\nque la raison ne connaît point.\n\nÉté, été…\n" * 100
+
+
+def test_count_text():
+    counts = count_text(["Abc ab", "c\tA"])
+    assert counts.tables["symbols"] == {"a": 3, "b": 2, "c": 2}
+    assert counts.tables["bigrams"] == {"ab": 2, "bc": 2}
+    assert counts.tables["trigrams"] == {"abc": 2}
+    assert counts.totals == {"symbols": 7, "bigrams": 4, "trigrams": 2}
+
+    counts = count_text(["Abc ab", "c\tA"], lowercase=False)
+    assert counts.tables["bigrams"] == {"Ab": 1, "bc": 2, "ab": 1}
+
+
+def test_count_text_chunks(monkeypatch):
+    # chunks are split at the last whitespace, whatever it is
+    monkeypatch.setattr(corpus_builder, "CHUNK_SIZE", 4)
+    text = "abc\tabc\tabc\u3000abc\tabc"
+    chunks = [text[i : i + 3] for i in range(0, len(text), 3)]
+    assert count_text(chunks).tables == count_text([text]).tables
+    assert count_text(chunks).tables["trigrams"] == {"abc": 5}
+
+
+def test_shards(tmp_path: Path):
+    text_file = tmp_path / "text.txt"
+    text_file.write_text(TEXT, encoding="utf-8")
+
+    # each line belongs to exactly one shard, whatever the shard size
+    for shard_size in [1, 7, 100, 1000]:
+        text = ""
+        for shard in shards([text_file], shard_size):
+            text += "".join(read_chunks(shard, chunk_size=5))
+        assert text == TEXT
+
+    # a BOM is only skipped at the beginning of the file
+    bom_file = tmp_path / "bom.txt"
+    bom_file.write_text("\ufeff" + TEXT.replace("\n", "\n\ufeff"), encoding="utf-8")
+    expected_text = bom_file.read_text(encoding="utf-8-sig")
+    for shard_size in [7, 100, 1 << 20]:
+        text = ""
+        for shard in shards([bom_file], shard_size):
+            text += "".join(read_chunks(shard, chunk_size=5))
+        assert text == expected_text
+
+    # plain text shards and gzipped files give the same counts
+    gz_file = tmp_path / "text.txt.gz"
+    with gzip.open(gz_file, "wt", encoding="utf-8") as file:
+        file.write(TEXT)
+    expected = count_shard(next(shards([gz_file])))
+    assert expected.tables == count_text([TEXT]).tables
+    corpus = build_corpus([text_file], shard_size=100)
+    assert corpus == build_corpus([gz_file]) | {"corpus": "text.txt"}
+    assert corpus["symbols"]["e"] == round(
+        expected.tables["symbols"]["e"] * 100 / expected.totals["symbols"], 3
+    )
+
+
+def test_corpus_command(tmp_path: Path):
+    text_file = tmp_path / "text.txt"
+    text_file.write_text(TEXT, encoding="utf-8")
+    corpus_file = tmp_path / "corpus.json"
+    subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "corpus", "build", str(text_file)]
+        + ["--jobs", "2", "-o", str(corpus_file)],
+        check=True,
+    )
+    corpus = json.loads(corpus_file.read_text(encoding="utf-8"))
+    assert list(corpus) == ["corpus", "symbols", "bigrams", "trigrams"]
+    assert list(corpus["symbols"])[0] == "n"
+    assert corpus["trigrams"]["cœu"] > 0
+    assert 99.9 < sum(corpus["symbols"].values()) < 100.1
+
+
+def test_binary_corpus():
+    corpus = {
+        "corpus": "abc",
+        "symbols": {"a": 50, "b": 30, "c": 20},
+        "bigrams": {"ab": 60, "bc": 40},
+        "trigrams": {"abc": 100},
+    }
+    source = json.dumps(corpus).encode("utf-8")
+    file = io.BytesIO()
+    write_binary_corpus(corpus, file, source_digest(source))
+    data = file.getvalue()
+    header = BINARY_HEADER.unpack_from(data)
+    assert header == (BINARY_MAGIC, 2, 4, 3, 3, 2, 1, source_digest(source))
+    # header, name, alphabet, indices and frequencies
+    assert len(data) == BINARY_HEADER.size + 4 + 4 * (3 + 3 + 4 + 3 + 3 + 2 + 1)
+
+    # binary corpora are outdated when their JSON source changes
+    assert is_up_to_date(data, source)
+    assert not is_up_to_date(data, source + b"\n")
+    assert not is_up_to_date(data[:8], source)
+
+    corpus["bigrams"]["abc"] = 1
+    with pytest.raises(ValueError):
+        write_binary_corpus(corpus, io.BytesIO())
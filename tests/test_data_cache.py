@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from kalamine.data_cache import DataCache, compile_data
+from kalamine.utils import load_data
+
+DATA_DIR = Path(__file__).parent.parent / "kalamine" / "data"
+
+
+def read_source(name: str) -> bytes:
+    return (DATA_DIR / f"{name}.yaml").read_bytes()
+
+
+def test_compiled_data():
+    cache = DataCache(read_source, compile_data(DATA_DIR))
+    uncached = DataCache(read_source)
+    for path in DATA_DIR.glob("*.yaml"):
+        assert cache.load(path.stem) == uncached.load(path.stem)
+
+
+def test_outdated_cache():
+    cache = DataCache(lambda name: b"foo: bar", compile_data(DATA_DIR))
+    assert cache.load("scan_codes") == {"foo": "bar"}
+    assert DataCache(read_source, b"not a pickle").load("qwerty_vk")["02"] == "1"
+
+
+def test_fresh_copies():
+    layout = load_data("layout")
+    del layout["altgr"]
+    assert "altgr" in load_data("layout")
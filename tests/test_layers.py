@@ -0,0 +1,47 @@
+import pytest
+
+from kalamine import KeyboardLayout
+from kalamine.layers import KEY_NAMES, LayerTable
+from kalamine.utils import Layer
+
+from .util import get_layout_dict
+
+
+def test_layer_views():
+    layers = LayerTable()
+    base = layers[Layer.BASE]
+    assert len(base) == 0
+    assert "ad01" not in base
+
+    base["ad01"] = "q"
+    layers[Layer.SHIFT]["ad01"] = "Q"
+    assert base["ad01"] == "q"
+    assert dict(base) == {"ad01": "q"}
+    assert layers.char_index == {"q": [(Layer.BASE, "ad01")], "Q": [(1, "ad01")]}
+
+    # overwriting or deleting a key keeps the reverse index in sync
+    revision = layers.revision
+    base["ad01"] = "a"
+    del layers[Layer.SHIFT]["ad01"]
+    assert layers.revision == revision + 2
+    assert layers.char_index == {"a": [(Layer.BASE, "ad01")]}
+    assert base.get("ad01") == "a"
+    assert layers[Layer.SHIFT].get("ad01") is None
+
+    with pytest.raises(KeyError):
+        base["unknown"] = "x"
+    with pytest.raises(KeyError):
+        base["ad02"]
+
+
+def test_layer_table():
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    other = KeyboardLayout(get_layout_dict("intl"))
+    assert len(layout.layers) == len(Layer)
+    assert list(layout.layers) == list(Layer)
+    assert all(len(row) == len(KEY_NAMES) for row in layout.layers.rows)
+    assert layout.layers == other.layers
+    assert hash(layout.layers.rows) == hash(other.layers.rows)
+
+    other.layers[Layer.BASE]["ad01"] = "a"
+    assert layout.layers != other.layers
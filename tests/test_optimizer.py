@@ -0,0 +1,100 @@
+import subprocess
+import sys
+import tomllib
+from pathlib import Path
+
+import pytest
+
+from kalamine import KeyboardLayout
+
+from .util import get_layout_dict
+
+analyzer = pytest.importorskip("kalamine.analyzer", exc_type=ImportError)
+
+from kalamine.analyzer import optimizer  # noqa: E402
+
+LAYOUTS = Path(__file__).parent.parent / "layouts"
+
+
+def test_parse_zone():
+    assert optimizer.parse_zone("ad01-ad03,ac01", "ISO") == [
+        "ad01",
+        "ad02",
+        "ad03",
+        "ac01",
+    ]
+    assert optimizer.parse_zone("lsgt-ab02", "ISO") == ["lsgt", "ab01", "ab02"]
+    with pytest.raises(ValueError):
+        optimizer.parse_zone("lsgt-ab02", "ANSI")
+    with pytest.raises(ValueError):
+        optimizer.parse_zone("ad01-ac10", "ISO")
+
+
+def test_score():
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    corpus = analyzer.load_corpus("en")
+    opt = optimizer.Optimizer(layout, corpus)
+
+    # the score is a weighted sum of the analysis totals, plus the key effort
+    totals = analyzer.analyze(layout, corpus).totals()
+    model = opt.score_model
+    effort = float(model.load @ model.key_costs)
+    weights = optimizer.WEIGHTS
+    expected = sum(weights[category] * total for category, total in totals.items())
+    assert opt.score() == pytest.approx(expected + effort)
+
+    # incremental score updates, on random swaps
+    positions = optimizer.np.arange(len(model.load))
+    score = model.score(positions)
+    zone = opt.zones[0]
+    for i in range(100):
+        a, b = zone[i % len(zone)], zone[(i * 7 + 3) % len(zone)]
+        if a == b:
+            continue
+        score += model.swap_delta(positions, a, b)
+        positions[a], positions[b] = positions[b], positions[a]
+    assert score == pytest.approx(model.score(positions))
+
+
+def test_optimize():
+    layout = KeyboardLayout(get_layout_dict("ansi"))
+    opt = optimizer.Optimizer(layout, analyzer.load_corpus("en"), ["ad01-ad10"])
+    results = opt.optimize(steps=500, chains=2, seed=1)
+    assert len(results) == 2
+    assert results[0].score <= results[1].score < opt.score()
+
+    # keys are only swapped within the zone, with all their layers
+    optimized = results[0].layout
+    top_row = [optimized.layers[0][f"ad{i:02d}"] for i in range(1, 11)]
+    assert sorted(top_row) == sorted("qwertyuiop")
+    assert optimized.layers[0]["ac01"] == "a"
+    for key in [f"ad{i:02d}" for i in range(1, 11)]:
+        assert optimized.layers[1][key] == optimized.layers[0][key].upper()
+
+    # reproducible results
+    again = opt.optimize(steps=500, chains=2, seed=1)
+    assert again[0].layout.layers == optimized.layers
+
+
+def test_optimize_command(tmp_path: Path):
+    output = tmp_path / "layout.toml"
+    result = subprocess.run(
+        [sys.executable, "-m", "kalamine.cli", "optimize", str(LAYOUTS / "intl.toml")]
+        + ["-c", "fr", "--steps", "200", "--chains", "2", "--keep", "2"]
+        + ["--jobs", "2", "--seed", "1", "-o", str(output)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    scores = [float(line.split()[0]) for line in result.stdout.splitlines()]
+    assert len(scores) == 3
+    assert scores[1] <= scores[2] and scores[1] < scores[0]
+
+    for i in [1, 2]:
+        path = tmp_path / f"layout-{i}.toml"
+        with path.open("rb") as file:
+            layout = KeyboardLayout(tomllib.load(file))
+        assert layout.has_1dk
+        assert set(layout.char_index) == set(
+            KeyboardLayout(get_layout_dict("intl")).char_index
+        )
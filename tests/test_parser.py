@@ -1,4 +1,12 @@
+import tomllib
+from pathlib import Path
+
+import pytest
+
 from kalamine import KeyboardLayout
+from kalamine import layout as descriptors
+from kalamine.help import layout_descriptor
+from kalamine.utils import DEAD_KEY_IDS, DK_INDEX, ODK_ID
 
 from .util import get_layout_dict
 
@@ -83,3 +91,149 @@ def test_intl():  # 1dk + dead keys
     assert layout.layers[1]["lsgt"] == "Z"
     assert layout.layers[0]["ab01"] == "x"
     assert layout.layers[1]["ab01"] == "X"
+
+
+def test_char_index():
+    layout = load_layout("intl")
+    assert layout.find_char("q") == [(0, "ad01")]
+    assert layout.find_char("Q") == [(1, "ad01")]
+    assert layout.find_char("*`") == [(0, "tlde")]
+    assert layout.find_char("é") == [(2, "ad03")]  # 1dk layer
+    assert layout.find_char(" ") == [(0, "spce"), (1, "spce")]
+    assert layout.has_char(" ")
+    assert layout.has_char("q", [0, 1])
+    assert not layout.has_char("q", [2, 3])
+    assert not layout.has_char("☃")
+    assert layout.find_char("☃") == []
+
+    # every indexed position points back to its character
+    for char, positions in layout.char_index.items():
+        for layer, key in positions:
+            assert layout.layers[layer][key] == char
+
+
+def test_geometry_views():
+    layout = load_layout("intl")
+    base = layout.base
+    assert layout.base == base
+    assert layout.base is not base  # callers get their own copy
+
+    # views are refreshed when a layer changes...
+    layout.layers[0]["ad01"] = "a"
+    changed = [line for line in layout.base if line not in base]
+    assert len(changed) == 1  # the `ad01` row
+
+    # ... or when the geometry changes
+    full = layout.full
+    layout.geometry = "ERGO"
+    assert layout.full != full
+
+
+def test_freeze():
+    layout = load_layout("intl")
+    snapshot = layout.freeze()
+    assert snapshot == load_layout("intl").freeze()
+    assert hash(snapshot) == hash(load_layout("intl").freeze())
+    assert snapshot != load_layout("intl", angle_mod=True).freeze()
+    assert snapshot != load_layout("prog").freeze()
+    assert len({snapshot, layout.freeze(), load_layout("prog").freeze()}) == 2
+
+    # snapshots are not affected by later changes of the layout
+    layout.layers[0]["ad01"] = "a"
+    assert layout.freeze() != snapshot
+    assert snapshot.digest == load_layout("intl").freeze().digest
+
+
+def test_layout_descriptor():
+    for filename in ["ansi", "intl", "prog"]:
+        layout = load_layout(filename)
+        descriptor = tomllib.loads(layout_descriptor(layout))
+        assert KeyboardLayout(descriptor).layers == layout.layers
+        assert descriptor["name"] == layout.meta["name"]
+
+    # custom space bar
+    data = get_layout_dict("intl")
+    data["spacebar"] = {"1dk": "_", "shift_1dk": " "}
+    layout = KeyboardLayout(data)
+    descriptor = tomllib.loads(layout_descriptor(layout))
+    assert descriptor["spacebar"] == data["spacebar"]
+    assert KeyboardLayout(descriptor).dead_keys == layout.dead_keys
+
+
+def test_extends(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "base").mkdir()
+    (tmp_path / "base" / "root.toml").write_text(
+        'name = "root"\nlocale = "fr"\nversion = "1"\nvariant = "root"\n'
+    )
+    (tmp_path / "base" / "parent.yaml").write_text(
+        "extends: root.toml\nname: parent\nvariant: parent\n"
+    )
+    for i in range(3):
+        (tmp_path / f"child{i}.toml").write_text(
+            f'extends = "base/parent.yaml"\ndescription = "child {i}"\n'
+        )
+
+    parsed = []
+    loads = descriptors.tomllib.loads
+    monkeypatch.setattr(
+        descriptors.tomllib, "loads", lambda text: parsed.append(text) or loads(text)
+    )
+    descriptors.DESCRIPTORS.clear()
+
+    # multi-level inheritance, relative to each descriptor
+    chain = descriptors.descriptor_chain(tmp_path / "child0.toml")
+    assert [path.name for path in chain] == ["child0.toml", "parent.yaml", "root.toml"]
+    for i in range(3):
+        cfg = descriptors.parse_layout(tmp_path / f"child{i}.toml")
+        assert cfg["name"] == f"child{i}"
+        assert cfg["description"] == f"child {i}"
+        assert cfg["variant"] == "parent"
+        assert cfg["locale"] == "fr"
+        assert cfg["version"] == "1.0.0"
+
+    # each descriptor is parsed once...
+    assert len(parsed) == 4  # 3 children + root
+    cfg["locale"] = "us"  # ...and returned as a copy
+    assert descriptors.parse_layout(tmp_path / "child0.toml")["locale"] == "fr"
+
+    # ...until it changes
+    (tmp_path / "base" / "root.toml").write_text('locale = "de"\n')
+    assert descriptors.parse_layout(tmp_path / "child0.toml")["locale"] == "de"
+    assert len(parsed) == 5
+
+    # errors are raised, not reported
+    (tmp_path / "base" / "root.toml").write_text('extends = "../child0.toml"\n')
+    with pytest.raises(descriptors.DescriptorError, match="circular"):
+        descriptors.parse_layout(tmp_path / "child0.toml")
+    (tmp_path / "base" / "root.toml").write_text("locale = \n")
+    with pytest.raises(descriptors.DescriptorError, match="root.toml"):
+        descriptors.parse_layout(tmp_path / "child0.toml")
+    with pytest.raises(descriptors.DescriptorError):
+        descriptors.parse_layout(tmp_path / "missing.toml")
+
+
+def test_malformed_descriptor(tmp_path: Path):
+    descriptor = tmp_path / "layout.toml"
+    for content in ["version = 1\n", 'version = "1.2.3.4"\n', "name = 1\n"]:
+        descriptor.write_text(content)
+        with pytest.raises(descriptors.DescriptorError):
+            descriptors.parse_layout(descriptor)
+    descriptor.write_text("extends = 1\n")
+    with pytest.raises(descriptors.DescriptorError, match="extends"):
+        descriptors.parse_layout(descriptor)
+
+
+def test_dead_key_tables():
+    assert DEAD_KEY_IDS == set(DK_INDEX)
+    circumflex = DK_INDEX["*^"]
+    assert circumflex.table["a"] == "â"
+    assert "aeoz".translate(circumflex.translation) == "âêôẑ"
+
+    # a layout dead key maps the available base chars through its table
+    layout = load_layout("prog")
+    for id, deadkey in layout.dead_keys.items():
+        if id == ODK_ID:
+            continue
+        for base, alt in deadkey.items():
+            if base in DK_INDEX[id].table:
+                assert DK_INDEX[id].table[base] == alt
@@ -1,7 +1,8 @@
 from textwrap import dedent
 
 from kalamine import KeyboardLayout
-from kalamine.generators.klc import klc_deadkeys, klc_dk_index, klc_keymap
+from kalamine.generators.klc import c_keymap, klc_deadkeys, klc_dk_index, klc_keymap
+from kalamine.generators.windows import windows_keymap
 
 from .util import get_layout_dict
 
@@ -520,3 +521,27 @@ def test_prog_deadkeys():
         //}}}
         """
     )
+
+
+def test_windows_keymap():
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    keymap = windows_keymap(layout)
+    assert windows_keymap(layout) is keymap  # shared by all Windows outputs
+    assert list(layout.compiled.windows_keymaps.values()) == [keymap]
+
+    # KLC and C keymaps: same keys, same virtual keys
+    klc_vks = [line.split("\t")[1] for line in klc_keymap(layout)]
+    c_vks = [line.split("\t")[1].strip("{'") for line in c_keymap(layout)]
+    c_vks = [vk.removeprefix("VK_") for vk in c_vks if vk != "0xff"]
+    assert klc_vks == c_vks == [key.virtual_key for key in keymap.keys.values()]
+
+    # qwerty shortcuts: new keymap
+    layout.qwerty_shortcuts = True
+    assert windows_keymap(layout) is not keymap
+    assert windows_keymap(layout).keys["ad01"].virtual_key == "Q"
+
+    # modified dead keys: new keymap
+    keymap = windows_keymap(layout)
+    del layout.dead_keys["*~"]
+    assert windows_keymap(layout) is not keymap
+    assert "*~" not in windows_keymap(layout).dead_keys
@@ -0,0 +1,155 @@
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from kalamine import KeyboardLayout
+from kalamine.corpus_builder import convert_corpus
+from kalamine.server import (
+    ENDPOINTS,
+    ArtifactCache,
+    LayoutWatcher,
+    StaticAssets,
+    accepted_encodings,
+    etag_matches,
+)
+
+from .util import get_layout_dict
+
+
+def test_artifact_cache():
+    layout = KeyboardLayout(get_layout_dict("prog"))
+    artifacts = ArtifactCache()
+
+    json = artifacts.get(layout, "/json")
+    assert json.content_type == "application/json; charset=utf-8"
+    assert json.body.startswith(b"{")
+    assert artifacts.get(layout, "/json") is json  # not rendered again
+
+    # same layout content: same revision, artifacts are kept
+    same_layout = KeyboardLayout(get_layout_dict("prog"))
+    assert artifacts.get(same_layout, "/json") is json
+
+    # new revision: artifacts are rendered again
+    layout.layers[0]["ad01"] = "a"
+    assert artifacts.get(layout, "/json").etag != json.etag
+
+
+def test_concurrent_requests():
+    layout = KeyboardLayout(get_layout_dict("intl"))
+    artifacts = ArtifactCache(workers=2)
+    with ThreadPoolExecutor(8) as pool:
+        svgs = list(pool.map(lambda _: artifacts.get(layout, "/svg"), range(16)))
+    assert all(svg is svgs[0] for svg in svgs)  # rendered once
+    artifacts.close()
+
+
+def test_concurrent_rendering():
+    def new_jobs():
+        # fresh layouts: their compiled models and keymaps are not cached yet
+        layouts = []
+        for filename in ["ansi", "intl", "prog"]:
+            for angle_mod in [False, True]:
+                data = get_layout_dict(filename)
+                data["locale"] = "en-US"  # required by the KLC generator
+                layouts.append(KeyboardLayout(data, angle_mod))
+        return [(layout, path) for layout in layouts for path in ENDPOINTS]
+
+    def render(job):
+        layout, path = job
+        return ENDPOINTS[path].render(layout)
+
+    serial = [render(job) for job in new_jobs()]
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(3):
+            assert list(pool.map(render, new_jobs())) == serial
+
+
+def test_etag_matches():
+    etag = '"0123456789abcdef"'
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_layout_watcher(tmp_path):
+    layouts = Path(__file__).parent.parent / "layouts"
+    parent = tmp_path / "parent.toml"
+    child = tmp_path / "child.toml"
+    parent.write_text((layouts / "prog.toml").read_text(encoding="utf-8"), "utf-8")
+    child.write_text('extends = "parent.toml"\nname = "child"\n', "utf-8")
+
+    watcher = LayoutWatcher(child)
+    layout = watcher.layout
+    assert layout.meta["name"] == "child"
+    assert not watcher.check()
+
+    # touching a file without changing its content does not reload the layout
+    os.utime(child, ns=(0, 0))
+    assert not watcher.check()
+    assert watcher.layout is layout
+
+    # changes in the ancessor are detected, and parsed only once
+    parent.write_text(parent.read_text("utf-8").replace("0.6.0", "0.7.0"), "utf-8")
+    assert watcher.check()
+    assert not watcher.check()
+    assert watcher.revision == 1
+    assert watcher.wait(0) == 1
+    assert watcher.wait(1, timeout=0.01) == 1
+    assert watcher.layout.meta["version"] == "0.7.0"
+
+    # a broken descriptor keeps the previous layout
+    layout = watcher.layout
+    child.write_text('extends = "parent.toml"\nname = \n', "utf-8")
+    assert not watcher.check()
+    assert watcher.layout is layout
+    child.write_text('extends = "parent.toml"\nname = "renamed"\n', "utf-8")
+    assert watcher.check()
+    assert watcher.layout.meta["name"] == "renamed"
+
+
+def test_accepted_encodings():
+    assert accepted_encodings(None) == []
+    assert accepted_encodings("gzip, deflate, br") == ["gzip", "deflate", "br"]
+    assert accepted_encodings("gzip;q=0.5, br, identity;q=0") == ["br", "gzip"]
+
+
+def test_static_assets(tmp_path):
+    (tmp_path / "corpus").mkdir()
+    corpus = tmp_path / "corpus" / "en.json"
+    corpus.write_text('{"symbols": {}}' * 100, "utf-8")
+    style = tmp_path / "style.css"
+    style.write_text("body {}", "utf-8")
+
+    assets = StaticAssets(tmp_path)
+    asset = assets.get(corpus)
+    assert asset is not None
+    assert asset.content_type == "application/json"
+    assert gzip.decompress(asset.bodies["gzip"]) == asset.bodies["identity"]
+    assert assets.get(corpus) is asset  # cached
+    assert not assets.is_outdated(corpus, asset)
+
+    # small files are not compressed, modified files are read again
+    asset = assets.get(style)
+    assert asset is not None
+    assert asset.content_type == "text/css; charset=utf-8"
+    assert list(asset.bodies) == ["identity"]
+    style.write_text("body { margin: 0; }", "utf-8")
+    assert assets.get(style).bodies["identity"] == b"body { margin: 0; }"
+
+    assert assets.get(tmp_path / "missing.js") is None
+
+
+def test_outdated_binary_corpus(tmp_path):
+    source = tmp_path / "en.json"
+    source.write_text('{"symbols": {"a": 100}}', "utf-8")
+    binary = convert_corpus(source)
+
+    assets = StaticAssets(tmp_path)
+    assert not assets.is_outdated(binary, assets.get(binary))
+    source.write_text('{"symbols": {"b": 100}}', "utf-8")
+    assert assets.is_outdated(binary, assets.get(binary))
+    source.unlink()  # no source to check
+    assert not assets.is_outdated(binary, assets.get(binary))
@@ -0,0 +1,64 @@
+from io import StringIO
+
+from kalamine import KeyboardLayout
+from kalamine.generators import ahk, keylayout, klc, web, xkb
+from kalamine.template import Template, substitute_lines, substitute_token
+
+from .util import get_layout_dict
+
+TEMPLATE = """\
+// ${KALAMINE}
+// ${encoding=utf-8, with BOM} / ${unknown=default}
+  // KALAMINE::GEOMETRY
+{
+    KALAMINE::LAYOUT
+    KALAMINE::MISSING
+}"""
+
+LINES = {"GEOMETRY": ["a", "", "b"], "LAYOUT": ["x\\\\y", "z"]}
+TOKENS = {"KALAMINE": "kalamine", "encoding": "utf-16le"}
+
+
+def test_template():
+    assert Template(TEMPLATE).render(LINES, TOKENS).split("\n") == [
+        "// kalamine",
+        "// utf-16le / ${unknown=default}",
+        "  // a",
+        "",
+        "  // b",
+        "{",
+        "    x\\\\y",
+        "    z",
+        "    KALAMINE::MISSING",
+        "}",
+    ]
+    assert Template(TEMPLATE).render() == TEMPLATE
+
+
+def test_legacy_substitutions():
+    # apart from the backslash escapes processed by `re.sub`,
+    # the legacy regexp-based functions must render the same text
+    text = TEMPLATE
+    for name, value in TOKENS.items():
+        text = substitute_token(text, name, value)
+    text = substitute_lines(text, "GEOMETRY", LINES["GEOMETRY"])
+    text = substitute_lines(text, "LAYOUT", ["x\\\\\\\\y", "z"])
+    assert text == Template(TEMPLATE).render(LINES, TOKENS)
+
+
+def test_streaming():
+    generators = [
+        (ahk.ahk, ahk.write_ahk),
+        (keylayout.keylayout, keylayout.write_keylayout),
+        (klc.klc_rc, klc.write_klc_rc),
+        (klc.klc_c, klc.write_klc_c),
+        (xkb.xkb_keymap, xkb.write_xkb_keymap),
+        (xkb.xkb_symbols, xkb.write_xkb_symbols),
+        (web.pretty_json, web.write_pretty_json),
+    ]
+    for filename in ["ansi", "intl", "prog"]:
+        layout = KeyboardLayout(get_layout_dict(filename))
+        for render, write in generators:
+            stream = StringIO()
+            write(layout, stream)
+            assert stream.getvalue() == render(layout)